@@ -0,0 +1,171 @@
+import asyncio
+import os
+import socket
+import time
+
+from tcp_broadcast import (BroadcasterBase, TcpClient, set_keepalive, DEFAULT_QUEUE_SIZE, DEFAULT_MAX_CLIENTS,
+                           DEFAULT_STALL_TIMEOUT, DROP_OLDEST, LISTEN_BACKLOG, MAX_SEND_SIZE, SWEEP_INTERVAL,
+                           STATS_INTERVAL)
+
+class AsyncTcpClient(TcpClient, asyncio.Protocol):
+    """A client of AsyncNmeaBroadcaster, the protocol of its connection"""
+    def __init__(self, broadcaster):
+        self.transport = None
+        super().__init__(None, None, broadcaster.subscription)
+        self.broadcaster = broadcaster
+        self.paused = False
+        self.refused = False
+
+    @property
+    def pending(self):
+        """Bytes written to the transport it couldn't send yet, what a partial send is for TcpClient"""
+        return self.transport.get_write_buffer_size() if self.transport else 0
+
+    @pending.setter
+    def pending(self, value):
+        # TcpClient starts out with nothing pending, the transport keeps track from there
+        pass
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.sock = transport.get_extra_info("socket")
+        self.addr = transport.get_extra_info("peername") or transport.get_extra_info("sockname")
+        transport.set_write_buffer_limits(high=MAX_SEND_SIZE)
+        self.broadcaster._connected(self)
+
+    def data_received(self, data):
+        self.broadcaster._commands(self, data)
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self.last_progress = time.monotonic()
+        self.broadcaster._flush(self)
+
+    def connection_lost(self, exc):
+        if not self.refused:
+            self.broadcaster._close(self, f"connection lost: {exc}" if exc else "disconnected")
+
+class AsyncNmeaBroadcaster(BroadcasterBase):
+    """NmeaBroadcaster for an asyncio event loop.
+
+    Same clients, subscriptions and slow client policy, but the sockets are
+    asyncio transports and everything runs on the loop, so it must be used
+    from the loop's thread. broadcast() only queues, the queues are written
+    out once per loop iteration, so all the sentences of one NMEA read go to
+    a client in one write. A client whose transport is over its write buffer
+    limit keeps queueing until the transport drains.
+    """
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, policy=DROP_OLDEST, logger=None,
+                 max_clients=DEFAULT_MAX_CLIENTS, stall_timeout=DEFAULT_STALL_TIMEOUT, subscription=None):
+        super().__init__(queue_size, policy, logger, max_clients, stall_timeout, subscription)
+        self._servers = []
+        self._flush_scheduled = False
+        self._task = None
+        self.loop = None
+
+    def start(self):
+        if self._task is None:
+            self.loop = asyncio.get_running_loop()
+            self._task = self.loop.create_task(self._run())
+        return self
+
+    async def listen(self, port, host="0.0.0.0"):
+        """Accept TCP clients on host:port, returns the port"""
+        server = await self.loop.create_server(lambda: AsyncTcpClient(self), host, port, backlog=LISTEN_BACKLOG,
+                                               reuse_address=True)
+        self._servers.append(server)
+        port = server.sockets[0].getsockname()[1]
+        if self.logger:
+            self.logger.info(f"TCP server listening on port {port}")
+        return port
+
+    async def listen_unix(self, path):
+        """Accept local clients on a unix socket at path, replacing a stale socket file"""
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await self.loop.create_unix_server(lambda: AsyncTcpClient(self), path, backlog=LISTEN_BACKLOG)
+        self._servers.append(server)
+        if self.logger:
+            self.logger.info(f"NMEA server listening on {path}")
+        return path
+
+    def close(self):
+        for server in self._servers:
+            server.close()
+        for client in self._clients:
+            self._close(client, "server closed")
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _connected(self, client):
+        if len(self._clients) >= self.max_clients:
+            self.refused += 1
+            client.refused = True
+            client.transport.abort()
+            if self.logger:
+                self.logger.warning(f"TCP client {client.addr} refused, already serving {len(self._clients)} clients")
+            return
+        self.accepted += 1
+        if client.sock is not None and client.sock.family != socket.AF_UNIX:
+            try:
+                set_keepalive(client.sock)
+            except OSError:
+                pass
+        if self.logger:
+            self.logger.info(f"TCP client connected from {client.addr}")
+        client.subscription = self.subscription
+        self._set_clients(self._clients + (client,))
+
+    def _wake(self):
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_soon(self._flush_all)
+
+    def _flush_all(self):
+        self._flush_scheduled = False
+        self._apply_default()
+        for client in self._clients:
+            self._flush(client)
+
+    def _flush(self, client):
+        if client.overflowed:
+            self._close(client, "too slow, queue overflowed")
+            return
+        queue = client.queue
+        if client.paused or not queue or client.closed:
+            return
+        data = b"".join(data for _, data in queue)
+        client.messages_sent += len(queue)
+        queue.clear()
+        client.transport.write(data)
+        client.bytes_sent += len(data)
+        self.bytes_sent += len(data)
+        client.last_progress = time.monotonic()
+
+    async def _run(self):
+        last_stats = time.monotonic()
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            now = time.monotonic()
+            try:
+                self._sweep(now)
+            except Exception as e:
+                if self.logger:
+                    self.logger.exception(f"TCP server error: {e}")
+            if self.logger and self._clients and now - last_stats >= STATS_INTERVAL:
+                last_stats = now
+                self.logger.info(f"TCP client stats: {self.stats()}")
+
+    def _close(self, client, reason):
+        if client.closed:
+            return
+        client.closed = True
+        self._set_clients(tuple(c for c in self._clients if c is not client))
+        self.disconnected += 1
+        client.transport.abort()
+        if self.logger:
+            self.logger.info(f"TCP client {client.addr} {reason}: {client.stats()}")
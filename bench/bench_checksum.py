@@ -0,0 +1,121 @@
+"""Throughput of NMEA checksum validation, batched ChecksumValidator against a per-character loop.
+
+Validates synthetic sentences in batches the size of one read from the NMEA
+socket (--batch, a single sentence, one epoch and a backlog by default) with
+a small fraction of corrupted sentences (--corrupt), checks both
+implementations agree on what passes, and reports sentences per second on
+one core for each. The headroom is that rate over --current-rate, the
+sentence rate the pipeline actually sees (a 10 Hz receiver with GGA, RMC,
+GSA, GST and a few GSV is about 100-200 per second); the run fails if the
+batched validator has less than 10x.
+
+    python3 bench/bench_checksum.py [--batch 1,8,64] [--corrupt 0.001] [--current-rate 200] [--seconds 2] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nmea_checksum import ChecksumValidator, DROP
+
+BODIES = (
+    "GNGGA,{t},4807.038,N,01131.000,E,4,12,0.9,545.4,M,46.9,M,1.0,0000",
+    "GNRMC,{t},A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W,D",
+    "GNGSA,A,3,04,05,,09,12,,,24,,,,,2.5,1.3,2.1",
+    "GNGST,{t},1.2,0.8,0.6,45.0,0.7,0.7,1.4",
+    "GPGSV,3,1,11,03,03,111,00,04,15,270,00,06,01,010,00,13,06,292,00",
+    "GPGSV,3,2,11,14,25,170,00,16,57,208,39,18,67,296,40,19,40,246,00",
+    "GPGSV,3,3,11,22,42,067,42,24,14,311,43,27,05,244,00",
+    "GNVTG,084.4,T,077.8,M,022.4,N,041.5,K,D",
+)
+REQUIRED_HEADROOM = 10
+
+def xor(body):
+    value = 0
+    for c in body.encode():
+        value ^= c
+    return value
+
+def build_batches(batch, count, corrupt, seed=1):
+    rng = random.Random(seed)
+    batches = []
+    i = 0
+    for _ in range(count):
+        lines = []
+        for _ in range(batch):
+            body = BODIES[i % len(BODIES)].format(t=f"{120000 + i // len(BODIES) % 10000:06d}.00")
+            line = f"${body}*{xor(body):02X}"
+            if rng.random() < corrupt:
+                # a serial glitch: one flipped character or a sentence cut short
+                if rng.random() < 0.5:
+                    j = rng.randrange(1, len(line) - 3)
+                    line = line[:j] + chr(ord(line[j]) ^ 0x04) + line[j + 1:]
+                else:
+                    line = line[:rng.randrange(6, len(line) - 3)]
+            lines.append(line)
+            i += 1
+        batches.append(lines)
+    return batches
+
+def loop_check(lines):
+    """A straightforward validator, one Python iteration per character"""
+    out = []
+    for line in lines:
+        if not line.startswith("$"):
+            line = f"${line}"
+        star = line.rfind("*")
+        if star < 0 or len(line) - star != 3:
+            continue
+        try:
+            if xor(line[1:star]) == int(line[star + 1:], 16):
+                out.append(line)
+        except ValueError:
+            pass
+    return out
+
+def run(check, batches, seconds):
+    count = 0
+    start = time.perf_counter()
+    cpu = time.process_time()
+    while time.perf_counter() - start < seconds:
+        for lines in batches:
+            check(lines)
+            count += len(lines)
+    return count / (time.process_time() - cpu)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", default=f"1,{len(BODIES)},64", help="sentences per read, comma separated")
+    parser.add_argument("--corrupt", type=float, default=0.001, help="fraction of corrupted sentences")
+    parser.add_argument("--current-rate", type=float, default=200, help="sentences per second the pipeline sees")
+    parser.add_argument("--seconds", type=float, default=2)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = []
+    for batch in (max(1, int(size)) for size in args.batch.split(",")):
+        batches = build_batches(batch, max(10, 16000 // batch), args.corrupt)
+        validator = ChecksumValidator(DROP)
+        for lines in batches:
+            assert validator.check(lines) == loop_check(lines), "batched and loop validation disagree"
+        for name, check in (("loop", loop_check), ("batched", ChecksumValidator(DROP).check)):
+            rate = run(check, batches, args.seconds)
+            results.append({"impl": name, "batch": batch, "sentences_per_s": rate,
+                            "us_per_sentence": 1e6 / rate, "headroom": rate / args.current_rate})
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(f"{r['impl']:<8} batch {r['batch']:<4} {r['sentences_per_s']:>10.0f} sentences/s "
+                  f"{r['us_per_sentence']:6.2f} us/sentence {r['headroom']:8.0f}x the current rate")
+    short = [r for r in results if r["impl"] == "batched" and r["headroom"] < REQUIRED_HEADROOM]
+    if short:
+        sys.exit(f"batched validation has less than {REQUIRED_HEADROOM}x headroom over {args.current_rate:.0f}/s "
+                 f"at batch {', '.join(str(r['batch']) for r in short)}")
+
+if __name__ == "__main__":
+    main()
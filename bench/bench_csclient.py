@@ -0,0 +1,89 @@
+"""Benchmark: CSClient round-trip latency with and without the connection pool.
+
+Runs a local FakeConfigStore and measures per-call latency of get and put
+(a 30 second NMEA window at 10 Hz) with a fresh socket per call, with a
+pooled connection, and with pipelined get_many batches.
+
+    python3 bench/bench_csclient.py [--calls 2000] [--one-shot] [--json]
+
+--one-shot makes the stand-in close every connection after one response, to
+check that the pool notices and falls back to a socket per call.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from csclient import CSClient
+from fake_cs import FakeConfigStore
+
+WINDOW = ["$GPGGA,123519.00,4807.038,N,01131.000,E,4,12,0.9,545.4,M,46.9,M,1.0,0000*4F"] * 1800
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+def summarize(name, samples, calls_per_sample=1):
+    per_call = [s / calls_per_sample for s in samples]
+    return {
+        "mode": name,
+        "calls": len(samples) * calls_per_sample,
+        "mean_us": sum(per_call) / len(per_call) * 1e6,
+        "p50_us": percentile(per_call, 50) * 1e6,
+        "p99_us": percentile(per_call, 99) * 1e6,
+    }
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def run(cs, calls, batch):
+    paths = ["/config/system/sdk/appdata", "/status/wan/primary_device"] * (batch // 2)
+    results = []
+    for pool_size in (0, 1):
+        cs.enable_pool(pool_size)
+        label = "pooled" if pool_size else "per-call"
+        results.append(summarize(f"get {label}", timed(lambda: cs.get("/config/system/sdk/appdata"), calls)))
+        results.append(summarize(f"put {label}", timed(lambda: cs.put("/status/rtk/nmea", WINDOW), calls // 10)))
+        if pool_size:
+            results.append(summarize(f"get_many x{batch} pipelined", timed(lambda: cs.get_many(paths), calls // batch), batch))
+    results.append({"mode": "pool stats", **cs.pool_stats()})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--one-shot", action="store_true", help="close every connection after one response")
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "cs.sock")
+    with FakeConfigStore(path, keepalive=not args.one_shot) as store:
+        store.set_appdata("lpp-client.host", "127.0.0.1")
+        CSClient.SOCKET_PATH = path
+        CSClient.ON_DEVICE = True
+        cs = CSClient("bench", logger=logging.getLogger("bench"))
+        results = run(cs, args.calls, args.batch)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        if "mean_us" in r:
+            print(f"{r['mode']:<28}{r['calls']:>7} calls  mean {r['mean_us']:8.1f} us  p50 {r['p50_us']:8.1f} us  p99 {r['p99_us']:8.1f} us")
+        else:
+            print(r)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Throughput and correctness checks for NmeaFramer and MixedFramer on synthetic NMEA streams.
+
+Builds a multi-MB NMEA stream (with a few non-ASCII sentences mixed in),
+checks that the framer returns exactly the expected sentences no matter how
+the stream is chopped into chunks, then compares throughput against the old
+decode-and-split reader, both on in-memory chunks and over a socketpair.
+The same checks run for MixedFramer on a stream with UBX and RTCM3 frames
+(and some corrupted ones) between the sentences.
+
+    python3 bench/bench_framer.py [--megabytes 16] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nmea_framer import NmeaFramer
+from stream_framer import MixedFramer, crc24q, ubx_checksum
+
+SENTENCES = (
+    "$GPGGA,123519.00,4807.038,N,01131.000,E,4,12,0.9,545.4,M,46.9,M,1.0,0000*4F",
+    "$GPRMC,123519.00,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W,D*6A",
+    "$GPGSA,A,3,04,05,,09,12,,,24,,,,,2.5,1.3,2.1*39",
+    "$GPGSV,3,1,11,03,03,111,00,04,15,270,00,06,01,010,00,13,06,292,00*74",
+    "GNGST,123519.00,1.2,0.8,0.6,45.0,0.7,0.7,1.4*7A",
+)
+BAD = "$GPTXT,01,01,02,été*00"
+
+def build_stream(megabytes, bad_every=5000):
+    """Return (stream bytes, expected sentences)"""
+    expected = []
+    parts = []
+    size = 0
+    i = 0
+    while size < megabytes * 1024 * 1024:
+        if bad_every and i and i % bad_every == 0:
+            raw = BAD.encode()
+        else:
+            line = SENTENCES[i % len(SENTENCES)]
+            raw = line.encode()
+            expected.append(line)
+        parts.append(raw + b"\r\n")
+        size += len(raw) + 2
+        i += 1
+    return b"".join(parts), expected
+
+def ubx_frame(cls, msg, payload):
+    body = struct.pack("<BBH", cls, msg, len(payload)) + payload
+    return b"\xb5\x62" + body + ubx_checksum(body)
+
+def rtcm_frame(number, payload):
+    payload = struct.pack(">H", number << 4) + payload
+    frame = bytes((0xD3, len(payload) >> 8, len(payload) & 0xFF)) + payload
+    return frame + crc24q(frame).to_bytes(3, "big")
+
+def build_mixed_stream(megabytes, seed=1):
+    """Return (stream bytes, expected sentences, expected binary frames), one frame in ten is corrupted"""
+    rng = random.Random(seed)
+    sentences = []
+    binary = []
+    parts = []
+    size = 0
+    i = 0
+    while size < megabytes * 1024 * 1024:
+        kind = i % 4
+        if kind == 2:
+            frame = ubx_frame(0x01, 0x07, rng.randbytes(92))
+        elif kind == 3:
+            frame = rtcm_frame(1077, rng.randbytes(rng.randint(20, 400)))
+        else:
+            # only sentences with a $, what follows a corrupted frame is skipped up to the next $
+            line = SENTENCES[i % 4]
+            frame = line.encode() + b"\r\n"
+            sentences.append(line)
+        if kind >= 2:
+            if rng.random() < 0.1:
+                frame = bytearray(frame)
+                frame[-1] ^= 0xFF
+                frame = bytes(frame)
+            else:
+                binary.append(frame)
+        parts.append(frame)
+        size += len(frame)
+        i += 1
+    return b"".join(parts), sentences, binary
+
+def check_mixed_chunking(stream, sentences, binary, seed=1):
+    rng = random.Random(seed)
+    for label, sizes in (("1 byte", iter(lambda: 1, None)),
+                         ("random", iter(lambda: rng.randint(1, 9000), None)),
+                         ("8 KiB", iter(lambda: 8192, None))):
+        data = stream if label != "1 byte" else stream[:200_000]
+        framer = MixedFramer()
+        got = []
+        frames = []
+        for chunk in chunks(data, sizes):
+            got.extend(framer.feed(chunk))
+            frames.extend(frame for _, frame in framer.take_binary())
+        if label == "1 byte":
+            sentences_want = sentences[:len(got)]
+            binary_want = binary[:len(frames)]
+        else:
+            sentences_want, binary_want = sentences, binary
+        assert got == sentences_want, f"mixed {label} chunking: got {len(got)} sentences, expected {len(sentences_want)}"
+        assert frames == binary_want, f"mixed {label} chunking: got {len(frames)} frames, expected {len(binary_want)}"
+
+def chunks(data, sizes):
+    pos = 0
+    while pos < len(data):
+        n = next(sizes)
+        yield data[pos:pos + n]
+        pos += n
+
+def check_chunking(stream, expected, seed=1):
+    rng = random.Random(seed)
+    for label, sizes in (("1 byte", iter(lambda: 1, None)),
+                         ("random", iter(lambda: rng.randint(1, 9000), None)),
+                         ("8 KiB", iter(lambda: 8192, None))):
+        data = stream if label != "1 byte" else stream[:200_000]
+        want = expected if label != "1 byte" else None
+        framer = NmeaFramer()
+        got = []
+        for chunk in chunks(data, sizes):
+            got.extend(framer.feed(chunk))
+        if want is None:
+            want = [line for line in data.decode("ascii", "replace").split("\r\n")[:-1] if line and "�" not in line]
+        assert got == want, f"{label} chunking: got {len(got)} sentences, expected {len(want)}"
+        assert len(framer) == 0
+
+def legacy_lines(chunk_iter):
+    """The reader that un_thread_server used before NmeaFramer"""
+    out = []
+    buffer = ""
+    for chunk in chunk_iter:
+        try:
+            chunk = chunk.decode()
+        except UnicodeDecodeError:
+            chunk = None
+        if not chunk:
+            continue
+        buffer += chunk
+        while '\r\n' in buffer:
+            line, buffer = buffer.split('\r\n', 1)
+            if line:
+                out.append(line)
+    return out
+
+def framer_lines(chunk_iter, framer_class=NmeaFramer):
+    framer = framer_class()
+    out = []
+    for chunk in chunk_iter:
+        out.extend(framer.feed(chunk))
+        if framer_class is MixedFramer:
+            out.extend(framer.take_binary())
+    return out
+
+def mixed_lines(chunk_iter):
+    return framer_lines(chunk_iter, MixedFramer)
+
+def bench_memory(stream, chunk_size, impls=(("legacy", legacy_lines), ("framer", framer_lines), ("mixed", mixed_lines))):
+    results = []
+    for name, fn in impls:
+        start = time.perf_counter()
+        count = len(fn(chunks(stream, iter(lambda: chunk_size, None))))
+        elapsed = time.perf_counter() - start
+        results.append({"impl": name, "transport": f"memory {chunk_size} B chunks", "sentences": count,
+                        "seconds": elapsed, "mb_per_sec": len(stream) / elapsed / 1e6,
+                        "sentences_per_sec": count / elapsed})
+    return results
+
+def bench_socket(stream):
+    def writer(sock):
+        with sock:
+            sock.sendall(stream)
+
+    def legacy_reader(sock):
+        return legacy_lines(iter(lambda: sock.recv(8192), b""))
+
+    def framer_reader(sock):
+        framer = NmeaFramer()
+        out = []
+        while framer.recv_into(sock):
+            out.extend(framer.frames())
+        return out
+
+    results = []
+    for name, reader in (("legacy", legacy_reader), ("framer", framer_reader)):
+        a, b = socket.socketpair()
+        thread = threading.Thread(target=writer, args=(a,))
+        start = time.perf_counter()
+        thread.start()
+        with b:
+            count = len(reader(b))
+        thread.join()
+        elapsed = time.perf_counter() - start
+        results.append({"impl": name, "transport": "socketpair", "sentences": count,
+                        "seconds": elapsed, "mb_per_sec": len(stream) / elapsed / 1e6,
+                        "sentences_per_sec": count / elapsed})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=float, default=16)
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    args = parser.parse_args()
+
+    stream, expected = build_stream(args.megabytes)
+    check_chunking(stream, expected)
+    results = bench_memory(stream, 8192) + bench_memory(stream, 1 << 20) + bench_socket(stream)
+    mixed, sentences, binary = build_mixed_stream(args.megabytes)
+    check_mixed_chunking(mixed, sentences, binary)
+    for r in bench_memory(mixed, 8192, (("mixed", mixed_lines),)):
+        r["transport"] = "memory 8192 B, +UBX/RTCM"
+        results.append(r)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{len(stream) / 1e6:.1f} MB, {len(expected)} valid sentences, chunking checks passed")
+    print(f"{len(mixed) / 1e6:.1f} MB mixed, {len(sentences)} sentences and {len(binary)} valid frames, chunking checks passed")
+    for r in results:
+        print(f"{r['impl']:<8}{r['transport']:<28}{r['sentences']:>9} sentences {r['mb_per_sec']:8.1f} MB/s {r['sentences_per_sec']:12.0f} sentences/s")
+
+if __name__ == "__main__":
+    main()
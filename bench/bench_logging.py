@@ -0,0 +1,115 @@
+"""Latency of logging NMEA sentences from the reader thread, direct handlers vs the queue.
+
+Runs the real logger_config setup in a scratch directory (with stderr sent to
+/dev/null), then logs sentences from a reader thread at NMEA rate, once with
+the file, stderr and syslog handlers attached to the logger directly like
+before and once through the QueueHandler. Reports the per-call latency the
+reader thread sees and how many records the queue dropped.
+
+    python3 bench/bench_logging.py [--rate 200] [--seconds 5] [--burst 2000] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+SENTENCES = (
+    "$GPGGA,123519.00,4807.038,N,01131.000,E,4,12,0.9,545.4,M,46.9,M,1.0,0000*4F",
+    "$GPRMC,123519.00,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W,D*6A",
+    "$GPGSA,A,3,04,05,,09,12,,,24,,,,,2.5,1.3,2.1*39",
+    "$GPGSV,3,1,11,03,03,111,00,04,15,270,00,06,01,010,00,13,06,292,00*74",
+    "$GNGST,123519.00,1.2,0.8,0.6,45.0,0.7,0.7,1.4*7A",
+)
+
+def setup():
+    """Import logger_config from a scratch directory so the bench doesn't touch ./log"""
+    scratch = tempfile.mkdtemp(prefix="bench-logging-")
+    os.makedirs(os.path.join(scratch, "log"))
+    os.chdir(scratch)
+    sys.stderr = open(os.devnull, "w")
+    import logger_config
+    return logger_config
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))] if samples else 0.0
+
+def reader(logger, rate, seconds, burst):
+    """Log like the NMEA reader, rate sentences per second, plus a burst at the start"""
+    latencies = []
+    interval = 1.0 / rate
+    for i in range(burst):
+        start = time.perf_counter()
+        logger.info(SENTENCES[i % len(SENTENCES)])
+        latencies.append(time.perf_counter() - start)
+    next_time = time.perf_counter()
+    end = next_time + seconds
+    i = 0
+    while next_time < end:
+        start = time.perf_counter()
+        logger.info(SENTENCES[i % len(SENTENCES)])
+        latencies.append(time.perf_counter() - start)
+        i += 1
+        next_time += interval
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    return latencies
+
+def run(logger, rate, seconds, burst):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("latencies", reader(logger, rate, seconds, burst)))
+    thread.start()
+    thread.join()
+    latencies = result["latencies"]
+    return {
+        "records": len(latencies),
+        "p50_us": percentile(latencies, 50) * 1e6,
+        "p99_us": percentile(latencies, 99) * 1e6,
+        "max_us": max(latencies) * 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=200, help="sentences per second")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--burst", type=int, default=2000, help="sentences logged back to back at the start")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    stdout = sys.stdout
+    lc = setup()
+    logger = lc.logger
+
+    # before: every handler on the logger, written on the calling thread
+    logger.removeHandler(lc.queue_handler)
+    for handler in lc.handlers.values():
+        logger.addHandler(handler)
+    direct = run(logger, args.rate, args.seconds, args.burst)
+
+    # after: only the queue handler, the listener writes
+    for handler in lc.handlers.values():
+        logger.removeHandler(handler)
+    logger.addHandler(lc.queue_handler)
+    queued = run(logger, args.rate, args.seconds, args.burst)
+    lc.listener.stop()
+    queued["dropped"] = lc.queue_handler.dropped
+
+    results = {"direct": direct, "queued": queued, "handlers": sorted(lc.handlers)}
+    if args.json:
+        print(json.dumps(results, indent=2), file=stdout)
+        return
+    print(f"handlers: {', '.join(results['handlers'])}, {args.rate:.0f} sentences/s for {args.seconds:.0f}s after a burst of {args.burst}", file=stdout)
+    for name in ("direct", "queued"):
+        r = results[name]
+        print(f"{name:>7}: {r['records']} records, p50 {r['p50_us']:.1f}us, p99 {r['p99_us']:.1f}us, max {r['max_us']:.0f}us"
+              + (f", dropped {r['dropped']}" if "dropped" in r else ""), file=stdout)
+
+if __name__ == "__main__":
+    main()
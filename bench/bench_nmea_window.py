@@ -0,0 +1,103 @@
+"""Micro-benchmark: NmeaWindow ring buffer vs. the old per-line dict rebuild.
+
+Feeds a simulated receiver (GGA, RMC, GSA and three GSV sentences per fix)
+through both implementations at 1, 10 and 20 Hz fix rates with a simulated
+clock, and reports sentences/sec and peak RSS. Each case runs in its own
+interpreter so the RSS numbers do not bleed into each other.
+
+    python3 bench/bench_nmea_window.py [--duration 120] [--json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nmea_window import NmeaWindow
+
+FIX_SENTENCES = (
+    "$GPGGA,123519.00,4807.038,N,01131.000,E,4,12,0.9,545.4,M,46.9,M,1.0,0000*4F",
+    "$GPRMC,123519.00,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W,D*6A",
+    "$GPGSA,A,3,04,05,,09,12,,,24,,,,,2.5,1.3,2.1*39",
+    "$GPGSV,3,1,11,03,03,111,00,04,15,270,00,06,01,010,00,13,06,292,00*74",
+    "$GPGSV,3,2,11,14,25,170,00,16,57,208,39,18,67,296,40,19,40,246,00*74",
+    "$GPGSV,3,3,11,22,42,067,42,24,14,311,43,27,05,244,00,,,,*4D",
+)
+
+def sentences(hz, duration):
+    step = 1.0 / hz
+    t = 1_700_000_000.0
+    for _ in range(int(hz * duration)):
+        # distinct receive times per sentence, the dict approach keys on them
+        for i, sentence in enumerate(FIX_SENTENCES):
+            yield t + i * 1e-4, sentence
+        t += step
+
+def run_dict(hz, duration):
+    """The pre-NmeaWindow handle_nmea, minus the config store put"""
+    data = {}
+    for t, nmea in sentences(hz, duration):
+        data = {k: v for k, v in data.items() if (t - k) < 30}
+        data[t] = nmea
+        cs_data = list(data.values())
+    return len(cs_data)
+
+def run_window(hz, duration):
+    window = NmeaWindow()
+    for t, nmea in sentences(hz, duration):
+        window.push(nmea, t)
+        cs_data = window.snapshot()
+    return len(cs_data)
+
+CASES = {"dict": run_dict, "window": run_window}
+
+def run_case(name, hz, duration):
+    count = int(hz * duration) * len(FIX_SENTENCES)
+    start = time.perf_counter()
+    size = CASES[name](hz, duration)
+    elapsed = time.perf_counter() - start
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "impl": name,
+        "hz": hz,
+        "sentences": count,
+        "window_size": size,
+        "seconds": elapsed,
+        "sentences_per_sec": count / elapsed if elapsed else float("inf"),
+        "peak_rss_kb": rss_kb,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=120, help="simulated seconds of traffic per case")
+    parser.add_argument("--rates", default="1,10,20", help="comma separated fix rates in Hz")
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--hz", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.hz, args.duration)))
+        return
+
+    results = []
+    for hz in (float(r) for r in args.rates.split(",")):
+        for name in CASES:
+            out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--case", name,
+                                           "--hz", str(hz), "--duration", str(args.duration)])
+            results.append(json.loads(out))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'impl':<8}{'hz':>6}{'window':>8}{'sentences/s':>14}{'peak rss kB':>14}")
+    for r in results:
+        print(f"{r['impl']:<8}{r['hz']:>6g}{r['window_size']:>8}{r['sentences_per_sec']:>14.0f}{r['peak_rss_kb']:>14}")
+
+if __name__ == "__main__":
+    main()
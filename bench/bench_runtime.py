@@ -0,0 +1,144 @@
+"""CPU per sentence and wakeups per second of main.py's threaded and asyncio runtimes.
+
+Runs main.main() once per runtime, each in a fresh process set up like
+e2e_rig.py (fake config store, fake_lpp_client.py writing --rate epochs of
+three sentences a second), optionally with TCP clients reading the stream
+from another process. Over --seconds it measures the process' CPU time per
+NMEA sentence handled and its voluntary context switches per second, which
+is about how often its threads block and get woken up again. The fake config
+store runs in the measured process too, the same for both runtimes.
+
+    python3 bench/bench_runtime.py [--rate 100] [--seconds 10] [--tcp-clients 4] [--json]
+"""
+import argparse
+import json
+import os
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH)
+
+RUNTIMES = ("threads", "asyncio")
+WARMUP = 3.0
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def consume(port, clients, seconds):
+    """Read and discard the TCP stream on that many connections"""
+    selector = selectors.DefaultSelector()
+    deadline = time.time() + seconds
+    while len(selector.get_map() or {}) < clients and time.time() < deadline:
+        try:
+            sock = socket.create_connection(("127.0.0.1", port))
+        except OSError:
+            time.sleep(0.1)
+            continue
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+    while selector.get_map():
+        for key, _ in selector.select(1.0):
+            try:
+                data = key.fileobj.recv(65536)
+            except OSError:
+                data = b""
+            if not data:
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+
+def usage():
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return r.ru_utime + r.ru_stime, r.ru_nvcsw, r.ru_nivcsw
+
+def measure(args):
+    """Run main.main() in this process with args.runtime and print the measurements as JSON"""
+    from e2e_rig import Rig
+    args.scenario = "bench"
+    args.v3 = False
+    args.backoff_min = None
+    args.asyncio = args.runtime == "asyncio"
+    rig = Rig(args)
+    consumer = None
+    if args.tcp_clients:
+        port = free_port()
+        rig.store.set_appdata("lpp-client.output", f"un-tcp:{port}")
+        consumer = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--consume", str(port),
+                                     "--tcp-clients", str(args.tcp_clients)])
+
+    def run_main():
+        try:
+            rig.lpp.main()
+        finally:
+            rig.main_done = time.time()
+
+    threading.Thread(target=run_main, daemon=True).start()
+    time.sleep(WARMUP)
+
+    sentences = rig.lpp.nmea_sentences.values
+    count = sum(sentences.values())
+    cpu, voluntary, involuntary = usage()
+    start = time.monotonic()
+    time.sleep(args.seconds)
+    elapsed = time.monotonic() - start
+    count = sum(sentences.values()) - count
+    cpu2, voluntary2, involuntary2 = usage()
+    threads = threading.active_count()
+
+    rig.finish(30)
+    rig.close()
+    if consumer:
+        # main() returning leaves its servers' sockets open until the process exits
+        consumer.terminate()
+        consumer.wait()
+    print(json.dumps({
+        "runtime": args.runtime,
+        "sentences_per_s": count / elapsed,
+        "cpu_percent": 100 * (cpu2 - cpu) / elapsed,
+        "cpu_us_per_sentence": 1e6 * (cpu2 - cpu) / count if count else None,
+        "wakeups_per_s": (voluntary2 - voluntary) / elapsed,
+        "preemptions_per_s": (involuntary2 - involuntary) / elapsed,
+        "threads": threads,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=100, help="fake client epochs per second")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--tcp-clients", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--runtime", choices=RUNTIMES, help=argparse.SUPPRESS)
+    parser.add_argument("--consume", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.consume:
+        consume(args.consume, args.tcp_clients, WARMUP + args.seconds)
+        return
+    if args.runtime:
+        measure(args)
+        return
+
+    results = []
+    for runtime in RUNTIMES:
+        cmd = [sys.executable, os.path.abspath(__file__), "--runtime", runtime, "--rate", str(args.rate),
+               "--seconds", str(args.seconds), "--tcp-clients", str(args.tcp_clients)]
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, check=True).stdout
+        results.append(json.loads(out.decode().strip().splitlines()[-1]))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    keys = [key for key in results[0] if key != "runtime"]
+    print(f"{'':22}" + "".join(f"{r['runtime']:>12}" for r in results))
+    for key in keys:
+        print(f"{key:22}" + "".join(f"{r[key]:>12.1f}" if isinstance(r[key], float) else f"{r[key]!s:>12}"
+                                    for r in results))
+
+if __name__ == "__main__":
+    main()
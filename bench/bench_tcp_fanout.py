@@ -0,0 +1,135 @@
+"""Load test for the NMEA TCP server (NmeaBroadcaster).
+
+Opens many local TCP clients against a broadcaster listening on localhost,
+broadcasts timestamped sentences at a fixed rate, and reports delivery
+latency percentiles, delivered/expected counts and drops. Optionally a few
+of the clients never read, to show they don't hold up the others.
+
+    python3 bench/bench_tcp_fanout.py [--clients 128] [--rate 200] [--seconds 5] [--stalled 4] [--json]
+"""
+import argparse
+import json
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from tcp_broadcast import NmeaBroadcaster
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+class Readers:
+    """Reads every client socket from one selector thread and records latencies"""
+    def __init__(self, socks):
+        self.selector = selectors.DefaultSelector()
+        self.latencies = []
+        self.received = {}
+        self.buffers = {}
+        for sock in socks:
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ)
+            self.received[sock] = 0
+            self.buffers[sock] = b""
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while self.running:
+            for key, _ in self.selector.select(0.2):
+                sock = key.fileobj
+                try:
+                    data = sock.recv(65536)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    self.selector.unregister(sock)
+                    continue
+                now = time.perf_counter_ns()
+                lines = (self.buffers[sock] + data).split(b"\r\n")
+                self.buffers[sock] = lines.pop()
+                for line in lines:
+                    sent_ns = int(line.split(b",")[2].split(b"*")[0])
+                    self.latencies.append((now - sent_ns) / 1e6)
+                self.received[sock] += len(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=128)
+    parser.add_argument("--stalled", type=int, default=4, help="extra clients that connect but never read")
+    parser.add_argument("--rate", type=float, default=200, help="sentences per second")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    args = parser.parse_args()
+
+    broadcaster = NmeaBroadcaster(queue_size=args.queue_size, max_clients=args.clients + args.stalled).start()
+    port = broadcaster.listen(0, "127.0.0.1")
+
+    readers = [socket.create_connection(("127.0.0.1", port)) for _ in range(args.clients)]
+    stalled = []
+    for _ in range(args.stalled):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        stalled.append(sock)
+    deadline = time.monotonic() + 5
+    while len(broadcaster.clients) < args.clients + args.stalled and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    reader = Readers(readers)
+    reader.thread.start()
+
+    count = int(args.rate * args.seconds)
+    interval = 1.0 / args.rate
+    worst_broadcast = 0.0
+    start = time.monotonic()
+    for seq in range(count):
+        target = start + seq * interval
+        delay = target - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        sentence = f"$LPTST,{seq},{time.perf_counter_ns()}*00\r\n".encode()
+        t = time.perf_counter()
+        broadcaster.broadcast(sentence)
+        worst_broadcast = max(worst_broadcast, time.perf_counter() - t)
+
+    deadline = time.monotonic() + 5
+    while sum(reader.received.values()) < count * args.clients and time.monotonic() < deadline:
+        time.sleep(0.05)
+    reader.running = False
+    reader.thread.join()
+
+    stats = broadcaster.stats()
+    result = {
+        "clients": args.clients,
+        "stalled_clients": args.stalled,
+        "rate": args.rate,
+        "sentences": count,
+        "expected_deliveries": count * args.clients,
+        "deliveries": sum(reader.received.values()),
+        "latency_ms_p50": percentile(reader.latencies, 50),
+        "latency_ms_p90": percentile(reader.latencies, 90),
+        "latency_ms_p99": percentile(reader.latencies, 99),
+        "latency_ms_max": max(reader.latencies, default=0.0),
+        "broadcast_us_max": worst_broadcast * 1e6,
+        "dropped": sum(s["dropped"] for s in stats),
+        "connected": len(broadcaster.clients),
+    }
+    for sock in readers + stalled:
+        sock.close()
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    for k, v in result.items():
+        print(f"{k:<22}{v:.3f}" if isinstance(v, float) else f"{k:<22}{v}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""End-to-end scenarios for main.py against a fake config store and a fake LPP client.
+
+Runs the real main.main() in this process with the config store replaced by
+FakeConfigStore (appdata, primary device and modem diagnostics programmed by
+the scenario) and the LPP client binaries replaced by fake_lpp_client.py,
+which logs the command lines it was started with and the /CID lines it gets.
+A consumer on main.py's NMEA IPC socket timestamps the sentences to find gaps
+in the stream.
+
+Scenarios:
+
+    handover-storm  --count cell changes every --interval seconds, with signal-only
+                    diagnostics updates in between; time from each change to the /CID line
+    config-churn    cycles live, control and respawn appdata changes every --interval
+                    seconds; respawn latency and the longest NMEA gap
+    crash-loop      the client exits after --exit-after seconds every time; restart delays
+                    and the time until main.py gives up
+    correction-stall
+                    the client only has a GPS fix for --stall-for seconds, with the fix
+                    watchdog at --stall-age; its /CID re-sends and respawns, and the time
+                    until a respawned client with RTK corrections is reported recovered
+
+Every scenario but crash-loop ends by changing lpp-client.output, which makes
+main() return like it does for a restart.
+
+    python3 bench/e2e_rig.py handover-storm [--count 20] [--interval 0.5] [--v3] [--asyncio] [--json]
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH, ".."))
+sys.path.insert(0, BENCH)
+
+DEVICE = "mdm-1"
+PLMN = "310410"
+TAC = 1000
+FIRST_CELL = 10000
+WARMUP = 2.0
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))] if samples else None
+
+def summary(samples):
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p99": percentile(samples, 99),
+        "max": max(samples) if samples else None,
+    }
+
+class Rig:
+    def __init__(self, args):
+        self.args = args
+        self.scratch = tempfile.mkdtemp(prefix="e2e-rig-")
+        os.makedirs(os.path.join(self.scratch, "log"))
+        os.chdir(self.scratch)
+        self.events_path = os.path.join(self.scratch, "fake-lpp-events.jsonl")
+        for binary in ("example-client", "example-lpp"):
+            path = os.path.join(self.scratch, binary)
+            with open(path, "w") as f:
+                f.write(f"#!/bin/sh\nexec {sys.executable} {os.path.join(BENCH, 'fake_lpp_client.py')} \"$@\"\n")
+            os.chmod(path, 0o755)
+        os.environ.update({
+            "FAKE_LPP_EVENTS": self.events_path,
+            "FAKE_LPP_RATE": str(args.rate),
+            "LPP_VERSION": "v3.4.0" if args.v3 else "v4.0.0",
+            "LOG_LEVEL_STDERR": os.environ.get("LOG_LEVEL_STDERR", "WARNING"),
+        })
+        if args.scenario == "crash-loop":
+            os.environ["FAKE_LPP_EXIT_AFTER"] = str(args.exit_after)
+        if args.scenario == "correction-stall":
+            os.environ["FAKE_LPP_QUALITY"] = "1"
+
+        from fake_cs import FakeConfigStore
+        from csclient import CSClient, EventingCSClient
+        event_path = os.path.join(self.scratch, "csevent_{}.sock")
+        self.store = FakeConfigStore(os.path.join(self.scratch, "cs.sock"), event_socket_path=event_path).start()
+        CSClient.SOCKET_PATH = self.store.path
+        CSClient.ON_DEVICE = True
+        EventingCSClient.EVENT_SOCKET_PATH = event_path
+        self.store.set_appdata("lpp-client.log_nmea", "false")
+        if args.asyncio:
+            self.store.set_appdata("lpp-client.runtime", "asyncio")
+        if args.scenario == "correction-stall":
+            self.store.set_appdata("lpp-client.watchdog_age", str(args.stall_age))
+            self.store.set_appdata("lpp-client.watchdog_respawn_after", str(args.stall_age))
+        self.store.set_primary_device(DEVICE)
+        self.cell = FIRST_CELL
+        self.store.set_cell(DEVICE, PLMN, TAC, self.cell)
+
+        import main as lpp
+        lpp.NMEA_SOCKET_PATH = os.path.join(self.scratch, "nmea.sock")
+        lpp.NMEA_IPC_PATH = os.path.join(self.scratch, "nmea-ipc.sock")
+        lpp.DEBUG_SOCKET_PATH = os.path.join(self.scratch, "debug.sock")
+        if args.backoff_min is not None:
+            lpp.RESTART_BACKOFF_MIN = args.backoff_min
+        self.lpp = lpp
+        self.sentences = []
+        self.main_done = None
+
+    def start(self):
+        self.started = time.time()
+
+        def run_main():
+            try:
+                self.lpp.main()
+            finally:
+                self.main_done = time.time()
+
+        threading.Thread(target=run_main, daemon=True).start()
+        threading.Thread(target=self._consume, daemon=True).start()
+        time.sleep(WARMUP)
+
+    def _consume(self):
+        """Timestamp every sentence main.py serves on its IPC socket"""
+        while self.main_done is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.lpp.NMEA_IPC_PATH)
+            except OSError:
+                sock.close()
+                time.sleep(0.05)
+                continue
+            with sock:
+                while True:
+                    data = sock.recv(65536)
+                    if not data:
+                        break
+                    now = time.time()
+                    self.sentences.extend(now for line in data.split(b"\r\n") if line.startswith(b"$"))
+
+    def events(self, kind=None):
+        try:
+            with open(self.events_path) as f:
+                events = [json.loads(line) for line in f]
+        except FileNotFoundError:
+            return []
+        return [e for e in events if kind is None or e["event"] == kind]
+
+    def finish(self, timeout=30):
+        """Change the output so main() returns, and wait for it"""
+        self.store.set_appdata("lpp-client.output", "un-tcp:0")
+        return self.wait(timeout)
+
+    def wait(self, timeout):
+        deadline = time.time() + timeout
+        while self.main_done is None and time.time() < deadline:
+            time.sleep(0.05)
+        return self.main_done
+
+    def nmea_gaps(self, since):
+        times = [t for t in self.sentences if t >= since]
+        return max((b - a for a, b in zip(times, times[1:])), default=None)
+
+    def close(self):
+        self.store.stop()
+
+def handover_storm(rig, args):
+    changes = []
+    for i in range(args.count):
+        rig.cell += 1
+        changes.append((rig.cell, time.time()))
+        rig.store.set_cell(DEVICE, PLMN, TAC, rig.cell)
+        # the modem keeps updating signal levels, those must not look like handovers
+        time.sleep(args.interval / 2)
+        rig.store.set_signal(DEVICE, -90 - i % 10)
+        time.sleep(args.interval / 2)
+    time.sleep(1.0)
+    cids = {}
+    for e in rig.events("control"):
+        cell = e["line"].rstrip().split(",")[-1]
+        cids.setdefault(cell, e["t"])
+    latencies = [cids[str(cell)] - t for cell, t in changes if str(cell) in cids]
+    delivered_last = str(changes[-1][0]) in cids if changes else None
+    return {
+        "handovers": len(changes),
+        "cid_lines": len(rig.events("control")),
+        "delivered": len(latencies),
+        "coalesced": len(changes) - len(latencies),
+        "last_cell_delivered": delivered_last,
+        "latency_s": summary(latencies),
+        "respawns": len(rig.events("start")) - 1,
+    }
+
+def config_churn(rig, args):
+    steps = [
+        ("live", "lpp-client.cs_publish_hz", ("2", "1")),
+        ("control", "lpp-client.starting_mcc", ("311", "310")),
+        ("respawn", "lpp-client.flags", ("confidence-95to39", "")),
+    ]
+    changes = []
+    since = time.time()
+    for i in range(args.count):
+        kind, key, values = steps[i % len(steps)]
+        value = values[(i // len(steps)) % len(values)]
+        changes.append((kind, time.time()))
+        rig.store.set_appdata(key, value)
+        time.sleep(args.interval)
+    time.sleep(1.0)
+    starts = [e["t"] for e in rig.events("start")]
+    respawn_latencies = []
+    for kind, t in changes:
+        if kind == "respawn":
+            later = [s for s in starts if s > t]
+            if later:
+                respawn_latencies.append(later[0] - t)
+    return {
+        "changes": {kind: sum(1 for k, _ in changes if k == kind) for kind, _, _ in steps},
+        "client_starts": len(starts),
+        "respawn_latency_s": summary(respawn_latencies),
+        "max_nmea_gap_s": rig.nmea_gaps(since),
+        "cid_lines": len(rig.events("control")),
+    }
+
+def crash_loop(rig, args):
+    rig.wait(args.timeout)
+    starts = [e["t"] for e in rig.events("start")]
+    exits = [e["t"] for e in rig.events("exit")]
+    delays = [start - end for end, start in zip(exits, starts[1:])]
+    return {
+        "client_starts": len(starts),
+        "exits": len(exits),
+        "restart_delays_s": delays,
+        "gave_up_after_s": rig.main_done - rig.started if rig.main_done else None,
+    }
+
+def correction_stall(rig, args):
+    time.sleep(max(0.0, rig.started + args.stall_for - time.time()))
+    # clients started from now on have RTK corrections again
+    os.environ["FAKE_LPP_QUALITY"] = "4"
+    recovered = rig.started + args.stall_for
+    deadline = time.time() + args.timeout
+    watchdog = None
+    while time.time() < deadline:
+        watchdog = rig.store.get("/status/rtk/watchdog")
+        if watchdog and any(e["event"] == "recovered" for e in watchdog["events"]):
+            break
+        time.sleep(0.2)
+    events = watchdog["events"] if watchdog else []
+    starts = [e["t"] for e in rig.events("start")]
+    return {
+        "cid_resends": len(rig.events("control")),
+        "respawns": len(starts) - 1,
+        "watchdog_events": [(e["event"], e["correction_age"]) for e in events],
+        "first_resend_s": next((e["t"] - rig.started for e in rig.events("control")), None),
+        "respawn_after_s": [t - rig.started for t in starts[1:]],
+        "recovered_after_fix_s": next((e["time"] - recovered for e in events if e["event"] == "recovered"), None),
+        "time_in_state_s": watchdog["time_in_state"] if watchdog else None,
+    }
+
+SCENARIOS = {
+    "handover-storm": handover_storm,
+    "config-churn": config_churn,
+    "crash-loop": crash_loop,
+    "correction-stall": correction_stall,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--count", type=int, default=20, help="cell or config changes")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between changes")
+    parser.add_argument("--rate", type=float, default=10, help="fake client epochs per second")
+    parser.add_argument("--exit-after", type=float, default=0.5, help="crash-loop: seconds the client runs")
+    parser.add_argument("--stall-age", type=float, default=3, help="correction-stall: watchdog_age and watchdog_respawn_after")
+    parser.add_argument("--stall-for", type=float, default=12, help="correction-stall: seconds without corrections")
+    parser.add_argument("--backoff-min", type=float, help="override main.RESTART_BACKOFF_MIN")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--v3", action="store_true", help="run the v3 command line (example-lpp)")
+    parser.add_argument("--asyncio", action="store_true", help="run main.py's asyncio runtime")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    rig = Rig(args)
+    rig.start()
+    try:
+        results = SCENARIOS[args.scenario](rig, args)
+        if args.scenario != "crash-loop":
+            done = rig.finish(args.timeout)
+            results["main_returned"] = done is not None
+    finally:
+        rig.close()
+    results = {"scenario": args.scenario, "client": "v3" if args.v3 else "v4",
+               "runtime": "asyncio" if args.asyncio else "threads", **results}
+    print(json.dumps(results, indent=2 if args.json else None))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Local stand-in for the router's config store socket (/var/tmp/cs.sock).
+
+Speaks the same request framing as CSClient (newline separated op, path,
+query, tree and value) and answers with the same `status:` /
+`content-length:` headers, backed by an in-memory tree. Connections are kept
+open for further requests unless keepalive is off, in which case every
+connection is closed after its first response like a one-shot server would.
+
+Change registrations ("register" from EventingCSClient) are supported too:
+whenever a put or delete touches a registered path, the new value of that
+path is delivered to the registering process's event socket.
+
+set_appdata(), set_primary_device(), set_cell() and set_signal() program the
+parts of the tree main.py reads, to script configuration and cell changes.
+
+    from fake_cs import FakeConfigStore
+    with FakeConfigStore("/tmp/fake-cs.sock") as store:
+        CSClient.SOCKET_PATH = store.path
+        ...
+"""
+import copy
+import json
+import os
+import socket
+import threading
+import time
+
+# number of lines that follow the op line for each request type
+REQUEST_ARGS = {
+    "get": 3,
+    "put": 4,
+    "post": 3,
+    "delete": 2,
+    "decrypt": 3,
+    "alert": 2,
+    "patch": 2,
+    "register": 4,
+    "unregister": 4,
+}
+
+EVENT_SOCKET_PATH = "/var/tmp/csevent_{}.sock"
+
+def default_tree():
+    return {
+        "config": {"system": {"sdk": {"appdata": []}}},
+        "status": {"wan": {"primary_device": None, "devices": {}}},
+    }
+
+class FakeConfigStore:
+    def __init__(self, path, tree=None, keepalive=True, latency=0.0, event_socket_path=EVENT_SOCKET_PATH):
+        self.path = path
+        self.event_socket_path = event_socket_path
+        self.registrations = {}
+        self.events_sent = 0
+        self.tree = tree if tree is not None else default_tree()
+        self.keepalive = keepalive
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.connections = 0
+        self._sock = None
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen(64)
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    # tree access, paths look like /config/system/sdk/appdata or /status/wan/devices/mdm-1/diagnostics
+    def _walk(self, path, create=False):
+        node = self.tree
+        parts = [p for p in path.split("/") if p]
+        for part in parts[:-1]:
+            node = self._child(node, part, create)
+            if node is None:
+                return None, None
+        return node, parts[-1] if parts else None
+
+    @staticmethod
+    def _child(node, key, create):
+        if isinstance(node, list):
+            try:
+                return node[int(key)]
+            except (ValueError, IndexError):
+                return None
+        if isinstance(node, dict):
+            if key not in node and create:
+                node[key] = {}
+            return node.get(key)
+        return None
+
+    def get(self, path):
+        with self.lock:
+            parent, key = self._walk(path)
+            if key is None:
+                return copy.deepcopy(self.tree) if parent is not None else None
+            return copy.deepcopy(self._child(parent, key, False))
+
+    def put(self, path, value):
+        with self.lock:
+            parent, key = self._walk(path, create=True)
+            if isinstance(parent, list):
+                parent[int(key)] = value
+            elif isinstance(parent, dict):
+                parent[key] = value
+        self._fire(path)
+
+    def delete(self, path):
+        with self.lock:
+            parent, key = self._walk(path)
+            if isinstance(parent, dict):
+                parent.pop(key, None)
+        self._fire(path)
+
+    def _fire(self, changed):
+        changed = changed.rstrip("/")
+        for (pid, eid), (action, path) in list(self.registrations.items()):
+            path = path.rstrip("/")
+            # a change above or below the registered path changes it
+            if changed == path or changed.startswith(path + "/") or path.startswith(changed + "/"):
+                threading.Thread(target=self._send_event, args=(pid, eid, action, path), daemon=True).start()
+
+    def _send_event(self, pid, eid, action, path):
+        body = json.dumps({"id": eid, "action": action, "path": path, "cfg": json.dumps(self.get(path))}).encode()
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(2.0)
+                sock.connect(self.event_socket_path.format(pid))
+                sock.sendall(f"status: ok\r\ncontent-length: {len(body)}\r\n\r\n".encode() + body)
+                sock.recv(4096)
+            self.events_sent += 1
+        except OSError:
+            pass
+
+    def set_appdata(self, name, value):
+        appdata = self.get("/config/system/sdk/appdata") or []
+        appdata = [item for item in appdata if item["name"] != name]
+        if value is not None:
+            appdata.append({"name": name, "value": value})
+        self.put("/config/system/sdk/appdata", appdata)
+
+    def set_primary_device(self, device):
+        self.put("/status/wan/primary_device", device)
+
+    def set_cell(self, device, plmn, tac, cell_id=None, nr_cell_id=None, imsi="001010123456789", rsrp=-90):
+        """Make device's diagnostics report a serving cell, LTE with cell_id or NR with nr_cell_id"""
+        self.put(f"/status/wan/devices/{device}/diagnostics", {
+            "CUR_PLMN": plmn,
+            "TAC": str(tac),
+            "CELL_ID": f"{cell_id} ({cell_id:#x})" if cell_id is not None else "",
+            "NR_CELL_ID": str(nr_cell_id) if nr_cell_id is not None else "",
+            "IMSI": imsi,
+            "MDN": "15555550100",
+            "RSRP": rsrp,
+        })
+
+    def set_signal(self, device, rsrp):
+        """Change only the signal level, like the modem does all the time"""
+        path = f"/status/wan/devices/{device}/diagnostics"
+        diag = self.get(path) or {}
+        diag["RSRP"] = rsrp
+        self.put(path, diag)
+
+    def handle(self, op, args):
+        self.requests[op] = self.requests.get(op, 0) + 1
+        if op == "get":
+            return "ok", self.get(args[0])
+        if op == "put":
+            self.put(args[0], json.loads(args[3]))
+            return "ok", True
+        if op == "post":
+            self.put(args[0], json.loads(args[2]))
+            return "ok", True
+        if op == "delete":
+            self.delete(args[0])
+            return "ok", True
+        if op == "register":
+            pid, eid, action, path = args
+            self.registrations[(int(pid), int(eid))] = (action, path)
+            return "ok", True
+        if op == "unregister":
+            self.registrations.pop((int(args[0]), int(args[1])), None)
+            return "ok", True
+        return "error", f"unsupported op {op}"
+
+    def _accept_loop(self):
+        while self._sock is not None:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn, conn.makefile("rb") as reader:
+            while True:
+                op = reader.readline()
+                if not op:
+                    break
+                op = op.decode().strip()
+                args = [reader.readline().decode().rstrip("\n") for _ in range(REQUEST_ARGS.get(op, 0))]
+                if self.latency:
+                    time.sleep(self.latency)
+                status, data = self.handle(op, args)
+                body = json.dumps(data).encode()
+                try:
+                    conn.sendall(f"status: {status}\r\ncontent-length: {len(body)}\r\n\r\n".encode() + body)
+                except OSError:
+                    break
+                if not self.keepalive:
+                    break
@@ -0,0 +1,177 @@
+"""Scriptable stand-in for the example-client (v4) and example-lpp (v3) binaries.
+
+Accepts the command lines main.py builds, finds the NMEA export in them
+(--nmea-export-un / --nmea-export-tcp for v3, --output tcp-client:path=... or
+tcp-client:host=...,port=... with format=nmea for v4) and writes a GGA, RMC
+and GSA epoch there at FAKE_LPP_RATE Hz, reconnecting when the reader goes
+away. With format=nmea+ubx+rtcm each epoch also carries a UBX NAV-PVT and
+an RTCM 1005 frame. Control input on stdin (/CID,...) is acknowledged on stdout like a log
+line. Starts, control lines and exits are also appended as JSON lines to
+FAKE_LPP_EVENTS, so a test rig can time them.
+
+Behaviour is set through the environment, which main.py passes on:
+
+    FAKE_LPP_EVENTS     file to append JSON events to
+    FAKE_LPP_RATE       epochs per second (default 10)
+    FAKE_LPP_QUALITY    GGA fix quality (default 4, RTK fixed)
+    FAKE_LPP_EXIT_AFTER exit after this many seconds (default never)
+    FAKE_LPP_EXIT_CODE  code to exit with then (default 1)
+
+SIGINT stops it with exit code 0, the way main.py interrupts the real client.
+"""
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+def event(kind, **fields):
+    path = os.environ.get("FAKE_LPP_EVENTS")
+    if not path:
+        return
+    with open(path, "a") as f:
+        f.write(json.dumps({"t": time.time(), "event": kind, "pid": os.getpid(), **fields}) + "\n")
+
+def nmea_target(argv):
+    """("unix", path) or ("tcp", (host, port)) or ("tcp-server", (host, port)) from the command line, or None"""
+    host = port = None
+    for i, arg in enumerate(argv):
+        if arg.startswith("--nmea-export-un="):
+            return "unix", arg.split("=", 1)[1]
+        if arg.startswith("--nmea-export-tcp="):
+            host = arg.split("=", 1)[1]
+        if arg.startswith("--nmea-export-tcp-port="):
+            port = int(arg.split("=", 1)[1])
+        if arg == "--output" and i + 1 < len(argv) and "format=nmea" in argv[i + 1]:
+            kind, _, options = argv[i + 1].partition(":")
+            options = dict(option.split("=", 1) for option in options.split(",") if "=" in option)
+            if "path" in options:
+                return "unix", options["path"]
+            if kind in ("tcp-client", "tcp-server") and "port" in options:
+                return kind.replace("tcp-client", "tcp"), (options.get("host", "127.0.0.1"), int(options["port"]))
+    if host and port:
+        return "tcp", (host, port)
+    return None
+
+def export_formats(argv):
+    """The formats of the v4 NMEA export, {"nmea"} for v3"""
+    for i, arg in enumerate(argv):
+        if arg == "--output" and i + 1 < len(argv) and "format=nmea" in argv[i + 1]:
+            options = dict(option.split("=", 1) for option in argv[i + 1].partition(":")[2].split(",") if "=" in option)
+            return set(options["format"].split("+"))
+    return {"nmea"}
+
+def ubx_frame(cls, msg, payload):
+    body = struct.pack("<BBH", cls, msg, len(payload)) + payload
+    ck_a = ck_b = 0
+    for c in body:
+        ck_a = (ck_a + c) & 0xFF
+        ck_b = (ck_b + ck_a) & 0xFF
+    return b"\xb5\x62" + body + bytes((ck_a, ck_b))
+
+def rtcm_frame(number, payload):
+    payload = struct.pack(">H", number << 4) + payload
+    frame = bytes((0xD3, len(payload) >> 8, len(payload) & 0xFF)) + payload
+    crc = 0
+    for c in frame:
+        crc ^= c << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+    return frame + crc.to_bytes(3, "big")
+
+def checksum(body):
+    value = 0
+    for c in body.encode():
+        value ^= c
+    return f"{value:02X}"
+
+def epoch(quality, formats=("nmea",)):
+    t = time.gmtime()
+    hhmmss = time.strftime("%H%M%S", t) + f".{int(time.time() * 10) % 10}0"
+    bodies = (
+        f"GNGGA,{hhmmss},4807.038,N,01131.000,E,{quality},12,0.9,545.4,M,46.9,M,1.0,0000",
+        f"GNRMC,{hhmmss},A,4807.038,N,01131.000,E,0.1,84.4,{time.strftime('%d%m%y', t)},,,D",
+        "GNGSA,A,3,04,05,09,12,24,,,,,,,,1.8,0.9,1.5",
+    )
+    data = "".join(f"${body}*{checksum(body)}\r\n" for body in bodies).encode()
+    if "ubx" in formats:
+        data += ubx_frame(0x01, 0x07, bytes(92))
+    if "rtcm" in formats:
+        data += rtcm_frame(1005, bytes(17))
+    return data
+
+def connect(target):
+    kind, address = target
+    if kind == "unix":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+        return sock
+    return socket.create_connection(address)
+
+def nmea_writer(target, rate, quality, formats, stop):
+    sock = None
+    server = None
+    if target[0] == "tcp-server":
+        server = socket.create_server(target[1])
+        server.settimeout(1.0 / rate)
+    while not stop.is_set():
+        if sock is None:
+            try:
+                sock = server.accept()[0] if server else connect(target)
+            except OSError:
+                stop.wait(0.2)
+                continue
+        try:
+            sock.sendall(epoch(quality, formats))
+        except OSError:
+            sock.close()
+            sock = None
+        stop.wait(1.0 / rate)
+
+def main():
+    argv = sys.argv[1:]
+    rate = env_float("FAKE_LPP_RATE", 10.0)
+    quality = int(env_float("FAKE_LPP_QUALITY", 4))
+    exit_after = env_float("FAKE_LPP_EXIT_AFTER", 0.0)
+    exit_code = int(env_float("FAKE_LPP_EXIT_CODE", 1))
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    event("start", argv=argv)
+    print(f"I [fake-lpp] started: {' '.join(argv)}", flush=True)
+    target = nmea_target(argv)
+    if target:
+        threading.Thread(target=nmea_writer, args=(target, rate, quality, export_formats(argv), stop), daemon=True).start()
+    else:
+        print("W [fake-lpp] no NMEA export on the command line", flush=True)
+
+    def control():
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            event("control", line=line)
+            print(f"I [fake-lpp/ctrl] {line}", flush=True)
+        stop.wait()
+
+    threading.Thread(target=control, daemon=True).start()
+    code = 0
+    if exit_after and not stop.wait(exit_after):
+        code = exit_code
+        print(f"E [fake-lpp] exiting with {code} as configured", flush=True)
+    else:
+        stop.wait()
+    event("exit", code=code)
+    sys.exit(code)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""Replay NMEA through the real ingestion pipeline, without a router, receiver or location server.
+
+Starts a FakeConfigStore in place of /var/tmp/cs.sock, builds the params with
+main.get_cmd_params() from its appdata, and runs main.un_thread_server() with
+the NmeaPipeline and a TCP NmeaBroadcaster that local consumers connect to.
+A producer then writes recorded (--input, one sentence per line) or
+synthetic NMEA into the unix socket at the given rate. It can send in bursts
+and mix in malformed lines. Every --probe-every sentences a $PRPLY probe
+sentence carries a sequence number, and the consumers use it to measure
+end-to-end latency from the producer's write to their read.
+
+Reports throughput, latency percentiles, CPU time of the ingestion,
+broadcaster and publisher threads per sentence, RSS and config store puts.
+Use --json or --output for machine-readable results.
+
+    python3 bench/replay_nmea.py [--input recorded.nmea] [--rate 100] [--seconds 10]
+        [--burst 1] [--malformed 0.01] [--consumers 4] [--log-nmea] [--json] [--output results.json]
+
+--rate 0 sends as fast as the pipeline takes it.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH, ".."))
+sys.path.insert(0, BENCH)
+
+PROBE = "PRPLY"
+
+SYNTHETIC = (
+    "GPGGA,{t},4807.038,N,01131.000,E,4,12,0.9,545.4,M,46.9,M,1.0,0000",
+    "GPRMC,{t},A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W,D",
+    "GPGSA,A,3,04,05,,09,12,,,24,,,,,2.5,1.3,2.1",
+    "GPGSV,3,1,11,03,03,111,00,04,15,270,00,06,01,010,00,13,06,292,00",
+    "GPGSV,3,2,11,14,25,170,00,16,57,208,39,18,67,296,40,19,40,246,00",
+    "GPGSV,3,3,11,22,42,067,42,24,14,311,43,27,05,244,00",
+    "GNGST,{t},1.2,0.8,0.6,45.0,0.7,0.7,1.4",
+)
+
+MALFORMED = (
+    lambda rng: "$GPGGA,123519,4807.038,N,011",                        # truncated
+    lambda rng: "$GPGGA,bad,fields,here,,,,x,y,z,,*00",                # garbage fields, wrong checksum
+    lambda rng: "$GPTXT,01,01,02,été*00",                    # not ASCII
+    lambda rng: "".join(rng.choice("abcdef$*,0123") for _ in range(rng.randint(1, 80))),
+    lambda rng: "$GPZDA," + "9" * 2000,                                # oversized
+)
+
+def checksum(body):
+    value = 0
+    for c in body.encode():
+        value ^= c
+    return f"{value:02X}"
+
+def sentence(body):
+    return f"${body}*{checksum(body)}"
+
+def synthetic(rng):
+    i = 0
+    while True:
+        seconds = i // len(SYNTHETIC)
+        t = f"{12 + seconds // 3600 % 12:02d}{seconds // 60 % 60:02d}{seconds % 60:02d}.{i % 10}0"
+        yield sentence(SYNTHETIC[i % len(SYNTHETIC)].format(t=t))
+        i += 1
+
+def recorded(path):
+    with open(path, encoding="ascii", errors="replace") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if not lines:
+        raise SystemExit(f"no sentences in {path}")
+    while True:
+        yield from lines
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))] if samples else None
+
+def thread_cpu(thread):
+    if thread is None or thread.ident is None:
+        return 0.0
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+    except (OSError, AttributeError):
+        return 0.0
+
+def rss_kib():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+class Consumer:
+    """A TCP client of the broadcaster that times the probe sentences"""
+    def __init__(self, port, sent):
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sent = sent
+        self.lines = 0
+        self.bytes = 0
+        self.latencies = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        buffer = b""
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            now = time.perf_counter()
+            self.bytes += len(data)
+            buffer += data
+            *lines, buffer = buffer.split(b"\r\n")
+            self.lines += len(lines)
+            for line in lines:
+                if line.startswith(b"$" + PROBE.encode()):
+                    seq = int(line[len(PROBE) + 2:line.index(b"*")])
+                    self.latencies.append(now - self.sent[seq])
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+def produce(path, source, args, rng, sent):
+    """Write sentences to the pipeline's unix socket, returns (sentences, malformed, probes, seconds)"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    for _ in range(100):
+        try:
+            sock.connect(path)
+            break
+        except OSError:
+            time.sleep(0.01)
+    count = malformed = probes = 0
+    interval = args.burst / args.rate if args.rate else 0.0
+    start = next_time = time.perf_counter()
+    end = start + args.seconds
+    with sock:
+        while time.perf_counter() < end:
+            lines = []
+            for _ in range(args.burst):
+                count += 1
+                if args.probe_every and count % args.probe_every == 0:
+                    probes += 1
+                    sent[probes] = time.perf_counter()
+                    lines.append(sentence(f"{PROBE},{probes}"))
+                elif args.malformed and rng.random() < args.malformed:
+                    malformed += 1
+                    lines.append(rng.choice(MALFORMED)(rng))
+                else:
+                    lines.append(next(source))
+            sock.sendall(("\r\n".join(lines) + "\r\n").encode("utf-8"))
+            if interval:
+                next_time += interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+    return count, malformed, probes, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="recorded NMEA, one sentence per line, replayed in a loop")
+    parser.add_argument("--rate", type=float, default=100, help="sentences per second, 0 for as fast as possible")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--burst", type=int, default=1, help="sentences written together, at rate/burst writes per second")
+    parser.add_argument("--malformed", type=float, default=0.0, help="fraction of malformed lines")
+    parser.add_argument("--probe-every", type=int, default=10, help="a latency probe every N sentences, 0 for none")
+    parser.add_argument("--consumers", type=int, default=4, help="local TCP clients")
+    parser.add_argument("--publish-hz", default="1", help="lpp-client.cs_publish_hz")
+    parser.add_argument("--log-nmea", action="store_true", help="leave lpp-client.log_nmea on")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print machine readable results")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+    args.burst = max(1, args.burst)
+    rng = random.Random(args.seed)
+    source = recorded(args.input) if args.input else synthetic(rng)
+    output = os.path.abspath(args.output) if args.output else None
+
+    # main.py logs to ./log/main.txt, keep that out of the tree and stderr quiet
+    scratch = tempfile.mkdtemp(prefix="replay-nmea-")
+    os.makedirs(os.path.join(scratch, "log"))
+    os.chdir(scratch)
+    os.environ.setdefault("LOG_LEVEL_STDERR", "WARNING")
+
+    from fake_cs import FakeConfigStore
+    from csclient import CSClient
+    store = FakeConfigStore(os.path.join(scratch, "cs.sock")).start()
+    CSClient.SOCKET_PATH = store.path
+    CSClient.ON_DEVICE = True
+    store.set_appdata("lpp-client.log_nmea", "true" if args.log_nmea else "false")
+    store.set_appdata("lpp-client.cs_publish_hz", args.publish_hz)
+    store.put("/status/rtk", {"nmea": []})
+
+    import main as lpp
+    from tcp_broadcast import NmeaBroadcaster
+    from nmea_filter import Subscription
+
+    params = lpp.get_cmd_params()
+    lpp.cs.enable_pool(params["cs_pool_size"])
+    broadcaster = NmeaBroadcaster(params["tcp_queue_size"], params["tcp_slow_client"], logger=lpp.logger,
+                                  max_clients=params["tcp_max_clients"], stall_timeout=params["tcp_stall_timeout"],
+                                  subscription=Subscription(params["tcp_sentences"])).start()
+    port = broadcaster.listen(0, "127.0.0.1")
+    pipeline = lpp.NmeaPipeline(params, broadcaster)
+    nmea_path = os.path.join(scratch, "nmea.sock")
+    un_thread = threading.Thread(target=lpp.un_thread_server, args=(pipeline, nmea_path), daemon=True)
+    un_thread.start()
+
+    sent = {}
+    consumers = [Consumer(port, sent) for _ in range(args.consumers)]
+    while len(broadcaster.clients) < len(consumers):
+        time.sleep(0.01)
+
+    threads = {
+        "ingest": un_thread,
+        "broadcaster": broadcaster._thread,
+        "cs_publisher": pipeline.publisher._thread if pipeline.publisher else None,
+        "fix_publisher": pipeline.fix_publisher._thread if pipeline.fix_publisher else None,
+    }
+    cpu_before = {name: thread_cpu(thread) for name, thread in threads.items()}
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+
+    count, malformed, probes, elapsed = produce(nmea_path, source, args, rng, sent)
+    # let the consumers and publishers catch up
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and any(len(c.latencies) < probes for c in consumers):
+        time.sleep(0.05)
+    time.sleep(max(0.2, 1.0 / float(args.publish_hz)) if float(args.publish_hz) > 0 else 0.2)
+
+    cpu = {name: thread_cpu(thread) - cpu_before[name] for name, thread in threads.items()}
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    latencies = [latency for consumer in consumers for latency in consumer.latencies]
+    for consumer in consumers:
+        consumer.close()
+
+    results = {
+        "config": {
+            "input": args.input or "synthetic",
+            "rate": args.rate,
+            "seconds": args.seconds,
+            "burst": args.burst,
+            "malformed": args.malformed,
+            "consumers": args.consumers,
+            "cs_publish_hz": float(args.publish_hz),
+            "log_nmea": args.log_nmea,
+        },
+        "sent": count,
+        "malformed_sent": malformed,
+        "sentences_per_second": count / elapsed,
+        "received_per_consumer": [consumer.lines for consumer in consumers],
+        "tcp_dropped": broadcaster.dropped,
+        "latency_us": {
+            "probes": probes,
+            "samples": len(latencies),
+            "p50": (percentile(latencies, 50) or 0) * 1e6,
+            "p90": (percentile(latencies, 90) or 0) * 1e6,
+            "p99": (percentile(latencies, 99) or 0) * 1e6,
+            "max": max(latencies) * 1e6 if latencies else 0,
+        },
+        "cpu_us_per_sentence": {name: seconds / count * 1e6 for name, seconds in cpu.items()},
+        "process_cpu_us_per_sentence": ((usage.ru_utime + usage.ru_stime)
+                                        - (usage_before.ru_utime + usage_before.ru_stime)) / count * 1e6,
+        "rss_kib": rss_kib(),
+        "max_rss_kib": usage.ru_maxrss,
+        "cs_puts": store.requests.get("put", 0),
+        "parser": {"parsed": pipeline.parser.parsed, "errors": pipeline.parser.errors, "changes": pipeline.parser.changes},
+        "checksum": pipeline.checksum.stats(),
+    }
+    store.stop()
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    lat = results["latency_us"]
+    print(f"sent {count} sentences ({malformed} malformed) in {elapsed:.1f}s: {results['sentences_per_second']:.0f}/s")
+    print(f"received per consumer: {results['received_per_consumer']}, tcp dropped {results['tcp_dropped']}")
+    print(f"latency ({lat['samples']} probe samples): p50 {lat['p50']:.0f}us, p90 {lat['p90']:.0f}us, "
+          f"p99 {lat['p99']:.0f}us, max {lat['max']:.0f}us")
+    print("cpu per sentence: " + ", ".join(f"{name} {us:.1f}us" for name, us in results["cpu_us_per_sentence"].items())
+          + f", whole process {results['process_cpu_us_per_sentence']:.1f}us")
+    print(f"rss {results['rss_kib']} KiB (max {results['max_rss_kib']} KiB), cs puts {results['cs_puts']}, "
+          f"parser {results['parser']}, checksum {results['checksum']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+
+APPDATA_PATH = "/config/system/sdk/appdata"
+PRIMARY_DEVICE_PATH = "/status/wan/primary_device"
+DIAGNOSTICS_PATH = "/status/wan/devices/{}/diagnostics"
+
+# diagnostics fields that identify the serving cell, everything else (signal levels...) changes constantly
+CELL_FIELDS = ("CUR_PLMN", "TAC", "CELL_ID", "NR_CELL_ID")
+
+MIN_POLL_INTERVAL = 2.0
+MAX_POLL_INTERVAL = 10.0
+EVENT_POLL_INTERVAL = 60.0
+DEBOUNCE = 0.05
+
+def cell_identity(diag):
+    if not isinstance(diag, dict):
+        return None
+    return tuple(diag.get(field) for field in CELL_FIELDS)
+
+class ChangeMonitor:
+    """Wakes a checker when watched config store paths change, with polling as a fallback.
+
+    When the config store client supports eventing, watch() registers for
+    changes and wait() returns as soon as one arrives (after a short debounce
+    to coalesce bursts). Polling still happens as a safety net, every
+    EVENT_POLL_INTERVAL seconds while events work for every path. Without
+    events, or while a path failed to register or was expect()ed but can't be
+    registered for yet, the poll interval adapts: it drops to min_interval
+    after the checker reports a change and doubles up to max_interval while
+    nothing changes.
+    """
+    def __init__(self, cs=None, logger=None, min_interval=MIN_POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL,
+                 debounce=DEBOUNCE):
+        self.cs = cs
+        self.logger = logger
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.debounce = debounce
+        self.interval = max_interval
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._changed = set()
+        self._registrations = {}
+        # paths that should be watched but aren't, changes to them are only seen by polling
+        self._missing = set()
+        self._stopped = False
+        self.events = 0
+        self.polls = 0
+
+    @property
+    def eventing(self):
+        """Every path that should be watched is, so polling can slow down to EVENT_POLL_INTERVAL"""
+        return bool(self._registrations) and not self._missing
+
+    def watching(self, path):
+        return path in self._registrations
+
+    def watch(self, path, accept=None):
+        """Wake up when path changes, if accept(value) is given only when it returns True.
+
+        Returns whether path is registered for now, if not it counts as missing until watched or unwatched.
+        """
+        if path in self._registrations:
+            return False
+        self._missing.add(path)
+        if not hasattr(self.cs, "register"):
+            return False
+
+        def callback(changed_path, value, *args):
+            if accept is None or accept(value):
+                self.notify(path)
+
+        try:
+            eid = self.cs.register("set", path, callback)
+        except Exception as e:
+            eid = None
+            if self.logger:
+                self.logger.error(f"failed registering for changes to {path}: {e}")
+        if eid is None:
+            return False
+        self._registrations[path] = eid
+        self._missing.discard(path)
+        if self.logger:
+            self.logger.info(f"watching {path} for changes")
+        return True
+
+    def expect(self, path):
+        """Count path as missing, for one that has to be watched but can't be registered for yet"""
+        if path not in self._registrations:
+            self._missing.add(path)
+
+    def unwatch(self, path):
+        self._missing.discard(path)
+        eid = self._registrations.pop(path, None)
+        if eid is not None:
+            try:
+                self.cs.unregister(eid)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"failed unregistering {path}: {e}")
+
+    def notify(self, path=None):
+        with self._lock:
+            self._changed.add(path)
+        self.events += 1
+        self._event.set()
+
+    def wait(self):
+        """Block until something changed or it is time to poll.
+
+        Returns the set of changed paths, an empty set for a poll, or None once stopped.
+        """
+        if self._event.wait(self._timeout()) and self.debounce and not self._stopped:
+            time.sleep(self.debounce)
+        return self._collect()
+
+    def _timeout(self):
+        return max(self.interval, EVENT_POLL_INTERVAL) if self.eventing else self.interval
+
+    def _collect(self):
+        self._event.clear()
+        if self._stopped:
+            return None
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        if not changed:
+            self.polls += 1
+        return changed
+
+    def settle(self, changed):
+        """Tell the monitor whether the last check found a change, to adapt the poll interval"""
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+
+    def stop(self):
+        self._stopped = True
+        for path in list(self._registrations):
+            self.unwatch(path)
+        self._event.set()
+
+class AsyncChangeMonitor(ChangeMonitor):
+    """ChangeMonitor whose wait() is a coroutine for loop, notify() can still be called from any thread"""
+    def __init__(self, cs=None, logger=None, loop=None, **kwargs):
+        super().__init__(cs, logger, **kwargs)
+        self.loop = loop or asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+
+    def notify(self, path=None):
+        super().notify(path)
+        self._wake()
+
+    def _wake(self):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._wakeup.set()
+        else:
+            self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def wait(self):
+        """Wait until something changed or it is time to poll, like ChangeMonitor.wait()"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self._timeout())
+        except asyncio.TimeoutError:
+            pass
+        else:
+            if self.debounce and not self._stopped:
+                await asyncio.sleep(self.debounce)
+        self._wakeup.clear()
+        return self._collect()
+
+    def stop(self):
+        super().stop()
+        self._wake()
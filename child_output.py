@@ -0,0 +1,125 @@
+import logging
+import re
+import time
+
+from logger_config import DroppingQueueHandler, queue_handler, LOG_QUEUE_SIZE
+
+# places of the shared log queue child output can't take, kept for the application's own records
+CHILD_QUEUE_RESERVE = LOG_QUEUE_SIZE // 4
+# per kind of line and interval, the first SAMPLE_BURST lines are logged and after that one in SAMPLE_EVERY
+SAMPLE_INTERVAL = 10.0
+SAMPLE_BURST = 20
+SAMPLE_EVERY = 100
+MAX_SAMPLE_KEYS = 1000
+
+# the client's level names and letters, notice and verbose have no logging equivalent
+LEVELS = {
+    "V": logging.DEBUG,
+    "VERBOSE": logging.DEBUG,
+    "D": logging.DEBUG,
+    "DEBUG": logging.DEBUG,
+    "I": logging.INFO,
+    "INFO": logging.INFO,
+    "N": logging.INFO,
+    "NOTICE": logging.INFO,
+    "W": logging.WARNING,
+    "WARN": logging.WARNING,
+    "WARNING": logging.WARNING,
+    "E": logging.ERROR,
+    "ERROR": logging.ERROR,
+}
+
+# "I [lpp/client] message" or "12.345 WARNING: [supl] message", a bare letter only counts when a module follows
+LINE_RE = re.compile(
+    r"^\s*(?:\[?\s*[\d:.T-]+\s*\]?\s+)?"
+    r"(?:(?P<letter>[VDINWE])\s+\[\s*(?P<letter_module>[^\]]*?)\s*\]"
+    r"|(?P<word>VERBOSE|DEBUG|INFO|NOTICE|WARN|WARNING|ERROR)\b:?(?:\s+\[\s*(?P<word_module>[^\]]*?)\s*\])?)"
+    r"\s*(?P<message>.*)$",
+    re.IGNORECASE)
+DIGITS_RE = re.compile(r"\d+")
+
+def parse_line(line):
+    """Split a line of client output into (level, module, message), lines without a level are info"""
+    match = LINE_RE.match(line)
+    if match is None:
+        return logging.INFO, None, line
+    if match.group("letter"):
+        return LEVELS[match.group("letter").upper()], match.group("letter_module") or None, match.group("message")
+    return LEVELS[match.group("word").upper()], match.group("word_module") or None, match.group("message")
+
+class ChildOutput:
+    """Turns the LPP client's output into structured log records without ever blocking the client.
+
+    read() takes the client's stdout in binary mode and only parses, samples
+    and queues each line, so the pipe is drained at the rate the client writes.
+    The records that are kept go on the queue of logger_config's listener (by
+    default), the one thread that writes the application's records too, so
+    both stay in order in every log. The child's handler counts its own drops
+    and leaves the last reserve places of the queue to the application, so a
+    chatty client can't crowd out its records. Lines that keep repeating (same
+    module and message apart from numbers) are sampled, warnings and errors
+    are always kept.
+    """
+    def __init__(self, parent, log_queue=None, reserve=CHILD_QUEUE_RESERVE, interval=SAMPLE_INTERVAL, burst=SAMPLE_BURST,
+                 every=SAMPLE_EVERY):
+        self.parent = parent
+        self.interval = interval
+        self.burst = burst
+        self.every = every
+        self.logger = parent.getChild("child")
+        self.logger.propagate = False
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        self.handler = DroppingQueueHandler(log_queue or queue_handler.queue, reserve)
+        self.logger.addHandler(self.handler)
+        self._counts = {}
+        self._window_start = time.monotonic()
+        self._window_sampled = 0
+        self.lines = 0
+        self.bytes = 0
+        self.sampled = 0
+
+    def read(self, stream):
+        """Read stream until EOF"""
+        for raw in iter(stream.readline, b""):
+            self.feed(raw)
+
+    def feed(self, raw):
+        self.lines += 1
+        self.bytes += len(raw)
+        line = raw.decode("utf-8", errors="replace").rstrip()
+        if not line:
+            return
+        level, module, message = parse_line(line)
+        if level < logging.WARNING and not self._keep(module, message):
+            return
+        self.logger.log(level, f"[{module}] {message}" if module else message,
+                        extra={"child_level": level, "child_module": module, "child_message": message})
+
+    def _keep(self, module, message):
+        now = time.monotonic()
+        if now - self._window_start >= self.interval:
+            if self._window_sampled:
+                self.parent.info(f"child output: sampled out {self._window_sampled} repetitive lines in the last {now - self._window_start:.0f}s")
+            self._counts.clear()
+            self._window_start = now
+            self._window_sampled = 0
+        key = (module, DIGITS_RE.sub("#", message))
+        count = self._counts.get(key, 0) + 1
+        if count == 1 and len(self._counts) >= MAX_SAMPLE_KEYS:
+            return True
+        self._counts[key] = count
+        if count <= self.burst or (count - self.burst) % self.every == 0:
+            return True
+        self.sampled += 1
+        self._window_sampled += 1
+        return False
+
+    def stats(self):
+        return {
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "sampled": self.sampled,
+            "dropped": self.handler.dropped,
+            "queued": self.handler.queue.qsize(),
+        }
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+
+DEFAULT_PUBLISH_HZ = 1.0
+STATS_INTERVAL = 60
+
+class CSPublisher:
+    """Rate-limited, coalescing publisher for a single config store path.
+
+    Producers call mark_dirty() whenever the value changes. A background thread
+    puts snapshot() to the config store at most max_hz times per second, so a
+    burst of changes between two flushes turns into a single put. A max_hz of 0
+    disables the rate limit but still coalesces whatever queued up during a put.
+    """
+    def __init__(self, path, snapshot, put, max_hz=DEFAULT_PUBLISH_HZ, logger=None):
+        self.path = path
+        self.snapshot = snapshot
+        self.put = put
+        self.set_rate(max_hz)
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pending = 0
+        self._pending_since = None
+        self.puts = 0
+        self.skipped = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+        self.last_delay = 0.0
+
+    def set_rate(self, max_hz):
+        self.max_hz = max_hz
+        self.min_interval = 1.0 / max_hz if max_hz > 0 else 0.0
+
+    def mark_dirty(self):
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending += 1
+        self._dirty.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"cs-publisher {self.path}")
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self, flush=True):
+        self._stop.set()
+        self._dirty.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Put the current snapshot if anything changed since the last put"""
+        self._dirty.clear()
+        pending, since = self._take()
+        if not pending:
+            return False
+        start = time.monotonic()
+        try:
+            self.put(self.path, self.snapshot())
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"failed publishing {self.path}: {e}")
+        self._flushed(pending, since, start)
+        return True
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, 0
+            since, self._pending_since = self._pending_since, None
+        return pending, since
+
+    def _flushed(self, pending, since, start):
+        end = time.monotonic()
+        latency = end - start
+        self.puts += 1
+        self.skipped += pending - 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self.total_flush_latency += latency
+        self.last_delay = end - since
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "puts": self.puts,
+            "skipped": self.skipped,
+            "last_flush_latency": self.last_flush_latency,
+            "avg_flush_latency": self.total_flush_latency / self.puts if self.puts else 0.0,
+            "max_flush_latency": self.max_flush_latency,
+            "last_delay": self.last_delay,
+        }
+
+    def _run(self):
+        last_flush = 0.0
+        last_stats = time.monotonic()
+        while not self._stop.is_set():
+            if not self._dirty.wait(STATS_INTERVAL):
+                continue
+            wait = last_flush + self.min_interval - time.monotonic()
+            if wait > 0 and self._stop.wait(wait):
+                break
+            if self.flush():
+                last_flush = time.monotonic()
+            if self.logger and last_flush - last_stats >= STATS_INTERVAL:
+                last_stats = last_flush
+                self.logger.info(f"cs publisher stats: {self.stats()}")
+
+class AsyncCSPublisher(CSPublisher):
+    """CSPublisher for an asyncio event loop: put is a coroutine function and the flushes run as a task.
+
+    start(), stop() and mark_dirty() must be called from the loop's thread.
+    """
+    def __init__(self, path, snapshot, put, max_hz=DEFAULT_PUBLISH_HZ, logger=None):
+        super().__init__(path, snapshot, put, max_hz, logger)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def mark_dirty(self):
+        # no lock, everything runs on the loop
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        self._pending += 1
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def stop(self, flush=True):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if flush:
+            asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self):
+        """Put the current snapshot if anything changed since the last put"""
+        self._wakeup.clear()
+        pending, since = self._take()
+        if not pending:
+            return False
+        start = time.monotonic()
+        try:
+            await self.put(self.path, self.snapshot())
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"failed publishing {self.path}: {e}")
+        self._flushed(pending, since, start)
+        return True
+
+    async def _run(self):
+        last_flush = 0.0
+        last_stats = time.monotonic()
+        while True:
+            await self._wakeup.wait()
+            wait = last_flush + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if await self.flush():
+                last_flush = time.monotonic()
+            if self.logger and last_flush - last_stats >= STATS_INTERVAL:
+                last_stats = last_flush
+                self.logger.info(f"cs publisher stats: {self.stats()}")
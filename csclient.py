@@ -10,18 +10,191 @@ criminal penalties.
 """
 
 
+import asyncio
 import json
 import os
 import re
 import socket
 import logging.handlers
+import select
 import sys
+import threading
+import time
 
 
 class SdkCSException(Exception):
     pass
 
 
+class CSConnection(object):
+    """
+    A long-lived connection to the config store socket.
+
+    Responses are framed by their content-length header, so any bytes read past the end of one response are kept
+    for the next one. That is what allows several requests to be written back to back on the same socket.
+    """
+    def __init__(self, path, timeout):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.settimeout(timeout)
+            self.sock.connect(path)
+        except Exception:
+            self.sock.close()
+            raise
+        self.buffer = bytearray()
+        self.responses = 0
+
+    def close(self):
+        self.sock.close()
+
+    def sendall(self, data):
+        self.sock.sendall(data)
+
+    def _fill(self):
+        buf = self.sock.recv(CSClient.MAX_PACKET_SIZE)
+        if not buf:
+            raise EOFError("config store closed the connection")
+        self.buffer += buf
+
+    def receive(self):
+        eoh = self.buffer.find(CSClient.END_OF_HEADER)
+        while eoh < 0:
+            self._fill()
+            eoh = self.buffer.find(CSClient.END_OF_HEADER)
+        header = bytes(self.buffer[:eoh])
+        content_len = int(CSClient.CONTENT_LENGTH_HEADER_RE.search(header).group(0)[16:])
+        end = eoh + len(CSClient.END_OF_HEADER) + content_len
+        while len(self.buffer) < end:
+            self._fill()
+        body = bytes(self.buffer[eoh:end])
+        del self.buffer[:end]
+        self.responses += 1
+        return CSClient._decode_response(header, body)
+
+
+class CSConnectionPool(object):
+    """
+    Thread-safe pool of CSConnection objects.
+
+    Callers check out a connection for the duration of one request (or one pipelined batch of requests). Connections
+    that fail with EPIPE, a reset, EOF or a timeout are discarded and replaced. If the config store turns out to close
+    every connection after a single response, the pool stops trying to reuse connections and just opens one per call.
+    """
+    MAX_STALE_REUSES = 3
+
+    def __init__(self, path, size=1, timeout=2.0):
+        self.path = path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.persistent = True
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self.connects = 0
+        self.reconnects = 0
+        self.reuses = 0
+        self.stale_reuses = 0
+        self.timeouts = 0
+
+    def _connect(self):
+        conn = CSConnection(self.path, self.timeout)
+        self.connects += 1
+        return conn
+
+    def checkout(self):
+        with self._cond:
+            while not self._idle and self._open >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+        try:
+            return self._connect()
+        except Exception:
+            self._discard(None)
+            raise
+
+    def checkin(self, conn):
+        if not self.persistent:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def _discard(self, conn):
+        if conn is not None:
+            conn.close()
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            conn.close()
+
+    def request(self, cmds):
+        """Send one or more commands on a single connection and return their responses in order"""
+        responses = []
+        conn = self.checkout()
+        reused = conn.responses > 0
+        if reused:
+            self.reuses += 1
+        try:
+            while len(responses) < len(cmds):
+                pending = cmds[len(responses):]
+                received = len(responses)
+                try:
+                    conn.sendall(b"".join(pending))
+                    for _ in pending:
+                        responses.append(conn.receive())
+                except socket.timeout:
+                    # the response may still arrive later, so this connection can't be trusted anymore
+                    self.timeouts += 1
+                    self._discard(conn)
+                    conn = None
+                    return responses + [{"status": "timeout", "data": None}] * (len(cmds) - len(responses))
+                except (OSError, EOFError):
+                    conn.close()
+                    if len(responses) == received:
+                        if not reused:
+                            # a brand new connection made no progress, give up
+                            raise
+                        self._note_stale_reuse()
+                    self.reconnects += 1
+                    reused = False
+                    conn = self._connect()
+            return responses
+        except Exception:
+            if conn is not None:
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self.checkin(conn)
+
+    def _note_stale_reuse(self):
+        self.stale_reuses += 1
+        if self.stale_reuses >= self.MAX_STALE_REUSES and self.stale_reuses >= self.reuses:
+            self.persistent = False
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "persistent": self.persistent,
+            "open": self._open,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "reuses": self.reuses,
+            "stale_reuses": self.stale_reuses,
+            "timeouts": self.timeouts,
+        }
+
+
 class CSClient(object):
     """
     The CSClient class is the NCOS SDK mechanism for communication between apps and the router tree/config store.
@@ -39,7 +212,10 @@ class CSClient(object):
     CONTENT_LENGTH_HEADER_RE = re.compile(rb"content-length: \w*")
     MAX_PACKET_SIZE = 8192
     RECV_TIMEOUT = 2.0
-    ON_DEVICE = ('linux' in sys.platform) and os.path.exists('/var/tmp/cs.sock')
+    SOCKET_PATH = '/var/tmp/cs.sock'
+    APPDATA_PATH = '/config/system/sdk/appdata'
+    APPDATA_TTL = 1.0
+    ON_DEVICE = ('linux' in sys.platform) and os.path.exists(SOCKET_PATH)
 
     _instances = {}
 
@@ -53,8 +229,16 @@ class CSClient(object):
             cls._instances[cls] = super().__new__(cls)
         return cls._instances[cls]
 
-    def __init__(self, app_name, init=False, logger=None):
+    def __init__(self, app_name, init=False, logger=None, pool_size=0):
         self.app_name = app_name
+        self._pool = None
+        self.enable_pool(pool_size)
+        self.appdata_ttl = self.APPDATA_TTL
+        self._appdata = None
+        self._appdata_time = 0.0
+        self._appdata_lock = threading.Lock()
+        self.appdata_hits = 0
+        self.appdata_fetches = 0
         self.ncos = '/var/mnt/sdk' in os.getcwd()  # Running in NCOS
         if not logger:
             handlers = [logging.StreamHandler()]
@@ -68,6 +252,22 @@ class CSClient(object):
         if not init:
             return
 
+    def enable_pool(self, size=1):
+        """
+        Keep up to `size` long-lived connections to the config store instead of opening a socket per request.
+        A size of 0 closes the pool and goes back to one connection per request.
+        """
+        if self._pool is not None:
+            if self._pool.size == size:
+                return
+            self._pool.close()
+            self._pool = None
+        if size > 0:
+            self._pool = CSConnectionPool(self.SOCKET_PATH, size, self.RECV_TIMEOUT)
+
+    def pool_stats(self):
+        return self._pool.stats() if self._pool is not None else None
+
     def get(self, base, query='', tree=0):
         """
         Constructs and sends a get request to retrieve specified data from a device.
@@ -107,6 +307,21 @@ class CSClient(object):
 
             return json.loads(response.text).get('data')
 
+    def get_many(self, bases, query='', tree=0):
+        """
+        Retrieves several paths at once. With a connection pool the requests are pipelined on a single connection.
+
+        Args:
+            bases: List of paths on the router tree.
+
+        Returns:
+            A list with the data for each path, in the same order.
+        """
+        if self.ON_DEVICE and self._pool is not None:
+            cmds = ["get\n{}\n{}\n{}\n".format(base, query, tree) for base in bases]
+            return [(result or {}).get('data') for result in self._dispatch_many(cmds)]
+        return [self.get(base, query, tree) for base in bases]
+
     def decrypt(self, base, query='', tree=0):
         """
         Constructs and sends a decrypt/get request to retrieve specified data from a device.
@@ -416,11 +631,22 @@ class CSClient(object):
 
     def _safe_dispatch(self, cmd):
         """Send the command and return the response."""
+        if self._pool is not None:
+            return self._pool.request([bytes(cmd, 'ascii')])[0]
         with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
-            sock.connect('/var/tmp/cs.sock')
+            sock.connect(self.SOCKET_PATH)
             sock.sendall(bytes(cmd, 'ascii'))
             return self._receive(sock)
 
+    def _dispatch_many(self, cmds):
+        try:
+            return self._pool.request([bytes(cmd, 'ascii') for cmd in cmds])
+        except Exception as err:
+            errmsg = "dispatch failed with exception={} err={}".format(type(err), str(err))
+            print(errmsg)
+            self.log(errmsg)
+            return [""] * len(cmds)
+
     def _dispatch(self, cmd):
         errmsg = None
         result = ""
@@ -452,7 +678,6 @@ class CSClient(object):
             data += buf
             eoh = data.find(self.END_OF_HEADER)
 
-        status_hdr = self.STATUS_HEADER_RE.search(data).group(0)[8:]
         content_len = self.CONTENT_LENGTH_HEADER_RE.search(data).group(0)[16:]
         remaining = int(content_len) - (len(data) - eoh - len(self.END_OF_HEADER))
 
@@ -463,7 +688,12 @@ class CSClient(object):
                 break
             data += buf
             remaining -= len(buf)
-        body = data[eoh:].decode()
+        return self._decode_response(data[:eoh], data[eoh:])
+
+    @classmethod
+    def _decode_response(cls, header, body):
+        status_hdr = cls.STATUS_HEADER_RE.search(header).group(0)[8:]
+        body = body.decode()
         try:
             result = json.loads(body)
         except json.JSONDecodeError as e:
@@ -492,15 +722,248 @@ class CSClient(object):
         if env_value:
             return env_value
 
-        appdata = self.get("/config/system/sdk/appdata")
-        return next((j['value'] for j in appdata if j['name'] == key), None)
+        return self.appdata().get(key)
+
+    def appdata(self):
+        """
+        Returns the appdata as a {name: value} dict.
+
+        The list is fetched from the router at most once every `appdata_ttl` seconds and indexed, so looking up many
+        keys in a row costs a single round trip. invalidate_appdata() drops (or replaces) the snapshot early.
+        """
+        with self._appdata_lock:
+            if self._appdata is not None and time.monotonic() - self._appdata_time < self.appdata_ttl:
+                self.appdata_hits += 1
+                return self._appdata
+            appdata = self.get(self.APPDATA_PATH)
+            self.appdata_fetches += 1
+            if not isinstance(appdata, list):
+                raise SdkCSException("failed fetching appdata: {}".format(appdata))
+            self._index_appdata(appdata)
+            return self._appdata
+
+    def _index_appdata(self, appdata):
+        index = {}
+        for item in appdata:
+            # first entry wins if a name appears twice
+            index.setdefault(item['name'], item['value'])
+        self._appdata = index
+        self._appdata_time = time.monotonic()
+
+    def invalidate_appdata(self, appdata=None):
+        """Drop the cached appdata, or replace it with `appdata` (the new list) when it is already known"""
+        with self._appdata_lock:
+            if isinstance(appdata, list):
+                self._index_appdata(appdata)
+            else:
+                self._appdata = None
+
+    def appdata_stats(self):
+        return {"hits": self.appdata_hits, "fetches": self.appdata_fetches}
 
     def set_appdata(self, key, value):
-        appdata = self.get("/config/system/sdk/appdata")
+        """Set one appdata value.
+
+        Only this client's cached snapshot is replaced with the new list. Other
+        processes (main.py, when the webapp sets a value) learn about the change
+        from their appdata change event or once their snapshot's TTL expires.
+        """
+        appdata = self.get(self.APPDATA_PATH)
         for item in appdata:
             if item['name'] == key:
                 item['value'] = value
-                self.put("/config/system/sdk/appdata", appdata)
-                return
-        appdata.append({'name': key, 'value': value})
-        self.put("/config/system/sdk/appdata", appdata)
\ No newline at end of file
+                break
+        else:
+            appdata.append({'name': key, 'value': value})
+        self.put(self.APPDATA_PATH, appdata)
+        self.invalidate_appdata(appdata)
+
+
+class EventingCSClient(CSClient):
+    """
+    CSClient that can also be notified of config store changes.
+
+    register() asks the router to call back into this process whenever `action` happens on `path`. The router
+    connects to a per-process event socket (/var/tmp/csevent_<pid>.sock) and sends the registration id, action, path and
+    new value; the registered callback is run on the event thread with (path, value, *args) and its return value is
+    sent back as the reply, so callbacks should be quick. After use_loop() the event socket is served by an asyncio
+    event loop instead and callbacks run on the loop.
+    """
+    EVENT_SOCKET_PATH = '/var/tmp/csevent_{}.sock'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not hasattr(self, 'registry'):
+            self.registry = {}
+            self.eids = 1
+            self.running = False
+            self.event_sock = None
+            self.event_thread = None
+            self.loop = None
+        self.on = self.register
+        self.un = self.unregister
+
+    def start(self):
+        if self.running:
+            return
+        self.pid = os.getpid()
+        self.event_sock_path = self.EVENT_SOCKET_PATH.format(self.pid)
+        try:
+            os.unlink(self.event_sock_path)
+        except FileNotFoundError:
+            pass
+        self.event_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.event_sock.bind(self.event_sock_path)
+        self.event_sock.listen()
+        self.event_sock.setblocking(False)
+        self.running = True
+        if self.loop is not None:
+            self.loop.add_reader(self.event_sock, self._handle_event)
+            return
+        self.event_thread = threading.Thread(target=self._handle_events, name="csevent")
+        self.event_thread.daemon = True
+        self.event_thread.start()
+
+    def use_loop(self, loop):
+        """Serve events on an asyncio event loop rather than a thread of their own, call it from the loop before register()"""
+        self.loop = loop
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        for eid in list(self.registry):
+            self.unregister(eid)
+        if self.loop is not None:
+            self.loop.remove_reader(self.event_sock)
+        self.event_sock.close()
+        try:
+            os.unlink(self.event_sock_path)
+        except FileNotFoundError:
+            pass
+
+    def register(self, action='set', path='', callback=None, *args):
+        """
+        Call callback(path, value, *args) whenever `action` (i.e. 'set', 'put', 'post', 'delete') happens on `path`.
+
+        Returns:
+            The registration id, or None if the registration failed or the app is not running on a device.
+        """
+        if not self.ON_DEVICE:
+            return None
+        if not self.running:
+            self.start()
+        eid = self.eids
+        self.eids += 1
+        self.registry[eid] = {'cb': callback, 'action': action, 'path': path, 'args': args}
+        cmd = "register\n{}\n{}\n{}\n{}\n".format(self.pid, eid, action, path)
+        result = self._dispatch(cmd)
+        if not result or result.get('status') != 'ok':
+            del self.registry[eid]
+            return None
+        return eid
+
+    def unregister(self, eid):
+        entry = self.registry.pop(eid, None)
+        if entry:
+            cmd = "unregister\n{}\n{}\n{}\n{}\n".format(self.pid, eid, entry['action'], entry['path'])
+            return self._dispatch(cmd)
+        return ""
+
+    def _handle_events(self):
+        poller = select.poll()
+        poller.register(self.event_sock, select.POLLIN | select.POLLERR | select.POLLHUP)
+        while self.running:
+            try:
+                for _, ev in poller.poll(1000):
+                    if ev & (select.POLLERR | select.POLLHUP):
+                        self.log("event socket hangup/error, no more config store events")
+                        self.running = False
+                        break
+                    if ev & select.POLLIN:
+                        self._handle_event()
+            except Exception as err:
+                self.log("event handling failed with exception={} err={}".format(type(err), str(err)))
+
+    def _handle_event(self):
+        try:
+            conn, _ = self.event_sock.accept()
+        except BlockingIOError:
+            return
+        with conn:
+            conn.setblocking(True)
+            result = self._receive(conn)
+            ret = None
+            try:
+                data = result['data']
+                entry = self.registry.get(int(data['id']))
+                if entry and entry['cb']:
+                    cfg = data.get('cfg')
+                    value = json.loads(cfg) if isinstance(cfg, str) else cfg
+                    ret = entry['cb'](data.get('path'), value, *entry['args'])
+            except Exception as err:
+                self.log("event callback failed with exception={} err={}".format(type(err), str(err)))
+            payload = json.dumps(ret).encode()
+            conn.sendall("status: ok\r\ncontent-length: {}\r\n\r\n".format(len(payload)).encode() + payload)
+
+
+class AsyncCSClient(object):
+    """
+    asyncio get and put for apps running on the device, over one long-lived config store connection.
+
+    Requests take turns on the connection and responses are framed by their content-length header like CSConnection's.
+    A connection that fails is replaced and the request tried once more, one that times out is dropped since its
+    response may still arrive.
+    """
+    def __init__(self, path=None, timeout=None):
+        self.path = path
+        self.timeout = timeout or CSClient.RECV_TIMEOUT
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self.connects = 0
+        self.timeouts = 0
+
+    async def _connect(self):
+        # CSClient.SOCKET_PATH is looked up late so it can be changed after this client was made
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path or CSClient.SOCKET_PATH)
+        self.connects += 1
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _request(self, cmd):
+        self._writer.write(cmd)
+        header = await self._reader.readuntil(CSClient.END_OF_HEADER)
+        content_len = int(CSClient.CONTENT_LENGTH_HEADER_RE.search(header).group(0)[16:])
+        body = await self._reader.readexactly(content_len)
+        return CSClient._decode_response(header[:-len(CSClient.END_OF_HEADER)], body)
+
+    async def request(self, cmd):
+        """Send one command and return its response"""
+        async with self._lock:
+            for attempt in range(2):
+                if self._writer is None:
+                    await self._connect()
+                try:
+                    return await asyncio.wait_for(self._request(bytes(cmd, 'ascii')), self.timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    self.close()
+                    return {"status": "timeout", "data": None}
+                except (OSError, EOFError):
+                    self.close()
+                    if attempt:
+                        raise
+
+    async def get(self, base, query='', tree=0):
+        response = await self.request("get\n{}\n{}\n{}\n".format(base, query, tree))
+        return response.get('data')
+
+    async def put(self, base, value='', query='', tree=0):
+        return await self.request("put\n{}\n{}\n{}\n{}\n".format(base, query, tree, json.dumps(value)))
+
+    def stats(self):
+        return {"connects": self.connects, "timeouts": self.timeouts}
@@ -0,0 +1,83 @@
+import os
+import socket
+import threading
+
+import profiler
+from metrics import registry as default_registry
+
+# the webapp asks main.py for its metrics and profiles on this socket
+DEBUG_SOCKET_PATH = "/tmp/lpp-client-debug.sock"
+MAX_REQUEST_SIZE = 1024
+REQUEST_TIMEOUT = 5.0
+
+class DebugServer:
+    """Answers metrics and profile requests about this process on a unix socket.
+
+    A request is a single line, "metrics" or "profile <seconds> [collapsed]",
+    and the answer is plain text, after which the connection is closed. Each
+    request gets its own thread, a profile blocks for as long as it samples and
+    only one runs at a time.
+    """
+    def __init__(self, path=DEBUG_SOCKET_PATH, registry=None, logger=None):
+        self.path = path
+        self.registry = registry or default_registry
+        self.logger = logger
+        self._profiling = threading.Lock()
+        self._sock = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen(8)
+        thread = threading.Thread(target=self._accept_loop, name="debug-server")
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            thread = threading.Thread(target=self._serve, args=(conn,), name="debug-request")
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, conn):
+        with conn:
+            try:
+                conn.settimeout(REQUEST_TIMEOUT)
+                request = b""
+                while b"\n" not in request and len(request) < MAX_REQUEST_SIZE:
+                    data = conn.recv(MAX_REQUEST_SIZE)
+                    if not data:
+                        break
+                    request += data
+                conn.settimeout(None)
+                conn.sendall(self.answer(request.decode("ascii", "replace").split()).encode())
+            except OSError as e:
+                if self.logger:
+                    self.logger.error(f"debug request failed: {e}")
+
+    def answer(self, args):
+        command = args[0].lower() if args else ""
+        if command == "metrics":
+            return self.registry.render()
+        if command == "profile":
+            try:
+                seconds = float(args[1]) if len(args) > 1 else 10.0
+            except ValueError:
+                return f"error: bad seconds {args[1]!r}\n"
+            if not self._profiling.acquire(blocking=False):
+                return "error: already profiling\n"
+            try:
+                if self.logger:
+                    self.logger.info(f"profiling for {seconds}s")
+                profile = profiler.sample(seconds)
+            finally:
+                self._profiling.release()
+            return profile.collapsed() if "collapsed" in args[2:] else profile.report()
+        return f"error: unknown request {' '.join(args)!r}\n"
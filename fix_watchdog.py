@@ -0,0 +1,135 @@
+import collections
+import threading
+import time
+
+from nmea_parser import FIX_QUALITY
+
+# what check() asks for when the corrections stall
+RESEND_CID = "resend-cid"
+RESPAWN_CLIENT = "respawn"
+RECOVERED = "recovered"
+
+DEFAULT_MAX_AGE = 30.0
+DEFAULT_RESPAWN_AFTER = 60.0
+# every respawn in a row that didn't bring the corrections back doubles the wait for the next one, up to this
+RESPAWN_AFTER_MAX = 3600.0
+# without a GGA for this long the fix state is counted as no-data
+NO_DATA_AFTER = 5.0
+NO_DATA = "no-data"
+EVENT_HISTORY = 20
+
+class FixWatchdog:
+    """Tracks the fix quality and correction age from the GGA sentences and escalates when corrections stall.
+
+    feed() is called with every GGA, check() about once a second. The
+    correction age is how long ago the last corrected fix (DGPS, RTK fixed or
+    float) had its corrections, its differential age included, so it keeps
+    growing when the fix falls back to GPS or the NMEA stream stops. Once it
+    passes max_age check() asks for a /CID re-send, if that doesn't bring the
+    corrections back within respawn_after seconds for a respawn of the client.
+    A client that hasn't run for max_age yet is left alone, and every respawn
+    in a row doubles respawn_after. Seconds spent in each fix state and the
+    last EVENT_HISTORY escalations are kept for snapshot(). feed() runs on
+    the NMEA reader, check() and snapshot() on other threads, they take a lock.
+    """
+    def __init__(self, max_age=DEFAULT_MAX_AGE, respawn_after=DEFAULT_RESPAWN_AFTER, corrected=(2, 4, 5)):
+        now = time.monotonic()
+        self._lock = threading.Lock()
+        self.corrected = corrected
+        self.configure(max_age, respawn_after)
+        self.state = NO_DATA
+        self.state_since = now
+        self.time_in_state = {}
+        self.last_gga = None
+        self.last_corrected = now
+        self.stage = None
+        self.stage_since = None
+        self.respawns_in_a_row = 0
+        self.resends = 0
+        self.respawns = 0
+        self.events = collections.deque(maxlen=EVENT_HISTORY)
+
+    def configure(self, max_age, respawn_after):
+        """A max_age of 0 disables escalation, fix states are still tracked"""
+        self.max_age = max_age
+        self.respawn_after = respawn_after
+
+    def feed(self, quality, diff_age, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.last_gga = now
+            if quality in self.corrected:
+                self.last_corrected = now - (diff_age or 0.0)
+            self._enter(FIX_QUALITY.get(quality, "unknown"), now)
+
+    def _enter(self, state, now):
+        if state != self.state:
+            self._account(now)
+            self.state = state
+
+    def _account(self, now):
+        self.time_in_state[self.state] = self.time_in_state.get(self.state, 0.0) + now - self.state_since
+        self.state_since = now
+
+    def correction_age(self, now=None):
+        now = time.monotonic() if now is None else now
+        return max(0.0, now - self.last_corrected)
+
+    def check(self, uptime, now=None):
+        """RESEND_CID, RESPAWN_CLIENT, RECOVERED or None, uptime is how long the current client has been running"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self._check(uptime, now)
+
+    def _check(self, uptime, now):
+        if self.last_gga is None or now - self.last_gga > NO_DATA_AFTER:
+            self._enter(NO_DATA, now)
+        self._account(now)
+        age = self.correction_age(now)
+        if not self.max_age or age <= self.max_age:
+            if self.stage is None:
+                return None
+            self.stage = None
+            self.respawns_in_a_row = 0
+            return self._event(RECOVERED, age, now)
+        if uptime < self.max_age:
+            # just (re)started, give it the time to get corrections first
+            return None
+        if self.stage is None:
+            self.stage = RESEND_CID
+            self.stage_since = now
+            self.resends += 1
+            return self._event(RESEND_CID, age, now)
+        if self.stage == RESEND_CID and now - self.stage_since >= self._respawn_wait():
+            # back to the first step, the new client gets its own max_age and /CID re-send before the next respawn
+            self.stage = RESPAWN_CLIENT
+            self.stage_since = now
+            self.respawns += 1
+            self.respawns_in_a_row += 1
+            return self._event(RESPAWN_CLIENT, age, now)
+        if self.stage == RESPAWN_CLIENT and uptime < now - self.stage_since:
+            # the respawned client is up, the ladder starts over
+            self.stage = None
+        return None
+
+    def _respawn_wait(self):
+        return min(RESPAWN_AFTER_MAX, self.respawn_after * 2 ** self.respawns_in_a_row)
+
+    def _event(self, event, age, now):
+        self.events.append({"time": time.time(), "event": event, "correction_age": round(age, 1), "fix": self.state})
+        return event
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            time_in_state = dict(self.time_in_state)
+            time_in_state[self.state] = time_in_state.get(self.state, 0.0) + now - self.state_since
+            return {
+                "fix": self.state,
+                "correction_age": round(self.correction_age(now), 1),
+                "stage": self.stage or "ok",
+                "resends": self.resends,
+                "respawns": self.respawns,
+                "time_in_state": {state: round(seconds, 1) for state, seconds in time_in_state.items()},
+                "events": list(self.events),
+            }
@@ -0,0 +1,201 @@
+import collections
+import ctypes
+import ctypes.util
+import os
+import select
+import threading
+
+RING_SIZE = 1000
+POLL_INTERVAL = 0.5
+# with inotify the file is still checked this often, in case an event got lost
+INOTIFY_CHECK_INTERVAL = 5.0
+READ_SIZE = 64 * 1024
+
+IN_MODIFY = 0x002
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+def inotify_watch(directory):
+    """Return an inotify fd watching directory, or None where inotify isn't available"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+class LogTailer:
+    """Follows a log file for any number of subscribers from a single reader thread.
+
+    Wakes up on inotify events for the log's directory, or polls every
+    POLL_INTERVAL where inotify isn't available. Rotation is detected by the
+    path pointing at a different inode: the rest of the old file is read
+    before switching to the new one. Every line gets an increasing id, and the
+    last ring_size lines are kept so new subscribers, or ones resuming from an
+    id, get the recent history first.
+    """
+    def __init__(self, path, ring_size=RING_SIZE, poll_interval=POLL_INTERVAL, logger=None):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.logger = logger
+        self.ring = collections.deque(maxlen=ring_size)
+        self.next_id = 1
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._file = None
+        self._inode = None
+        self._partial = b""
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+        self.rotations = 0
+        self.wakeups = 0
+
+    def start(self):
+        if self._thread is None:
+            self._inotify = inotify_watch(os.path.dirname(os.path.abspath(self.path)))
+            if self.logger:
+                self.logger.info(f"tailing {self.path} " + ("with inotify" if self._inotify is not None else f"every {self.poll_interval}s"))
+            self._thread = threading.Thread(target=self._run, name=f"log-tailer {self.path}")
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(INOTIFY_CHECK_INTERVAL + self.poll_interval)
+            self._thread = None
+        if self._inotify is not None:
+            os.close(self._inotify)
+            self._inotify = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def subscribe(self, callback, last_id=None):
+        """Call callback(lines) from the reader thread with every batch of new (id, line) pairs.
+
+        Returns the backlog to send first: the lines after last_id still in the
+        ring, or the whole ring when last_id is None or no longer known.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+            backlog = list(self.ring)
+        if last_id is not None and backlog and backlog[0][0] <= last_id < self.next_id:
+            backlog = backlog[last_id - backlog[0][0] + 1:]
+        return backlog
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "lines": self.next_id - 1,
+            "rotations": self.rotations,
+            "wakeups": self.wakeups,
+            "inotify": self._inotify is not None,
+        }
+
+    def _open(self):
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return False
+        self._file = f
+        self._inode = os.fstat(f.fileno()).st_ino
+        self._partial = b""
+        return True
+
+    def _read_all(self):
+        lines = []
+        while True:
+            data = self._file.read(READ_SIZE)
+            if not data:
+                break
+            data = self._partial + data
+            end = data.rfind(b"\n") + 1
+            self._partial = data[end:]
+            lines.extend(data[:end].decode("utf-8", errors="replace").splitlines())
+        return lines
+
+    def _check(self):
+        if self._file is None and not self._open():
+            return []
+        lines = self._read_all()
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return lines
+        if st.st_ino != self._inode:
+            # rotated, the old file is completely read now
+            self.rotations += 1
+            if self._partial:
+                lines.append(self._partial.decode("utf-8", errors="replace"))
+            self._file.close()
+            self._file = None
+            if self._open():
+                lines.extend(self._read_all())
+        elif st.st_size < self._file.tell():
+            # truncated in place
+            self._file.seek(0)
+            self._partial = b""
+            lines.extend(self._read_all())
+        return lines
+
+    def _publish(self, lines):
+        lines = [line for line in lines if line.strip()]
+        if not lines:
+            return
+        with self._lock:
+            batch = [(self.next_id + i, line) for i, line in enumerate(lines)]
+            self.next_id += len(lines)
+            self.ring.extend(batch)
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(batch)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"log subscriber failed: {e}")
+
+    def _wait(self):
+        if self._inotify is None:
+            return not self._stop.wait(self.poll_interval)
+        try:
+            readable, _, _ = select.select([self._inotify], [], [], INOTIFY_CHECK_INTERVAL)
+            if readable:
+                while os.read(self._inotify, READ_SIZE):
+                    pass
+        except BlockingIOError:
+            pass
+        except (OSError, ValueError):
+            if self._stop.is_set():
+                return False
+            # fall back to polling
+            self._inotify = None
+        return not self._stop.is_set()
+
+    def _run(self):
+        # start from the last ring_size lines instead of the whole file
+        if self._open():
+            size = os.fstat(self._file.fileno()).st_size
+            self._file.seek(max(0, size - self.ring.maxlen * 256))
+            if self._file.tell():
+                self._file.readline()
+        while True:
+            self._publish(self._check())
+            if not self._wait():
+                break
+            self.wakeups += 1
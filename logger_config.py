@@ -1,28 +1,100 @@
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 
 logger = logging.getLogger('lpp-client')
 logger.setLevel(logging.DEBUG)
 
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+# Records wait here for the listener thread, when it can't keep up they are dropped and counted
+LOG_QUEUE_SIZE = 10000
+# How long exiting waits for the listener to write what is still queued
+LOG_FLUSH_TIMEOUT = 2.0
+
+def env_level(name, default=logging.DEBUG):
+    """Level from an environment variable like LOG_LEVEL_FILE=INFO, LOG_LEVEL applies to every handler"""
+    value = os.environ.get(name) or os.environ.get('LOG_LEVEL')
+    if not value:
+        return default
+    level = int(value) if value.isdigit() else logging.getLevelName(value.upper())
+    return level if isinstance(level, int) else default
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler on a bounded queue that drops records instead of blocking when it is full.
+
+    With a reserve it already drops once fewer than that many places are left,
+    so another handler on the same queue always has those for its records.
+    """
+    def __init__(self, q, reserve=0):
+        super().__init__(q)
+        self.reserve = reserve
+        self.records = 0
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            if self.reserve and self.queue.qsize() >= self.queue.maxsize - self.reserve:
+                raise queue.Full
+            self.queue.put_nowait(record)
+            self.records += 1
+        except queue.Full:
+            self.dropped += 1
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """QueueListener that still stops when its queue is full"""
+    def enqueue_sentinel(self):
+        try:
+            self.queue.put(self._sentinel, timeout=LOG_FLUSH_TIMEOUT)
+        except queue.Full:
+            pass
+
+# The handlers that do the actual writing, by name so their levels can be changed
+handlers = {}
+
 # File handler
 LOG_PATH = './log/main.txt'
 file_handler = logging.handlers.RotatingFileHandler(LOG_PATH, maxBytes=1024 * 1024 * 8, backupCount=1)
-file_handler.setLevel(logging.DEBUG)
+file_handler.setLevel(env_level('LOG_LEVEL_FILE'))
 file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+handlers['file'] = file_handler
 
 # Stream handler for stderr
 stream_handler = logging.StreamHandler()
-stream_handler.setLevel(logging.DEBUG)
+stream_handler.setLevel(env_level('LOG_LEVEL_STDERR'))
 stream_handler.setFormatter(formatter)
-logger.addHandler(stream_handler)
+handlers['stderr'] = stream_handler
 
 # Stream handler for syslog
 if os.path.exists('/dev/log'):
     syslog_handler = logging.handlers.SysLogHandler(address='/dev/log')
-    syslog_handler.setLevel(logging.DEBUG)
+    syslog_handler.setLevel(env_level('LOG_LEVEL_SYSLOG'))
     syslog_handler.setFormatter(formatter)
-    logger.addHandler(syslog_handler)
\ No newline at end of file
+    handlers['syslog'] = syslog_handler
+
+# Logging calls only queue the record, a single listener thread formats and writes it to every handler
+queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+logger.addHandler(queue_handler)
+listener = FlushingQueueListener(queue_handler.queue, *handlers.values(), respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+def update_logger_level():
+    # nothing below the lowest handler level gets written, so don't bother queueing it
+    logger.setLevel(min(handler.level for handler in handlers.values()))
+
+def set_level(name, level):
+    """Change the level of one handler ('file', 'stderr' or 'syslog')"""
+    handlers[name].setLevel(level)
+    update_logger_level()
+
+def stats():
+    return {
+        "queued": queue_handler.queue.qsize(),
+        "dropped": queue_handler.dropped,
+        "levels": {name: logging.getLevelName(handler.level) for name, handler in handlers.items()},
+    }
+
+update_logger_level()
@@ -1,22 +1,100 @@
+import asyncio
 import socket
 import time
 import threading
 import subprocess
 import shlex
 import os
+import random
+import collections
+import selectors
 
-from logger_config import logger
+from logger_config import logger, queue_handler as log_queue_handler
 
-from csclient import CSClient
-cs = CSClient("lpp-client", logger=logger)
+from csclient import EventingCSClient, AsyncCSClient
+from change_monitor import ChangeMonitor, AsyncChangeMonitor, APPDATA_PATH, PRIMARY_DEVICE_PATH, DIAGNOSTICS_PATH, cell_identity
+from nmea_window import NmeaWindow
+from nmea_sources import NmeaSources
+from nmea_parser import NmeaParser
+from nmea_filter import Subscription, sentence_id, ALL
+from tcp_broadcast import NmeaBroadcaster, DEFAULT_QUEUE_SIZE, DEFAULT_MAX_CLIENTS, DEFAULT_STALL_TIMEOUT, DROP_OLDEST, SLOW_CLIENT_POLICIES
+from async_broadcast import AsyncNmeaBroadcaster
+from nmea_ipc import NMEA_IPC_PATH, IPC_QUEUE_SIZE, IPC_MAX_CLIENTS, fix_message
+from cs_publisher import CSPublisher, AsyncCSPublisher, DEFAULT_PUBLISH_HZ
+from nmea_recorder import NmeaRecorder, ZLIB, COMPRESSIONS
+from nmea_checksum import ChecksumValidator, CHECKSUM_MODES, DROP as CHECKSUM_DROP
+from fix_watchdog import FixWatchdog, RESEND_CID, RESPAWN_CLIENT, RECOVERED, DEFAULT_MAX_AGE, DEFAULT_RESPAWN_AFTER
+from child_output import ChildOutput
+from metrics import registry
+from debug_server import DebugServer, DEBUG_SOCKET_PATH
+from reload_planner import plan_reload, CONTROL, RESPAWN, RESTART
+cs = EventingCSClient("lpp-client", logger=logger)
+# the asyncio runtime's config store puts
+async_cs = AsyncCSClient()
+# everything connected to the NMEA unix socket
+producers = NmeaSources(logger=logger)
 
-MAX_TCP_CONNECTIONS = 5
+nmea_sentences = registry.counter("nmea_sentences_total", "NMEA sentences received, by sentence ID", "sentence")
+nmea_bytes_in = registry.counter("nmea_bytes_in_total", "Bytes received from the NMEA producer")
+cs_put_seconds = registry.histogram("cs_put_seconds", "Config store put latency")
+registry.counter("cs_appdata_hits_total", "Appdata lookups answered from the cached snapshot", func=lambda: cs.appdata_hits)
+registry.counter("cs_appdata_fetches_total", "Appdata lists fetched from the config store", func=lambda: cs.appdata_fetches)
+binary_frames = registry.counter("nmea_binary_frames_total", "UBX and RTCM frames received, by message", "message")
+cid_updates = registry.counter("cid_updates_total", "/CID cell updates written to the LPP client")
+registry.counter("log_records_total", "Log records queued", func=lambda: log_queue_handler.records)
+registry.counter("log_records_dropped_total", "Log records dropped because the log queue was full", func=lambda: log_queue_handler.dropped)
+
+DEFAULT_CS_POOL_SIZE = 1
+# how main() runs its subsystems: a thread each, or all of them on one asyncio event loop
+THREADS = "threads"
+ASYNCIO = "asyncio"
+RUNTIMES = (THREADS, ASYNCIO)
+# the LPP client writes its NMEA output to this unix socket, other producers may connect too
+NMEA_SOCKET_PATH = "/tmp/nmea.sock"
+NMEA_LISTEN_BACKLOG = 16
+# what the v4 client writes to the NMEA socket, joined with +; ubx and rtcm are framed and passed on to TCP clients
+EXPORT_FORMATS = ("nmea", "ubx", "rtcm")
+DEFAULT_EXPORT_FORMAT = "nmea"
+# appdata snapshots can live longer when change events keep them up to date
+APPDATA_EVENT_TTL = 30.0
+# GGA qualities that mean the corrections are being used: DGPS, RTK fixed, RTK float
+CORRECTED_FIX_QUALITIES = (2, 4, 5)
+# NMEA recorder defaults, in MB and minutes like the appdata keys
+DEFAULT_RECORD_SEGMENT_MB = 4
+DEFAULT_RECORD_SEGMENT_MINUTES = 60
+DEFAULT_RECORD_BUDGET_MB = 64
+# how often the fix watchdog looks at the correction age
+WATCHDOG_INTERVAL = 1.0
+
+# restarting a child that exited on its own, the delay doubles on every exit in a row
+RESTART_BACKOFF_MIN = 0.5
+RESTART_BACKOFF_MAX = 30.0
+RESTART_JITTER = 0.2
+# a child that ran at least this long was healthy, the next exit starts the backoff over
+STABLE_UPTIME = 60.0
+# this many exits within the window is a crash loop, give up and leave it to supervisord
+CRASH_LOOP_EXITS = 5
+CRASH_LOOP_WINDOW = 120.0
+EXIT_HISTORY = 20
+# how long to wait for the rest of the output of a program that exited
+OUTPUT_DRAIN_TIMEOUT = 2.0
+# longest line of program output the asyncio runtime reads in one piece
+OUTPUT_LINE_LIMIT = 1024 * 1024
 
 class RunProgram:
     def __init__(self, cmd):
         self.cmd = cmd
         self.process = None
         self.output_thread = None
+        self.respawn_requested = False
+        self.stopping = False
+        self.replay = None
+        self._wakeup = threading.Event()
+        self.started = None
+        self.restarts = 0
+        self.crashes = 0
+        self.exits = collections.deque(maxlen=EXIT_HISTORY)
+        self.output = ChildOutput(logger)
     
     def quit(self):
         if self.process:
@@ -27,31 +105,101 @@ class RunProgram:
         if self.process:
             self.process.send_signal(subprocess.signal.SIGINT)
 
-    def write(self, data):
+    def write(self, data, replay=False):
+        """Write to the program's control input, with replay the line is sent again to every restarted program"""
+        if replay:
+            self.replay = data
         if self.process:
-            self.process.stdin.write(data)
-            self.process.stdin.flush()
+            try:
+                self.process.stdin.write(data.encode())
+                self.process.stdin.flush()
+            except OSError as e:
+                logger.error(f"failed writing to program: {e}")
+
+    def respawn(self, cmd):
+        """Stop the program and have run() start it again with a new command line"""
+        self.cmd = cmd
+        self.respawn_requested = True
+        self._wakeup.set()
+        self.interrupt()
+
+    def stop(self):
+        """Stop the program and make run() return instead of restarting it"""
+        self.stopping = True
+        self._wakeup.set()
+        self.interrupt()
+
+    def uptime(self):
+        return time.monotonic() - self.started if self.started is not None and self.process else 0.0
+
+    def stats(self):
+        return {
+            "uptime": self.uptime(),
+            "restarts": self.restarts,
+            "crashes": self.crashes,
+            "exit_codes": [code for _, code in self.exits],
+            "output": self.output.stats(),
+        }
+
+    def _backoff(self, failures):
+        delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_MIN * 2 ** (failures - 1))
+        return delay * random.uniform(1 - RESTART_JITTER, 1 + RESTART_JITTER)
+
+    def _crash_loop(self, now):
+        recent = [t for t, _ in self.exits if now - t <= CRASH_LOOP_WINDOW]
+        return len(recent) >= CRASH_LOOP_EXITS
+
+    def run(self):
+        """Run the program, restarting it in-process until stop() is called or it is crash looping.
+
+        A requested respawn starts the new command line right away. An exit the
+        program decided on by itself is restarted after a jittered, exponentially
+        growing delay, which starts over once a program stayed up for STABLE_UPTIME.
+        """
+        self._failures = 0
+        while True:
+            started = time.monotonic()
+            return_code = self.start()
+            delay = self._next_start(started, return_code)
+            if delay is None:
+                return return_code
+            if delay:
+                self._wakeup.clear()
+                self._wakeup.wait(delay)
+                if self.stopping:
+                    return return_code
+            self.respawn_requested = False
+            self.restarts += 1
+
+    def _next_start(self, started, return_code):
+        """After the program exited: None to stop, otherwise the delay before starting it again"""
+        now = time.monotonic()
+        if self.stopping:
+            return None
+        if self.respawn_requested:
+            self._failures = 0
+            logger.info(f"Respawning program: {self.cmd}")
+            return 0.0
+        self.crashes += 1
+        self.exits.append((now, return_code))
+        if self._crash_loop(now):
+            logger.error(f"Program is crash looping, {CRASH_LOOP_EXITS} exits within {CRASH_LOOP_WINDOW:.0f}s: {self.stats()}")
+            return None
+        self._failures = 1 if now - started >= STABLE_UPTIME else self._failures + 1
+        delay = self._backoff(self._failures)
+        logger.warning(f"Program exited with {return_code} after {now - started:.1f}s, restarting in {delay:.1f}s ({self.stats()})")
+        return delay
 
     def start(self):
         try:
             # Start the external program and capture its output
-            self.process = subprocess.Popen(shlex.split(self.cmd), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=0)
+            self.process = subprocess.Popen(shlex.split(self.cmd), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.started = time.monotonic()
+            if self.replay:
+                self.write(self.replay)
 
-            # Create a thread to read and print the program's output
-            def output_thread():
-                while True:
-                    if not self.process:
-                        break
-                    try:
-                        for line in iter(self.process.stdout.readline, ''):
-                            logger.info(line.rstrip())
-                            if not self.process:
-                                break
-                    except UnicodeDecodeError as e:
-                        logger.error(f"bad output: {e}")
-                        continue
-
-            output_thread = threading.Thread(target=output_thread)
+            # Create a thread to read the program's output, binary and buffered, into the log
+            output_thread = threading.Thread(target=self.output.read, args=(self.process.stdout,))
             output_thread.daemon = True
             output_thread.start()
 
@@ -59,10 +207,7 @@ class RunProgram:
             return_code = self.process.wait()
 
             # Ensure all remaining output is read
-            remaining_output = self.process.stdout.read()
-            if remaining_output:
-                for line in remaining_output.splitlines():
-                    logger.info(line.rstrip())
+            output_thread.join(OUTPUT_DRAIN_TIMEOUT)
 
             logger.info(f"Program exited with return code {return_code}")
 
@@ -74,68 +219,337 @@ class RunProgram:
         finally:
             self.process = None
 
-def handle_nmea(nmea, data=None, cs_path="/status/rtk/nmea"):
-    if data is None:
-        data = {}
-    t = time.time()
-    # prune data to last 30 seconds
-    data = {k: v for k, v in data.items() if (t - k) < 30}
-    data[t] = nmea
-    cs_data = list(data.values())
-    cs_put(cs_path, cs_data)
-    return data
-
-def handle_nmea_tcp(nmea, tcp_clients):
-    for client in tcp_clients:
+class AsyncRunProgram(RunProgram):
+    """RunProgram on an asyncio event loop, which reads and writes the program's pipes instead of a thread per program.
+
+    Everything but uptime() and stats() must be called from the loop's thread.
+    """
+    def __init__(self, cmd):
+        super().__init__(cmd)
+        self._wakeup = asyncio.Event()
+
+    def write(self, data, replay=False):
+        """Write to the program's control input, with replay the line is sent again to every restarted program"""
+        if replay:
+            self.replay = data
+        if self.process:
+            try:
+                self.process.stdin.write(data.encode())
+            except (OSError, RuntimeError) as e:
+                logger.error(f"failed writing to program: {e}")
+
+    async def run(self):
+        """RunProgram.run() for the loop"""
+        self._failures = 0
+        while True:
+            started = time.monotonic()
+            return_code = await self.start()
+            delay = self._next_start(started, return_code)
+            if delay is None:
+                return return_code
+            if delay:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                if self.stopping:
+                    return return_code
+            self.respawn_requested = False
+            self.restarts += 1
+
+    async def start(self):
         try:
-            client.sendall((nmea+ '\r\n').encode())
-        except:
-            tcp_clients.remove(client)
-
-def un_thread_server(cs_path="/status/rtk/nmea", tcp_clients=[], log_messages=True):
-    """ Thread for reading from unix socket and logging the output"""
-    socket_path = "/tmp/nmea.sock"
-    data = {}
+            self.process = await asyncio.create_subprocess_exec(*shlex.split(self.cmd), stdin=subprocess.PIPE,
+                                                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                                limit=OUTPUT_LINE_LIMIT)
+            self.started = time.monotonic()
+            if self.replay:
+                self.write(self.replay)
+            output = asyncio.get_running_loop().create_task(self._read_output(self.process.stdout))
+            return_code = await self.process.wait()
+            try:
+                await asyncio.wait_for(output, OUTPUT_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            logger.info(f"Program exited with return code {return_code}")
+            return return_code
+        except Exception as e:
+            logger.exception(f"{e}")
+            if self.process and self.process.returncode is None:
+                # don't leave it running on its own once run() starts another one
+                self.process.kill()
+                await self.process.wait()
+            return -1
+        finally:
+            self.process = None
+
+    async def _read_output(self, stream):
+        feed = self.output.feed
+        skipping = False
+        while True:
+            try:
+                raw = await stream.readuntil(b"\n")
+            except asyncio.IncompleteReadError as e:
+                # end of output, the last line may have no newline
+                if e.partial and not skipping:
+                    feed(e.partial)
+                return
+            except asyncio.LimitOverrunError as e:
+                # a line longer than the limit, the start of it is logged and the rest skipped up to its newline
+                chunk = await stream.read(e.consumed)
+                if not skipping:
+                    feed(chunk)
+                    logger.warning(f"program output line longer than {OUTPUT_LINE_LIMIT} bytes, logged truncated")
+                skipping = True
+                continue
+            if skipping:
+                skipping = False
+                continue
+            feed(raw)
+
+def handle_nmea(nmea, window, publisher):
+    window.push(nmea)
+    publisher.mark_dirty()
+
+def handle_nmea_tcp(nmea, sid, broadcaster):
+    if broadcaster:
+        broadcaster.broadcast((nmea + '\r\n').encode(), sid)
+
+class NmeaPipeline:
+    """Everything that happens to an NMEA sentence once it has been read from the unix socket.
+
+    Owns the config store window, the parsed fix record and their publishers and the NMEA recorder, and feeds
+    the TCP broadcaster and the webapp's IPC socket. configure() applies new params in place, so a params change doesn't have to
+    tear any of it down.
+    """
+    def __init__(self, params, broadcaster=None, ipc=None):
+        self.window = NmeaWindow()
+        self.parser = NmeaParser()
+        self.broadcaster = broadcaster
+        self.ipc = ipc
+        self.publisher = None
+        self.fix_publisher = None
+        self.watchdog_publisher = None
+        self.recorder = None
+        self.checksum = ChecksumValidator(params["nmea_checksum"])
+        self.watchdog = FixWatchdog(params["watchdog_age"], params["watchdog_respawn_after"], CORRECTED_FIX_QUALITIES)
+        self.reload_started = None
+        self.reload_reason = None
+        self.configure(params)
+
+    def configure(self, params):
+        self.log_messages = params["log_nmea"]
+        self.cs_subscription = Subscription(params["cs_sentences"])
+        self.publisher = self._publisher(self.publisher, params["cs_path"], self.window.snapshot, params["cs_publish_hz"])
+        self.fix_publisher = self._publisher(self.fix_publisher, params["fix_path"], self.parser.snapshot, params["cs_publish_hz"])
+        self.watchdog_publisher = self._publisher(self.watchdog_publisher, params["watchdog_path"], self.watchdog.snapshot,
+                                                  params["cs_publish_hz"])
+        self.recorder = self._recorder(self.recorder, params)
+        self.checksum.mode = params["nmea_checksum"]
+        self.watchdog.configure(params["watchdog_age"], params["watchdog_respawn_after"])
+        if self.broadcaster:
+            self.broadcaster.configure(queue_size=params["tcp_queue_size"], policy=params["tcp_slow_client"],
+                                       max_clients=params["tcp_max_clients"], stall_timeout=params["tcp_stall_timeout"],
+                                       subscription=Subscription(params["tcp_sentences"]))
+
+    def _publisher(self, publisher, path, snapshot, publish_hz):
+        if publisher is not None:
+            if publisher.path == path:
+                publisher.set_rate(publish_hz)
+                return publisher
+            publisher.stop(flush=False)
+        if not path:
+            return None
+        return self._new_publisher(path, snapshot, publish_hz)
+
+    def _new_publisher(self, path, snapshot, publish_hz):
+        return CSPublisher(path, snapshot, cs_put, max_hz=publish_hz, logger=logger).start()
+
+    @staticmethod
+    def _recorder(recorder, params):
+        settings = dict(directory=params["record_path"],
+                        segment_bytes=int(params["record_segment_mb"] * 1024 * 1024),
+                        segment_seconds=params["record_segment_minutes"] * 60,
+                        budget_bytes=int(params["record_budget_mb"] * 1024 * 1024),
+                        compression=params["record_compression"])
+        if recorder is not None:
+            if all(getattr(recorder, key) == value for key, value in settings.items()):
+                return recorder
+            recorder.stop()
+        if not settings["directory"]:
+            return None
+        return NmeaRecorder(**settings, logger=logger).start()
+
+    def publishers(self):
+        return (self.publisher, self.fix_publisher, self.watchdog_publisher)
+
+    def stop(self):
+        if self.recorder:
+            self.recorder.stop()
+            self.recorder = None
+
+    def mark_reload(self, reason):
+        """Start timing how long it takes to get a corrected fix again"""
+        self.reload_started = time.monotonic()
+        self.reload_reason = reason
+
+    def validate(self, lines):
+        """The sentences of one read that pass the checksum check, quarantined ones only go to the log and recorder"""
+        checksum = self.checksum
+        lines = checksum.check(lines)
+        rejected = checksum.take_rejected()
+        if rejected:
+            recorder = self.recorder
+            for line in rejected:
+                logger.warning(f"quarantined NMEA sentence with a bad checksum: {line}")
+                if recorder:
+                    recorder.record(line)
+        return lines
+
+    def handle(self, line, source=None):
+        """Handle one sentence, source is the name of the producer it came from"""
+        # check to see if the line starts with $ (or ! for encapsulated sentences like AIS) if not, add a $
+        if line[0] not in '$!':
+            line = f'${line}'
+        if self.log_messages:
+            logger.info(line)
+        recorder = self.recorder
+        if recorder:
+            recorder.record(line)
+        sid = sentence_id(line)
+        nmea_sentences.inc(1, sid)
+        publisher = self.publisher
+        if publisher and self.cs_subscription.accepts(sid):
+            handle_nmea(line, self.window, publisher)
+        ipc = self.ipc if self.ipc and self.ipc.clients else None
+        if ipc:
+            handle_nmea_tcp(line, sid, ipc)
+        changed = self.parser.feed(line, sid)
+        if sid.endswith("GGA"):
+            # every GGA, a receiver without a fix repeats the same one each epoch
+            self.watchdog.feed(self.parser.state.get("quality"), self.parser.state.get("diff_age"))
+        if changed:
+            if source is not None:
+                self.parser.state["source"] = source
+            if self.fix_publisher:
+                self.fix_publisher.mark_dirty()
+            if ipc:
+                ipc.broadcast(fix_message(self.parser.state))
+            if self.reload_started is not None and self.parser.state.get("quality") in CORRECTED_FIX_QUALITIES:
+                logger.info(f"first corrected fix ({self.parser.state.get('fix')}) {time.monotonic() - self.reload_started:.1f}s after {self.reload_reason}")
+                self.reload_started = None
+        handle_nmea_tcp(line, sid, self.broadcaster)
+
+    def check_watchdog(self, program, cellular):
+        """Act on the fix watchdog, cellular is the cell the program started with"""
+        event = self.watchdog.check(program.uptime())
+        if event is None:
+            return
+        age = self.watchdog.correction_age()
+        if event == RESEND_CID:
+            # the last /CID written, if the cell never changed the program still has the one it started with
+            logger.warning(f"no corrections for {age:.0f}s ({self.watchdog.state}), re-sending /CID")
+            program.write(program.replay or cid_command(cellular))
+            cid_updates.inc()
+        elif event == RESPAWN_CLIENT:
+            logger.warning(f"no corrections for {age:.0f}s ({self.watchdog.state}) after a /CID re-send, respawning the client")
+            program.respawn(program.cmd)
+            self.mark_reload("watchdog")
+        elif event == RECOVERED:
+            logger.info(f"corrections are back ({self.watchdog.state})")
+        if self.watchdog_publisher:
+            self.watchdog_publisher.mark_dirty()
+
+    def handle_binary(self, frame, sid):
+        """Pass a UBX or RTCM frame on untouched to the TCP clients that subscribed to it"""
+        binary_frames.inc(1, sid)
+        if self.broadcaster:
+            self.broadcaster.broadcast_binary(frame, sid)
+
+class AsyncNmeaPipeline(NmeaPipeline):
+    """NmeaPipeline whose config store publishers are tasks on the running event loop"""
+    def _new_publisher(self, path, snapshot, publish_hz):
+        return AsyncCSPublisher(path, snapshot, cs_put_async, max_hz=publish_hz, logger=logger).start()
+
+def handle_producer(pipeline, source, n):
+    """Pass on the sentences and binary frames completed by n bytes just received from source"""
+    nmea_bytes_in.inc(n)
+    framer = source.framer
+    lines = framer.frames()
+    source.received(n, len(lines), time.monotonic())
+    if lines:
+        lines = pipeline.validate(lines)
+    handle = pipeline.handle
+    name = source.name
+    for line in lines:
+        handle(line, name)
+    for sid, frame in framer.take_binary():
+        pipeline.handle_binary(frame, sid)
+
+def watchdog_thread(pipeline, program, cellular, stopped):
+    """Check the fix watchdog every WATCHDOG_INTERVAL until stopped is set"""
+    while not stopped.wait(WATCHDOG_INTERVAL):
+        pipeline.check_watchdog(program, cellular)
+
+async def watchdog_task(pipeline, program, cellular):
+    """watchdog_thread() for the loop, runs until cancelled"""
+    while True:
+        await asyncio.sleep(WATCHDOG_INTERVAL)
+        pipeline.check_watchdog(program, cellular)
+
+class NmeaProtocol(asyncio.BufferedProtocol):
+    """A producer connection for the asyncio runtime, the loop receives straight into the producer's framer"""
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.source = None
+
+    def connection_made(self, transport):
+        self.source = producers.connect(transport.get_extra_info("socket"))
+
+    def get_buffer(self, sizehint):
+        return self.source.framer.buffer()
+
+    def buffer_updated(self, nbytes):
+        self.source.framer.advance(nbytes)
+        handle_producer(self.pipeline, self.source, nbytes)
+
+    def connection_lost(self, exc):
+        producers.disconnect(self.source)
+
+async def serve_nmea(pipeline, socket_path=NMEA_SOCKET_PATH):
     if os.path.exists(socket_path):
         os.unlink(socket_path)
+    return await asyncio.get_running_loop().create_unix_server(lambda: NmeaProtocol(pipeline), socket_path,
+                                                               backlog=NMEA_LISTEN_BACKLOG)
+
+def un_thread_server(pipeline, socket_path=NMEA_SOCKET_PATH):
+    """Thread reading every producer connected to the unix socket, their sentences go on in the order they arrive"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    selector = selectors.DefaultSelector()
     with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as unix_socket:
         unix_socket.bind(socket_path)
-        unix_socket.listen(1)
-        while True:
-            client_socket, addr = unix_socket.accept()
-            with client_socket:
-                buffer = ""
-                while True:
-                    chunk = client_socket.recv(8192)
-                    try:
-                        chunk = chunk.decode()
-                    except UnicodeDecodeError:
-                        logger.error(f"failed decoding chunk as utf-8 {chunk}")
-                        chunk = None
-                    if not chunk:
-                        break
-                    buffer += chunk
-                    while '\r\n' in buffer:
-                        line, buffer = buffer.split('\r\n', 1)
-                        if line:
-                            # check to see if the line starts with $ if not, add it
-                            if line[0] !='$':
-                                line = f'${line}'
-                            if log_messages:
-                                logger.info(line)
-                            if cs_path:
-                                data = handle_nmea(line, data=data, cs_path=cs_path)
-                            handle_nmea_tcp(line, tcp_clients)
-
-def tcp_server_thread(port, tcp_clients):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as tcp_socket:
-        tcp_socket.bind(('0.0.0.0', port))
-        tcp_socket.listen(MAX_TCP_CONNECTIONS)
-        logger.info(f"TCP server listening on port {port}")
+        unix_socket.listen(NMEA_LISTEN_BACKLOG)
+        selector.register(unix_socket, selectors.EVENT_READ)
         while True:
-            client_socket, addr = tcp_socket.accept()
-            logger.info(f"TCP client connected from {addr}")
-            tcp_clients.append(client_socket)
+            for key, _ in selector.select():
+                if key.fileobj is unix_socket:
+                    client_socket, _ = unix_socket.accept()
+                    selector.register(client_socket, selectors.EVENT_READ, producers.connect(client_socket))
+                    continue
+                source = key.data
+                try:
+                    n = source.framer.recv_into(key.fileobj)
+                except OSError as e:
+                    logger.error(f"nmea producer {source.name} failed: {e}")
+                    n = 0
+                if not n:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    producers.disconnect(source)
+                    continue
+                handle_producer(pipeline, source, n)
 
 def cs_get(path):
     try:
@@ -149,7 +563,24 @@ def cs_get(path):
 def cs_put(path, value):
     try:
         if cs.ON_DEVICE:
-            return cs.put(path, value)
+            start = time.monotonic()
+            try:
+                return cs.put(path, value)
+            finally:
+                cs_put_seconds.observe(time.monotonic() - start)
+        else:
+            raise Exception("Not on device")
+    except Exception as e:
+        logger.error(f"failed putting to {path} in CS: {e}")
+
+async def cs_put_async(path, value):
+    try:
+        if cs.ON_DEVICE:
+            start = time.monotonic()
+            try:
+                return await async_cs.put(path, value)
+            finally:
+                cs_put_seconds.observe(time.monotonic() - start)
         else:
             raise Exception("Not on device")
     except Exception as e:
@@ -162,9 +593,58 @@ def get_appdata(key):
     except Exception as e:
         logger.error(f"failed getting appdata {key}: {e}")
 
+def get_appdata_number(key, default, cast=int):
+    value = get_appdata(key) or default
+    try:
+        return cast(value)
+    except ValueError:
+        logger.error(f"invalid {key}: {value}")
+        return default
+
+def get_subscription(key):
+    spec = get_appdata(key) or ALL
+    try:
+        return Subscription(spec).spec
+    except ValueError as e:
+        logger.error(f"invalid {key}: {e}")
+        return ALL
+
+def get_modem_device():
+    return get_appdata("lpp-client.device") or cs_get(PRIMARY_DEVICE_PATH)
+
+def appdata_changed(appdata):
+    # the event carries the new appdata list, serve lookups from it without a fetch
+    cs.invalidate_appdata(appdata)
+    return True
+
+def watch_cell_changes(monitor, device):
+    """Wake the monitor when the serving cell of device changes, not on every diagnostics update.
+
+    Returns the diagnostics path, or None without a device. Until that path is registered for the monitor
+    keeps polling at its adaptive interval, so a handover is still picked up in seconds.
+    """
+    # the placeholder for a device that isn't known yet
+    monitor.unwatch(DIAGNOSTICS_PATH)
+    if not device:
+        monitor.expect(DIAGNOSTICS_PATH)
+        return None
+    path = DIAGNOSTICS_PATH.format(device)
+    last = {"cell": cell_identity(cs_get(path))}
+
+    def cell_changed(diag):
+        cell = cell_identity(diag)
+        if cell is not None and cell == last["cell"]:
+            return False
+        last["cell"] = cell
+        return True
+
+    if not monitor.watch(path, cell_changed):
+        logger.warning(f"not watching {path}, polling for cell changes")
+    return path
+
 def get_cellular_info(device=None):
     if device is None:
-        device = get_appdata("lpp-client.device") or cs_get("/status/wan/primary_device")
+        device = get_modem_device()
     if not (device and device.startswith("mdm")):
         logger.warning(f"primary_device is not a modem: {device}")
     
@@ -224,6 +704,8 @@ def get_cmd_params():
     # "confidence-95to39,ura-override=2,ublox-clock-correction,force-continuity,sf055-default=3,sf042-default=1,increasing-siou"
     cs_path = get_appdata("lpp-client.path")
     cs_path = "/status/rtk/nmea" if  cs_path is None else cs_path
+    fix_path = get_appdata("lpp-client.fix_path")
+    fix_path = "/status/rtk/fix" if fix_path is None else fix_path
 
     tokoro_flags = get_appdata("lpp-client.tokoro_flags") or ""
     spartn_flags = get_appdata("lpp-client.spartn_flags") or ""
@@ -236,6 +718,48 @@ def get_cmd_params():
         elif log_nmea_value.lower() in ["false", "no", "n"]:
             log_nmea = False
 
+    cs_publish_hz = get_appdata_number("lpp-client.cs_publish_hz", DEFAULT_PUBLISH_HZ, float)
+    cs_pool_size = get_appdata_number("lpp-client.cs_pool_size", DEFAULT_CS_POOL_SIZE)
+
+    tcp_queue_size = get_appdata_number("lpp-client.tcp_queue_size", DEFAULT_QUEUE_SIZE)
+    tcp_slow_client = get_appdata("lpp-client.tcp_slow_client") or DROP_OLDEST
+    if tcp_slow_client not in SLOW_CLIENT_POLICIES:
+        logger.error(f"invalid tcp_slow_client: {tcp_slow_client}")
+        tcp_slow_client = DROP_OLDEST
+    cs_sentences = get_subscription("lpp-client.cs_sentences")
+    tcp_sentences = get_subscription("lpp-client.tcp_sentences")
+    tcp_max_clients = get_appdata_number("lpp-client.tcp_max_clients", DEFAULT_MAX_CLIENTS)
+    tcp_stall_timeout = get_appdata_number("lpp-client.tcp_stall_timeout", DEFAULT_STALL_TIMEOUT, float)
+
+    runtime = get_appdata("lpp-client.runtime") or THREADS
+    if runtime not in RUNTIMES:
+        logger.error(f"invalid runtime: {runtime}")
+        runtime = THREADS
+
+    export_format = (get_appdata("lpp-client.export_format") or DEFAULT_EXPORT_FORMAT).replace(" ", "").lower()
+    if not export_format or any(f not in EXPORT_FORMATS for f in export_format.split("+")):
+        logger.error(f"invalid export_format: {export_format}")
+        export_format = DEFAULT_EXPORT_FORMAT
+
+    watchdog_age = get_appdata_number("lpp-client.watchdog_age", DEFAULT_MAX_AGE, float)
+    watchdog_respawn_after = get_appdata_number("lpp-client.watchdog_respawn_after", DEFAULT_RESPAWN_AFTER, float)
+    watchdog_path = get_appdata("lpp-client.watchdog_path")
+    watchdog_path = "/status/rtk/watchdog" if watchdog_path is None else watchdog_path
+
+    nmea_checksum = get_appdata("lpp-client.nmea_checksum") or CHECKSUM_DROP
+    if nmea_checksum not in CHECKSUM_MODES:
+        logger.error(f"invalid nmea_checksum: {nmea_checksum}")
+        nmea_checksum = CHECKSUM_DROP
+
+    record_path = get_appdata("lpp-client.record_path") or ""
+    record_segment_mb = get_appdata_number("lpp-client.record_segment_mb", DEFAULT_RECORD_SEGMENT_MB, float)
+    record_segment_minutes = get_appdata_number("lpp-client.record_segment_minutes", DEFAULT_RECORD_SEGMENT_MINUTES, float)
+    record_budget_mb = get_appdata_number("lpp-client.record_budget_mb", DEFAULT_RECORD_BUDGET_MB, float)
+    record_compression = get_appdata("lpp-client.record_compression") or ZLIB
+    if record_compression not in COMPRESSIONS:
+        logger.error(f"invalid record_compression: {record_compression}")
+        record_compression = ZLIB
+
     return {
         "host": host,
         "port": port,
@@ -243,6 +767,7 @@ def get_cmd_params():
         "baud": baud,
         "output": output,
         "cs_path": cs_path,
+        "fix_path": fix_path,
         "format": format,
         "starting_mcc": starting_mcc,
         "starting_mnc": starting_mnc,
@@ -253,6 +778,25 @@ def get_cmd_params():
         "tokoro_flags": tokoro_flags,
         "spartn_flags": spartn_flags,
         "log_nmea": log_nmea,
+        "cs_publish_hz": cs_publish_hz,
+        "cs_pool_size": cs_pool_size,
+        "tcp_queue_size": tcp_queue_size,
+        "tcp_slow_client": tcp_slow_client,
+        "tcp_max_clients": tcp_max_clients,
+        "tcp_stall_timeout": tcp_stall_timeout,
+        "cs_sentences": cs_sentences,
+        "tcp_sentences": tcp_sentences,
+        "export_format": export_format,
+        "nmea_checksum": nmea_checksum,
+        "watchdog_age": watchdog_age,
+        "watchdog_respawn_after": watchdog_respawn_after,
+        "watchdog_path": watchdog_path,
+        "record_path": record_path,
+        "record_segment_mb": record_segment_mb,
+        "record_segment_minutes": record_segment_minutes,
+        "record_budget_mb": record_budget_mb,
+        "record_compression": record_compression,
+        "runtime": runtime,
     }
 
 def build_v3_command(params, cellular):
@@ -277,7 +821,7 @@ def build_v3_command(params, cellular):
     msisdn_or_imsi = f"--msisdn {cellular['mdn']}" if cellular.get('mdn') else f"--imsi {cellular['imsi']}"
     
     if params["output"].startswith("un"):
-        output_param = "--nmea-export-un=/tmp/nmea.sock"
+        output_param = f"--nmea-export-un={NMEA_SOCKET_PATH}"
     else:
         ip, port = params['output'].split(':')
         output_param = f"--nmea-export-tcp={ip} --nmea-export-tcp-port={port}"
@@ -356,17 +900,18 @@ def build_v4_command(params, cellular):
     output_param = f"--output serial:device={params['serial']},baudrate={params['baud']},format={output_format}"
     
     # Output configuration
+    export_format = params["export_format"]
     if params["output"].startswith("un"):
-        export_param = "--output tcp-client:path=/tmp/nmea.sock,format=nmea"
+        export_param = f"--output tcp-client:path={NMEA_SOCKET_PATH},format={export_format}"
     elif params["output"].startswith("tcp-server:"):
         _, ip, port = params["output"]
-        export_param = f"--output tcp-server:host={ip},port={port},format=nmea"
+        export_param = f"--output tcp-server:host={ip},port={port},format={export_format}"
     elif params["output"].startswith("tcp-client:"):
         _, ip, port = params["output"]
-        export_param = f"--output tcp-client:host={ip},port={port},format=nmea"
+        export_param = f"--output tcp-client:host={ip},port={port},format={export_format}"
     else:
         ip, port = params['output'].split(':')
-        export_param = f"--output tcp-client:host={ip},port={port},format=nmea"
+        export_param = f"--output tcp-client:host={ip},port={port},format={export_format}"
     
     control_param = "--input stdin:format=ctrl"
 
@@ -391,79 +936,302 @@ def build_v4_command(params, cellular):
     
     return cmd
 
+def build_command(params, cellular):
+    # Determine which client to use
+    lpp_client_version = os.environ.get('LPP_VERSION', 'v3.0.0')
+    major_version = int(lpp_client_version.lstrip('v').split('.')[0])
+    use_v4_client = major_version >= 4
+    logger.info(f"-->{major_version} {major_version} {lpp_client_version}")
+
+    if use_v4_client:
+        logger.info("Using v4 client (example-client)")
+        return build_v4_command(params, cellular)
+    else:
+        logger.info("Using v3 client (example-lpp)")
+        return build_v3_command(params, cellular)
+
+def cid_command(cellular):
+    if cellular["nr"]:
+        return f"/CID,N,{cellular['mcc']},{cellular['mnc']},{cellular['tac']},{cellular['cell_id']}\r\n"
+    else:
+        return f"/CID,L,{cellular['mcc']},{cellular['mnc']},{cellular['tac']},{cellular['cell_id']}\r\n"
+
+def apply_plan(plan, params, cellular, program, pipeline):
+    """Apply a params change that doesn't need a restart"""
+    if plan.live:
+        cs.enable_pool(params["cs_pool_size"])
+        if pipeline:
+            pipeline.configure(params)
+    if plan.action == CONTROL:
+        # the starting cell only goes on the command line, for the next start (a crash restart or a watchdog
+        # respawn), the running client keeps following the modem's cell over /CID
+        program.cmd = build_command(params, cellular)
+        program.write(cid_command(cellular), replay=True)
+        cid_updates.inc()
+    elif plan.action == RESPAWN:
+        program.respawn(build_command(params, cellular))
+        if pipeline:
+            pipeline.mark_reload("respawn")
+
+def register_metrics(program, broadcaster, ipc, pipeline):
+    """Metrics read from the components when they are scraped"""
+    servers = {name: server for name, server in (("tcp", broadcaster), ("ipc", ipc)) if server}
+    registry.gauge("nmea_clients", "Connected NMEA clients, by server", "server",
+                   func=lambda: {name: len(server.clients) for name, server in servers.items()})
+    registry.counter("nmea_bytes_out_total", "Bytes sent to NMEA clients, by server", "server",
+                     func=lambda: {name: server.bytes_sent for name, server in servers.items()})
+    registry.counter("nmea_dropped_total", "Messages dropped for slow NMEA clients, by server", "server",
+                     func=lambda: {name: server.dropped for name, server in servers.items()})
+    registry.counter("nmea_disconnects_total", "NMEA clients disconnected, by server", "server",
+                     func=lambda: {name: server.disconnected for name, server in servers.items()})
+    registry.counter("nmea_refused_total", "NMEA clients refused at max_clients, by server", "server",
+                     func=lambda: {name: server.refused for name, server in servers.items()})
+    if pipeline:
+        registry.counter("cs_puts_total", "Config store puts by the NMEA publishers, by path", "path",
+                         func=lambda: {p.path: p.puts for p in pipeline.publishers() if p})
+        registry.counter("cs_puts_coalesced_total", "Updates merged into a later put, by path", "path",
+                         func=lambda: {p.path: p.skipped for p in pipeline.publishers() if p})
+        registry.counter("nmea_checksum_errors_total", "NMEA sentences with a wrong or missing checksum, by sentence ID",
+                         "sentence", func=lambda: pipeline.checksum.errors)
+        registry.counter("nmea_checksum_repaired_total", "NMEA sentences passed on with a restored $ or checksum case",
+                         func=lambda: pipeline.checksum.repaired)
+        registry.gauge("fix_correction_age_seconds", "Seconds since the last corrected fix had its corrections",
+                       func=lambda: pipeline.watchdog.correction_age())
+        registry.counter("fix_state_seconds_total", "Seconds spent in each fix state", "fix",
+                         func=lambda: pipeline.watchdog.snapshot()["time_in_state"])
+        registry.counter("watchdog_escalations_total", "Fix watchdog escalations, by step", "step",
+                         func=lambda: {RESEND_CID: pipeline.watchdog.resends, RESPAWN_CLIENT: pipeline.watchdog.respawns})
+        registry.counter("nmea_recorded_total", "NMEA sentences written by the recorder",
+                         func=lambda: pipeline.recorder.records if pipeline.recorder else None)
+        registry.counter("nmea_record_dropped_total", "NMEA sentences the recorder dropped because its queue was full",
+                         func=lambda: pipeline.recorder.dropped if pipeline.recorder else None)
+        registry.counter("nmea_record_bytes_total", "Compressed bytes written by the NMEA recorder",
+                         func=lambda: pipeline.recorder.bytes_written if pipeline.recorder else None)
+        registry.counter("nmea_record_segments_removed_total", "NMEA recorder segments removed to stay in the disk budget",
+                         func=lambda: pipeline.recorder.removed if pipeline.recorder else None)
+    registry.gauge("nmea_producers", "Producers connected to the NMEA socket", func=lambda: len(producers.connected))
+    registry.counter("nmea_source_sentences_total", "NMEA sentences received, by producer", "source",
+                     func=producers.sentences)
+    registry.counter("nmea_source_bytes_total", "Bytes received from the NMEA socket, by producer", "source",
+                     func=producers.bytes)
+    registry.counter("nmea_source_crc_errors_total", "UBX and RTCM frames dropped for a bad checksum or CRC, by producer",
+                     "source", func=producers.crc_errors)
+    registry.gauge("nmea_source_rate", "Sentences per second over the last second, by connected producer", "source",
+                   func=producers.rates)
+    registry.gauge("nmea_source_lag_seconds", "Seconds since the last sentence, by connected producer", "source",
+                   func=producers.lags)
+    registry.counter("child_restarts_total", "LPP client restarts", func=lambda: program.restarts)
+    registry.counter("child_crashes_total", "LPP client exits it decided on itself", func=lambda: program.crashes)
+    registry.gauge("child_uptime_seconds", "Seconds the current LPP client has been running", func=program.uptime)
+    registry.counter("child_output_lines_total", "Lines of LPP client output", func=lambda: program.output.lines)
+    registry.counter("child_output_sampled_total", "Repetitive LPP client output lines left out", func=lambda: program.output.sampled)
+    registry.counter("child_output_dropped_total", "LPP client output lines dropped because the log queue was full",
+                     func=lambda: program.output.handler.dropped)
+
 def main():
     logger.info("Starting lpp client")
 
     params = get_cmd_params()
     cellular = get_cellular_info()
     logger.info(params)
+    cs.enable_pool(params["cs_pool_size"])
 
     if params["cs_path"] == "/status/rtk/nmea": # the default
         if cs_get("/status/rtk") is None:
             cs_put("/status/rtk", {"nmea": []})
+
+    if params["runtime"] == ASYNCIO:
+        asyncio.run(main_async(params, cellular))
+        return
     
-    tcp_clients=[]
+    broadcaster = None
+    ipc = None
+    pipeline = None
 
     if params["output"].startswith("un"):
-        un_thread = threading.Thread(target=un_thread_server, args=(params["cs_path"], tcp_clients, params["log_nmea"]))
-        un_thread.daemon = True
-        un_thread.start()
         if params["output"].startswith("un-tcp"):
             _, port = params["output"].split(":")
-            tcp_thread = threading.Thread(target=tcp_server_thread, args=(int(port), tcp_clients))
-            tcp_thread.daemon = True
-            tcp_thread.start()
+            broadcaster = NmeaBroadcaster(params["tcp_queue_size"], params["tcp_slow_client"], logger=logger,
+                                          max_clients=params["tcp_max_clients"],
+                                          stall_timeout=params["tcp_stall_timeout"],
+                                          subscription=Subscription(params["tcp_sentences"])).start()
+            broadcaster.listen(int(port))
+        # the webapp's live NMEA and fix views are fed from here rather than from the logs or config store
+        ipc = NmeaBroadcaster(IPC_QUEUE_SIZE, DROP_OLDEST, logger=logger, max_clients=IPC_MAX_CLIENTS).start()
+        ipc.listen_unix(NMEA_IPC_PATH)
+        pipeline = NmeaPipeline(params, broadcaster, ipc)
+        pipeline.mark_reload("start")
+        un_thread = threading.Thread(target=un_thread_server, args=(pipeline, NMEA_SOCKET_PATH))
+        un_thread.daemon = True
+        un_thread.start()
 
-    # Determine which client to use
-    lpp_client_version = os.environ.get('LPP_VERSION', 'v3.0.0')
-    major_version = int(lpp_client_version.lstrip('v').split('.')[0])
-    use_v4_client = major_version >= 4
-    logger.info(f"-->{major_version} {major_version} {lpp_client_version}")
-    
-    if use_v4_client:
-        logger.info("Using v4 client (example-client)")
-        cmd = build_v4_command(params, cellular)
-    else:
-        logger.info("Using v3 client (example-lpp)")
-        cmd = build_v3_command(params, cellular)
-    
+    cmd = build_command(params, cellular)
     logger.info(cmd)
     program = RunProgram(cmd)
+    register_metrics(program, broadcaster, ipc, pipeline)
+    DebugServer(DEBUG_SOCKET_PATH, logger=logger).start()
+
+    # Watch the config store for changes to the params and the serving cell
+    monitor = ChangeMonitor(cs, logger=logger)
+    if monitor.watch(APPDATA_PATH, appdata_changed):
+        cs.appdata_ttl = APPDATA_EVENT_TTL
+    monitor.watch(PRIMARY_DEVICE_PATH)
+    device = get_modem_device()
+    diag_path = watch_cell_changes(monitor, device)
 
     # Create a control thread to handle user input (e.g., stopping the program)
-    def control_thread(program, current_params, current_cellular):
-        logger.info("Periodically checking for changes")
+    def control_thread(program, monitor, current_params, current_cellular, device, diag_path):
+        logger.info("Watching for changes" if monitor.eventing else "Periodically checking for changes")
         while True:
-            time.sleep(10)
-            if program.process is None:
+            changed = monitor.wait()
+            if changed is None:
                 logger.info("Program terminated")
                 break
-            new_params = get_cmd_params()
-            if new_params != current_params:
-                current_params = new_params
-                logger.info("params changed", current_params)
-                program.interrupt() # Terminate the external program
-                break
-            new_cellular = get_cellular_info()
-            logger.info(f"cell check: {new_cellular['mnc']},{new_cellular['mcc']},{new_cellular['tac']},{new_cellular['cell_id']},{new_cellular["nr"]} == {current_cellular['mnc']},{current_cellular['mcc']},{current_cellular['tac']},{current_cellular['cell_id']},{current_cellular["nr"]}")
-            if new_cellular != current_cellular:
+            if not changed or APPDATA_PATH in changed:
+                new_params = get_cmd_params()
+                plan = plan_reload(current_params, new_params)
+                if plan:
+                    current_params = new_params
+                    logger.info(f"params changed, {plan}")
+                    if plan.action == RESTART:
+                        program.stop() # Terminate the external program
+                        break
+                    apply_plan(plan, current_params, current_cellular, program, pipeline)
+            if not changed or PRIMARY_DEVICE_PATH in changed or APPDATA_PATH in changed:
+                new_device = get_modem_device()
+                if new_device != device:
+                    logger.info(f"modem device changed from {device} to {new_device}")
+                    if diag_path:
+                        monitor.unwatch(diag_path)
+                    device = new_device
+                    diag_path = watch_cell_changes(monitor, device)
+                elif diag_path and not monitor.watching(diag_path):
+                    # registering failed before, try again on every check
+                    diag_path = watch_cell_changes(monitor, device)
+            new_cellular = get_cellular_info(device)
+            logger.info(f"cell check: {new_cellular['mnc']},{new_cellular['mcc']},{new_cellular['tac']},{new_cellular['cell_id']},{new_cellular['nr']} == {current_cellular['mnc']},{current_cellular['mcc']},{current_cellular['tac']},{current_cellular['cell_id']},{current_cellular['nr']}")
+            cell_changed = new_cellular != current_cellular
+            if cell_changed:
                 current_cellular = new_cellular
                 logger.info("cellular info changed")
-                if current_cellular["nr"]:
-                    cmd = f"/CID,N,{current_cellular['mcc']},{current_cellular['mnc']},{current_cellular['tac']},{current_cellular['cell_id']}\r\n"
-                else:
-                    cmd = f"/CID,L,{current_cellular['mcc']},{current_cellular['mnc']},{current_cellular['tac']},{current_cellular['cell_id']}\r\n"
-                program.write(cmd)
+                program.write(cid_command(current_cellular), replay=True)
+                cid_updates.inc()
+            monitor.settle(cell_changed)
 
-    ct = threading.Thread(target=control_thread, args=(program,params,cellular))
+    ct = threading.Thread(target=control_thread, args=(program, monitor, params, cellular, device, diag_path))
     ct.daemon = True
     ct.start()
+    watchdog_stopped = threading.Event()
+    if pipeline:
+        wt = threading.Thread(target=watchdog_thread, args=(pipeline, program, cellular, watchdog_stopped), name="fix-watchdog")
+        wt.daemon = True
+        wt.start()
 
-    program.start()
+    program.run()
 
+    watchdog_stopped.set()
+    monitor.stop()
     ct.join()
+    if pipeline:
+        pipeline.stop()
+
+    logger.info(f"Exiting program, hopefully restarting... {program.stats()}")
+
+async def main_async(params, cellular):
+    """main() with the NMEA server, the TCP servers, the program and the change monitor on one asyncio event loop.
+
+    The config store reads of a params or cell check are blocking calls of the shared client, they run in the
+    loop's default executor.
+    """
+    loop = asyncio.get_running_loop()
+    cs.use_loop(loop)
+    broadcaster = None
+    ipc = None
+    pipeline = None
+    server = None
+
+    if params["output"].startswith("un"):
+        if params["output"].startswith("un-tcp"):
+            _, port = params["output"].split(":")
+            broadcaster = AsyncNmeaBroadcaster(params["tcp_queue_size"], params["tcp_slow_client"], logger=logger,
+                                               max_clients=params["tcp_max_clients"],
+                                               stall_timeout=params["tcp_stall_timeout"],
+                                               subscription=Subscription(params["tcp_sentences"])).start()
+            await broadcaster.listen(int(port))
+        ipc = AsyncNmeaBroadcaster(IPC_QUEUE_SIZE, DROP_OLDEST, logger=logger, max_clients=IPC_MAX_CLIENTS).start()
+        await ipc.listen_unix(NMEA_IPC_PATH)
+        pipeline = AsyncNmeaPipeline(params, broadcaster, ipc)
+        pipeline.mark_reload("start")
+        server = await serve_nmea(pipeline, NMEA_SOCKET_PATH)
+
+    cmd = build_command(params, cellular)
+    logger.info(cmd)
+    program = AsyncRunProgram(cmd)
+    register_metrics(program, broadcaster, ipc, pipeline)
+    DebugServer(DEBUG_SOCKET_PATH, logger=logger).start()
+
+    # registering is a blocking round trip on the config store socket too, and the NMEA server is already running
+    monitor = AsyncChangeMonitor(cs, logger=logger, loop=loop)
+    if await loop.run_in_executor(None, monitor.watch, APPDATA_PATH, appdata_changed):
+        cs.appdata_ttl = APPDATA_EVENT_TTL
+    await loop.run_in_executor(None, monitor.watch, PRIMARY_DEVICE_PATH)
+    device = await loop.run_in_executor(None, get_modem_device)
+    diag_path = await loop.run_in_executor(None, watch_cell_changes, monitor, device)
+
+    async def control(current_params, current_cellular, device, diag_path):
+        logger.info("Watching for changes" if monitor.eventing else "Periodically checking for changes")
+        while True:
+            changed = await monitor.wait()
+            if changed is None:
+                logger.info("Program terminated")
+                break
+            if not changed or APPDATA_PATH in changed:
+                new_params = await loop.run_in_executor(None, get_cmd_params)
+                plan = plan_reload(current_params, new_params)
+                if plan:
+                    current_params = new_params
+                    logger.info(f"params changed, {plan}")
+                    if plan.action == RESTART:
+                        program.stop()
+                        break
+                    apply_plan(plan, current_params, current_cellular, program, pipeline)
+            if not changed or PRIMARY_DEVICE_PATH in changed or APPDATA_PATH in changed:
+                new_device = await loop.run_in_executor(None, get_modem_device)
+                if new_device != device:
+                    logger.info(f"modem device changed from {device} to {new_device}")
+                    if diag_path:
+                        await loop.run_in_executor(None, monitor.unwatch, diag_path)
+                    device = new_device
+                    diag_path = await loop.run_in_executor(None, watch_cell_changes, monitor, device)
+                elif diag_path and not monitor.watching(diag_path):
+                    diag_path = await loop.run_in_executor(None, watch_cell_changes, monitor, device)
+            new_cellular = await loop.run_in_executor(None, get_cellular_info, device)
+            cell_changed = new_cellular != current_cellular
+            if cell_changed:
+                current_cellular = new_cellular
+                logger.info(f"cellular info changed: {current_cellular}")
+                program.write(cid_command(current_cellular), replay=True)
+                cid_updates.inc()
+            monitor.settle(cell_changed)
+
+    control_task = loop.create_task(control(params, cellular, device, diag_path))
+    watchdog = loop.create_task(watchdog_task(pipeline, program, cellular)) if pipeline else None
+
+    await program.run()
+
+    if watchdog:
+        watchdog.cancel()
+    monitor.stop()
+    await control_task
+    if server:
+        server.close()
+    for nmea_server in (broadcaster, ipc):
+        if nmea_server:
+            nmea_server.close()
+    if pipeline:
+        pipeline.stop()
 
-    logger.info("Exiting program, hopefully restarting...")
+    logger.info(f"Exiting program, hopefully restarting... {program.stats()}")
 
 if __name__ == "__main__":
     try:
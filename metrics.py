@@ -0,0 +1,122 @@
+import bisect
+import math
+
+# config store puts and similar round trips, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# label values come from the data (sentence IDs), past this many they are counted as OTHER
+MAX_LABELS = 100
+OTHER = "other"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Metric:
+    """A counter or gauge with at most one label.
+
+    Hot paths just call inc() / set(), which is a dict update, the text is only
+    built when the registry is rendered. With func, the value(s) are read from
+    func() at render time instead, a number or a {label value: number} dict.
+    Updates from several threads can race on the same value, which only costs
+    a count now and then, so there is no lock.
+    """
+    def __init__(self, kind, name, help, label=None, func=None, max_labels=MAX_LABELS):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.label = label
+        self.func = func
+        self.max_labels = max_labels
+        self.values = {} if label else {None: 0}
+
+    def inc(self, amount=1, label=None):
+        values = self.values
+        value = values.get(label)
+        if value is None:
+            if len(values) >= self.max_labels:
+                label = OTHER
+            value = values.get(label, 0)
+        values[label] = value + amount
+
+    def set(self, value, label=None):
+        if label not in self.values and len(self.values) >= self.max_labels:
+            label = OTHER
+        self.values[label] = value
+
+    def samples(self):
+        values = self.values
+        if self.func is not None:
+            values = self.func()
+            if not isinstance(values, dict):
+                values = {None: values}
+        # list() copies in one go, other threads may be adding labels
+        for label, value in sorted(list(values.items()), key=lambda item: str(item[0])):
+            if value is None:
+                continue
+            labels = f'{{{self.label}="{_escape(label)}"}}' if self.label and label is not None else ""
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+class Histogram:
+    """Cumulative histogram of observations, like a Prometheus histogram without labels"""
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            yield f'{self.name}_bucket{{le="{_format_value(bound)}"}} {total}'
+        yield f"{self.name}_sum {self.sum}"
+        yield f"{self.name}_count {self.count}"
+
+class Registry:
+    """Named metrics rendered in the Prometheus text exposition format"""
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.metrics = {}
+
+    def _add(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, label=None, func=None):
+        return self._add(Metric("counter", self.prefix + name, help, label, func))
+
+    def gauge(self, name, help, label=None, func=None):
+        return self._add(Metric("gauge", self.prefix + name, help, label, func))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help, buckets))
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                lines.append(f"# {metric.name} failed: {_escape(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+# the process wide registry
+registry = Registry("lpp_client_")
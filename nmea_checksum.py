@@ -0,0 +1,145 @@
+import collections
+import time
+
+from nmea_filter import sentence_id
+
+# what happens to a sentence whose checksum is wrong or missing
+OFF = "off"
+DROP = "drop"
+QUARANTINE = "quarantine"
+CHECKSUM_MODES = (OFF, DROP, QUARANTINE)
+
+QUARANTINE_SIZE = 100
+# bodies longer than this are folded on their own rather than widening every lane of the batch
+MAX_LANE = 128
+# label for error counts of lines too broken to have a sentence ID
+UNKNOWN_SENTENCE = "unknown"
+# the value of every way to write a checksum, in either case
+DECLARED = {f"{a}{b}": int(a + b, 16) for a in "0123456789ABCDEFabcdef" for b in "0123456789ABCDEFabcdef"}
+
+def _lane_width(length):
+    return 1 << max(0, length - 1).bit_length()
+
+def _fold(data, width):
+    """XOR of every width bytes of data, width a power of two, as one byte per lane"""
+    x = int.from_bytes(data, "little")
+    # shifting by width/2, width/4, ... 1 bytes XORs bytes 0..width-1 of each lane into its lowest byte,
+    # what the next lane shifts in only ever reaches the higher bytes
+    shift = width >> 1
+    while shift:
+        x ^= x >> (shift << 3)
+        shift >>= 1
+    return x.to_bytes(len(data), "little")[::width]
+
+def checksums(bodies):
+    """NMEA checksums (XOR of the characters between $ and *) of a batch of sentence bodies, as bytes.
+
+    Every body is padded with NULs to one power of two lane width, the batch is
+    packed into a single integer and folded lane-wise, so the work per byte is
+    done by int operations rather than a Python loop.
+    """
+    if not bodies:
+        return b""
+    width = _lane_width(max(map(len, bodies)))
+    if width > MAX_LANE:
+        short = checksums([body if len(body) <= MAX_LANE else "" for body in bodies])
+        return bytes(short[i] if len(body) <= MAX_LANE else _fold(body.encode("ascii", "replace"), _lane_width(len(body)))[0]
+                     for i, body in enumerate(bodies))
+    data = "".join([body.ljust(width, "\0") for body in bodies]).encode("ascii", "replace")
+    return _fold(data, width)
+
+def checksum(body):
+    """NMEA checksum of one sentence body, the same fold without packing a batch"""
+    x = int.from_bytes(body.encode("ascii", "replace"), "little")
+    shift = _lane_width(len(body)) >> 1
+    while shift:
+        x ^= x >> (shift << 3)
+        shift >>= 1
+    return x & 0xFF
+
+class ChecksumValidator:
+    """Checks the *hh checksums of the sentences of one read, in a batch.
+
+    The common case, every sentence with a valid checksum, costs one batched
+    checksums() call and a comparison of the declared checksums against it,
+    so the cost per sentence goes down as reads get bigger under load.
+    Otherwise every sentence is looked at on its own: a missing $ is restored,
+    a checksum in lower case hex is rewritten in upper case, and a sentence
+    with a wrong or missing checksum (a truncated sentence has none) is taken
+    out and counted by sentence ID. In quarantine mode those are kept for
+    take_rejected() and in the last QUARANTINE_SIZE, instead of being dropped.
+    """
+    def __init__(self, mode=DROP):
+        if mode not in CHECKSUM_MODES:
+            raise ValueError(f"unknown checksum mode: {mode}")
+        self.mode = mode
+        self.checked = 0
+        self.repaired = 0
+        self.errors = {}
+        self.quarantine = collections.deque(maxlen=QUARANTINE_SIZE)
+        self._rejected = []
+
+    def check(self, lines):
+        """The sentences of lines that passed, repaired where they could be"""
+        if self.mode == OFF or not lines:
+            return lines
+        self.checked += len(lines)
+        if len(lines) == 1:
+            # nothing to batch, packing it would cost more than it saves
+            return self._check_each(lines)
+        declared = None
+        if min(map(len, lines)) >= 4:
+            tails = "".join([line[-3:] for line in lines])
+            if tails[::3] == "*" * len(lines):
+                try:
+                    declared = bytes.fromhex(tails.replace("*", ""))
+                except ValueError:
+                    pass
+                if declared is not None and len(declared) != len(lines):
+                    declared = None
+        if declared is not None:
+            computed = checksums([line[1:-3] if line[0] in "$!" else line[:-3] for line in lines])
+            if computed == declared and tails == tails.upper() and all(line[0] in "$!" for line in lines):
+                return lines
+        return self._check_each(lines)
+
+    def _check_each(self, lines):
+        out = []
+        for line in lines:
+            fixed = line if line[:1] in ("$", "!") else f"${line}"
+            star = len(fixed) - 3
+            hh = fixed[star + 1:]
+            if star > 0 and fixed[star] == "*" and checksum(fixed[1:star]) == DECLARED.get(hh):
+                if hh != hh.upper():
+                    fixed = f"{fixed[:star + 1]}{hh.upper()}"
+                if fixed is not line:
+                    self.repaired += 1
+                out.append(fixed)
+                continue
+            self._reject(fixed)
+        return out
+
+    def _reject(self, line):
+        sid = sentence_id(line)
+        if not sid.isalnum() or len(sid) > 10:
+            sid = UNKNOWN_SENTENCE
+        self.errors[sid] = self.errors.get(sid, 0) + 1
+        if self.mode == QUARANTINE:
+            self.quarantine.append((time.time(), line))
+            self._rejected.append(line)
+
+    def take_rejected(self):
+        """The quarantined sentences since the last call"""
+        rejected = self._rejected
+        if rejected:
+            self._rejected = []
+        return rejected
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "checked": self.checked,
+            "repaired": self.repaired,
+            "errors": sum(self.errors.values()),
+            "quarantined": len(self.quarantine),
+        }
@@ -0,0 +1,87 @@
+ALL = "*"
+# IDs of the binary frames passed through with the NMEA, UBX0107 or RTCM1077, only sent when asked for by name
+BINARY_FAMILIES = ("UBX", "RTCM")
+
+def binary_family(sid):
+    """UBX or RTCM for the ID of a binary frame, None for an NMEA sentence ID"""
+    for family in BINARY_FAMILIES:
+        if sid.startswith(family):
+            return family
+    return None
+
+def sentence_id(sentence):
+    """Talker and sentence type of an NMEA sentence, '$GPGGA,...' -> 'GPGGA', '$PUBX,00,...' -> 'PUBX', '!AIVDM,...' -> 'AIVDM'"""
+    end = sentence.find(",")
+    if end < 0:
+        end = sentence.find("*")
+        if end < 0:
+            end = len(sentence)
+    return sentence[1:end] if sentence[:1] in ("$", "!") else sentence[:end]
+
+class Subscription:
+    """Which sentence types a consumer wants, and at what decimation.
+
+    A spec is a comma separated list of sentence IDs, each optionally followed
+    by /N to keep only every Nth sentence of that ID, e.g. "GGA,RMC,GSV/10".
+    Three letter IDs match any talker (GGA matches GPGGA and GNGGA), longer
+    IDs match exactly (GNGGA, PUBX), and * matches everything not listed.
+    Binary frames are left out of *: UBX and RTCM select every frame of that
+    kind, UBX0107 or RTCM1077 a single message.
+
+    The decision for each sentence ID is worked out once and cached, and
+    consumers with the same spec share one Subscription, so a sentence is
+    checked once per type and subscription rather than once per consumer.
+    """
+    def __init__(self, spec=ALL):
+        self.rules = {}
+        for entry in (spec or ALL).replace(" ", "").split(","):
+            if not entry:
+                continue
+            sid, _, every = entry.partition("/")
+            try:
+                every = int(every) if every else 1
+            except ValueError:
+                raise ValueError(f"invalid decimation in {entry!r}")
+            if every < 1 or not (sid == ALL or sid.isalnum()):
+                raise ValueError(f"invalid sentence subscription {entry!r}")
+            self.rules[sid.upper()] = every
+        self.spec = ",".join(f"{sid}/{every}" if every > 1 else sid for sid, every in sorted(self.rules.items()))
+        self.everything = self.rules == {ALL: 1}
+        self.binary = any(binary_family(sid) for sid in self.rules)
+        self._decisions = {}
+        self._counters = {}
+        self.accepted = 0
+        self.rejected = 0
+
+    def __repr__(self):
+        return f"Subscription({self.spec!r})"
+
+    def _rule(self, sid):
+        family = binary_family(sid)
+        if family:
+            every = self.rules.get(sid)
+            return self.rules.get(family, 0) if every is None else every
+        every = self.rules.get(sid)
+        if every is None and len(sid) == 5:
+            every = self.rules.get(sid[2:])
+        if every is None:
+            every = self.rules.get(ALL, 0)
+        return every
+
+    def accepts(self, sid):
+        every = self._decisions.get(sid)
+        if every is None:
+            every = self._decisions[sid] = self._rule(sid)
+        if every == 1:
+            self.accepted += 1
+            return True
+        if every == 0:
+            self.rejected += 1
+            return False
+        count = self._counters.get(sid, 0)
+        self._counters[sid] = count + 1
+        if count % every:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
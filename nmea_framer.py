@@ -0,0 +1,120 @@
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+class NmeaFramer:
+    """Splits a byte stream into CRLF terminated NMEA sentences.
+
+    Data is received straight into a preallocated bytearray with recv_into()
+    and sentences are located with find(b'\\r\\n') offsets, so a backlog costs
+    linear time. Only complete sentences are decoded (as ASCII); a partial
+    sentence stays in the buffer until the rest of it arrives, and a sentence
+    that isn't ASCII is dropped on its own without taking its neighbours with
+    it.
+    """
+    def __init__(self, size=DEFAULT_BUFFER_SIZE, logger=None):
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        self._scan = 0
+        self.logger = logger
+        self.bytes = 0
+        self.sentences = 0
+        self.decode_errors = 0
+        self.overflows = 0
+
+    def __len__(self):
+        """Number of buffered bytes that are not part of a complete sentence yet"""
+        return self._end - self._start
+
+    def _make_room(self):
+        if self._start:
+            pending = self._end - self._start
+            self._buf[:pending] = self._view[self._start:self._end]
+            self._scan -= self._start
+            self._start = 0
+            self._end = pending
+        if self._end == len(self._buf):
+            # a single "sentence" filled the whole buffer, it can't be NMEA
+            self.overflows += 1
+            if self.logger:
+                self.logger.error(f"dropping {self._end} bytes without a sentence terminator")
+            self._start = self._end = self._scan = 0
+
+    def recv_into(self, sock):
+        """Receive from sock into the free space of the buffer, returns the byte count (0 on EOF)"""
+        n = sock.recv_into(self.buffer())
+        self.advance(n)
+        return n
+
+    def buffer(self):
+        """The free space of the buffer, for callers that receive into it themselves (asyncio.BufferedProtocol)"""
+        if self._end == len(self._buf):
+            self._make_room()
+        return self._view[self._end:]
+
+    def advance(self, n):
+        """Take n bytes written to buffer() as received"""
+        self._end += n
+        self.bytes += n
+
+    def feed(self, data):
+        """Copy data into the buffer and return the sentences it completes"""
+        out = []
+        data = memoryview(data)
+        while data:
+            if self._end == len(self._buf):
+                self._make_room()
+            n = min(len(data), len(self._buf) - self._end)
+            self._buf[self._end:self._end + n] = data[:n]
+            self._end += n
+            self.bytes += n
+            data = data[n:]
+            out.extend(self.frames())
+        return out
+
+    def frames(self):
+        """Return the complete sentences currently in the buffer, without their CRLF"""
+        start = self._start
+        end = self._end
+        last = self._buf.rfind(b"\r\n", max(start, self._scan), end)
+        if last < 0:
+            # a trailing \r may still be followed by \n in the next chunk
+            self._scan = max(start, end - 1)
+            return []
+        try:
+            # fast path, everything up to the last terminator decodes in one go
+            out = [line for line in str(self._view[start:last], "ascii").split("\r\n") if line]
+        except UnicodeDecodeError:
+            out = self._frames_slow(start, last)
+        self.sentences += len(out)
+        start = last + 2
+        if start == end:
+            start = end = 0
+        self._start = start
+        self._end = end
+        self._scan = max(start, end - 1)
+        return out
+
+    def _frames_slow(self, start, last):
+        out = []
+        buf = self._buf
+        view = self._view
+        while start <= last:
+            i = buf.find(b"\r\n", start, last + 2)
+            if i > start:
+                try:
+                    out.append(str(view[start:i], "ascii"))
+                except UnicodeDecodeError:
+                    self.decode_errors += 1
+                    if self.logger:
+                        self.logger.error(f"dropping non-ascii sentence {bytes(view[start:i])}")
+            start = i + 2
+        return out
+
+    def stats(self):
+        return {
+            "bytes": self.bytes,
+            "sentences": self.sentences,
+            "decode_errors": self.decode_errors,
+            "overflows": self.overflows,
+        }
@@ -0,0 +1,18 @@
+import json
+
+# main.py serves the NMEA stream and fix record to the webapp on this socket
+NMEA_IPC_PATH = "/tmp/nmea-ipc.sock"
+IPC_QUEUE_SIZE = 1000
+IPC_MAX_CLIENTS = 4
+
+# fix record updates are sent between the sentences as "#FIX {json}" lines
+FIX_PREFIX = "#FIX "
+
+def fix_message(record):
+    return (FIX_PREFIX + json.dumps(record, separators=(",", ":")) + "\r\n").encode()
+
+def parse_fix_message(line):
+    """The fix record in a line from the IPC socket, or None if it's a sentence"""
+    if not line.startswith(FIX_PREFIX):
+        return None
+    return json.loads(line[len(FIX_PREFIX):])
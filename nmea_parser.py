@@ -0,0 +1,124 @@
+import time
+
+# GGA fix quality indicator
+FIX_QUALITY = {
+    0: "invalid",
+    1: "gps",
+    2: "dgps",
+    3: "pps",
+    4: "rtk-fixed",
+    5: "rtk-float",
+    6: "dead-reckoning",
+    7: "manual",
+    8: "simulation",
+}
+
+RTK_STATUS = {4: "fixed", 5: "float"}
+
+KNOTS_TO_MPS = 0.514444
+
+def _float(value):
+    return float(value) if value else None
+
+def _int(value):
+    return int(value) if value else None
+
+def _degrees(value, hemisphere):
+    """ddmm.mmmm / dddmm.mmmm with N/S/E/W to signed decimal degrees"""
+    if not value:
+        return None
+    dot = value.find(".")
+    if dot < 0:
+        dot = len(value)
+    degrees = float(value[:dot - 2]) + float(value[dot - 2:]) / 60.0
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+def _gga(f):
+    quality = _int(f[6])
+    return {
+        "time": f[1],
+        "lat": _degrees(f[2], f[3]),
+        "lon": _degrees(f[4], f[5]),
+        "quality": quality,
+        "fix": FIX_QUALITY.get(quality, "unknown"),
+        "rtk": RTK_STATUS.get(quality, "none"),
+        "sats": _int(f[7]),
+        "hdop": _float(f[8]),
+        "alt": _float(f[9]),
+        "geoid_sep": _float(f[11]),
+        "diff_age": _float(f[13]) if len(f) > 13 else None,
+        "diff_station": (f[14] or None) if len(f) > 14 else None,
+    }
+
+def _rmc(f):
+    speed = _float(f[7])
+    return {
+        "time": f[1],
+        "valid": f[2] == "A",
+        "lat": _degrees(f[3], f[4]),
+        "lon": _degrees(f[5], f[6]),
+        "speed": speed * KNOTS_TO_MPS if speed is not None else None,
+        "course": _float(f[8]),
+        "date": f[9],
+    }
+
+def _gsa(f):
+    # hdop comes from GGA, taking it from both would make it flap between the two
+    return {
+        "pdop": _float(f[15]),
+        "vdop": _float(f[17]),
+    }
+
+def _gst(f):
+    return {
+        "lat_err": _float(f[6]),
+        "lon_err": _float(f[7]),
+        "alt_err": _float(f[8]),
+    }
+
+# sentence type (without talker) -> field parser
+PARSERS = {
+    "GGA": _gga,
+    "RMC": _rmc,
+    "GSA": _gsa,
+    "GST": _gst,
+}
+
+class NmeaParser:
+    """Incremental NMEA parser that keeps a compact record of the latest fix.
+
+    Only the sentence types in PARSERS are looked at, everything else is
+    skipped with a single dict lookup. feed() returns True when the record
+    changed, so it only needs publishing then.
+    """
+    def __init__(self):
+        self.state = {}
+        self.parsed = 0
+        self.errors = 0
+        self.changes = 0
+
+    def feed(self, sentence, sid):
+        parser = PARSERS.get(sid[-3:]) if len(sid) == 5 else None
+        if parser is None:
+            return False
+        star = sentence.rfind("*")
+        fields = (sentence[:star] if star >= 0 else sentence).split(",")
+        try:
+            update = parser(fields)
+        except (ValueError, IndexError):
+            self.errors += 1
+            return False
+        self.parsed += 1
+        state = self.state
+        changed = False
+        for key, value in update.items():
+            if state.get(key) != value:
+                state[key] = value
+                changed = True
+        if changed:
+            self.changes += 1
+            state["updated"] = time.time()
+        return changed
+
+    def snapshot(self):
+        return dict(self.state)
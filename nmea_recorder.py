@@ -0,0 +1,330 @@
+import bisect
+import collections
+import lzma
+import os
+import struct
+import threading
+import time
+import zlib
+
+ZLIB = "zlib"
+LZMA = "lzma"
+COMPRESSIONS = {ZLIB: ".rec.z", LZMA: ".rec.xz"}
+
+DEFAULT_SEGMENT_BYTES = 4 * 1024 * 1024
+DEFAULT_SEGMENT_SECONDS = 3600
+DEFAULT_BUDGET_BYTES = 64 * 1024 * 1024
+# every chunk is a separate compressed stream listed in the index, so a reader can start at any chunk
+CHUNK_SECONDS = 10
+FLUSH_INTERVAL = 1.0
+MAX_PENDING = 100000
+
+MAGIC = b"NMEAREC1"
+# segment header: magic, start time in ms
+HEADER = struct.Struct("<8sq")
+# index entry: time of the chunk's first record in ms, offset of the chunk in the segment
+INDEX_ENTRY = struct.Struct("<qQ")
+INDEX_SUFFIX = ".idx"
+
+def _varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data, pos):
+    shift = value = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+def encode_records(records, last_ms):
+    """Frame (time, sentence) records as varint(zigzag ms delta), varint(length), bytes; returns (data, last ms)"""
+    out = bytearray()
+    for t, line in records:
+        ms = int(t * 1000)
+        delta = ms - last_ms
+        _varint((delta << 1) ^ (delta >> 63), out)
+        raw = line.encode("ascii", "replace")
+        _varint(len(raw), out)
+        out += raw
+        last_ms = ms
+    return bytes(out), last_ms
+
+def decode_records(data, last_ms):
+    """Inverse of encode_records, yields (time, sentence)"""
+    pos = 0
+    end = len(data)
+    while pos < end:
+        zigzag, pos = _read_varint(data, pos)
+        last_ms += (zigzag >> 1) ^ -(zigzag & 1)
+        length, pos = _read_varint(data, pos)
+        yield last_ms / 1000.0, data[pos:pos + length].decode("ascii")
+        pos += length
+
+class NmeaRecorder:
+    """Records raw NMEA with receive timestamps into compressed, rotating segment files.
+
+    record() only appends to a queue, a writer thread frames, compresses and
+    writes everything queued once a second. A segment is one header followed
+    by chunks, each an independent zlib or xz stream of CHUNK_SECONDS of
+    records, and an index file next to it maps the time of each chunk's
+    first record to its offset. zlib chunks are sync-flushed every write, so
+    a crash loses at most the last second; xz can't be flushed mid-stream and
+    loses at most the open chunk. A segment is closed when its compressed size
+    reaches segment_bytes or it is segment_seconds old, after which the oldest
+    segments are removed until the directory fits in budget_bytes.
+    """
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES, segment_seconds=DEFAULT_SEGMENT_SECONDS,
+                 budget_bytes=DEFAULT_BUDGET_BYTES, compression=ZLIB, logger=None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"unknown compression: {compression}")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.budget_bytes = budget_bytes
+        self.compression = compression
+        self.logger = logger
+        self._pending = collections.deque()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        self._index = None
+        self._compressor = None
+        self._segment_start = None
+        self._chunk_start = None
+        self._last_ms = 0
+        self.path = None
+        self.records = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.segments = 0
+        self.removed = 0
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name=f"nmea-recorder {self.directory}")
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def record(self, line, t=None):
+        if len(self._pending) >= MAX_PENDING:
+            self.dropped += 1
+            return
+        self._pending.append((t or time.time(), line))
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "records": self.records,
+            "dropped": self.dropped,
+            "bytes_written": self.bytes_written,
+            "segments": self.segments,
+            "removed": self.removed,
+        }
+
+    def _new_compressor(self):
+        if self.compression == LZMA:
+            return lzma.LZMACompressor(lzma.FORMAT_XZ, preset=6)
+        return zlib.compressobj(6)
+
+    def _open_segment(self, t):
+        name = time.strftime("nmea-%Y%m%dT%H%M%S", time.gmtime(t)) + f"-{int(t * 1000) % 1000:03d}"
+        self.path = os.path.join(self.directory, name + COMPRESSIONS[self.compression])
+        self._file = open(self.path, "wb")
+        self._index = open(self.path + INDEX_SUFFIX, "wb")
+        self._last_ms = int(t * 1000)
+        self._file.write(HEADER.pack(MAGIC, self._last_ms))
+        self._segment_start = t
+        self._chunk_start = None
+        self.segments += 1
+
+    def _start_chunk(self, t):
+        self._compressor = self._new_compressor()
+        self._chunk_start = t
+        self._index.write(INDEX_ENTRY.pack(int(t * 1000), self._file.tell()))
+
+    def _end_chunk(self):
+        if self._compressor is not None:
+            self._write(self._compressor.flush())
+            self._compressor = None
+            self._chunk_start = None
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._end_chunk()
+        self._file.close()
+        self._index.close()
+        self._file = self._index = None
+        self._enforce_budget()
+
+    def _abandon_segment(self):
+        """Give up on the current segment after a write error, the next records start a new one"""
+        for f in (self._file, self._index):
+            try:
+                if f:
+                    f.close()
+            except OSError:
+                pass
+        self._file = self._index = self._compressor = None
+        self._chunk_start = None
+
+    def _write(self, data):
+        if data:
+            self._file.write(data)
+            self.bytes_written += len(data)
+
+    def _write_records(self, records):
+        now = records[-1][0]
+        if self._file is not None and (self._file.tell() >= self.segment_bytes
+                                       or now - self._segment_start >= self.segment_seconds):
+            self._close_segment()
+        if self._file is None:
+            self._open_segment(records[0][0])
+        if self._chunk_start is not None and now - self._chunk_start >= CHUNK_SECONDS:
+            self._end_chunk()
+        if self._compressor is None:
+            # chunks start on a record so a reader can decode from its index entry
+            self._start_chunk(records[0][0])
+        data, self._last_ms = encode_records(records, self._last_ms)
+        self._write(self._compressor.compress(data))
+        if self.compression == ZLIB:
+            self._write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        self._file.flush()
+        self._index.flush()
+        self.records += len(records)
+
+    def _enforce_budget(self):
+        segments = list_segments(self.directory)
+        sizes = {path: os.path.getsize(path) + os.path.getsize(path + INDEX_SUFFIX)
+                 for path in segments if os.path.exists(path + INDEX_SUFFIX)}
+        total = sum(sizes.values())
+        for path in segments:
+            if total <= self.budget_bytes or path == self.path and self._file is not None:
+                break
+            total -= sizes.get(path, 0)
+            for victim in (path, path + INDEX_SUFFIX):
+                try:
+                    os.unlink(victim)
+                except OSError:
+                    pass
+            self.removed += 1
+
+    def _drain(self):
+        records = []
+        pending = self._pending
+        while pending:
+            records.append(pending.popleft())
+        return records
+
+    def _run(self):
+        while not self._stop.wait(FLUSH_INTERVAL):
+            records = self._drain()
+            if records:
+                try:
+                    self._write_records(records)
+                except OSError as e:
+                    if self.logger:
+                        self.logger.error(f"NMEA recorder failed writing {self.path}: {e}")
+                    self._abandon_segment()
+        records = self._drain()
+        try:
+            if records:
+                self._write_records(records)
+            self._close_segment()
+        except OSError as e:
+            if self.logger:
+                self.logger.error(f"NMEA recorder failed closing {self.path}: {e}")
+
+def list_segments(directory):
+    """Segment files in directory, oldest first"""
+    suffixes = tuple(COMPRESSIONS.values())
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(suffixes))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in names]
+
+def read_index(path):
+    try:
+        with open(path + INDEX_SUFFIX, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    n = len(data) // INDEX_ENTRY.size
+    return [INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size) for i in range(n)]
+
+def _decompress_chunk(path, data):
+    """Decompress as much of a chunk as there is, a chunk still being written has no end marker"""
+    if path.endswith(COMPRESSIONS[LZMA]):
+        decompressor = lzma.LZMADecompressor()
+    else:
+        decompressor = zlib.decompressobj()
+    try:
+        return decompressor.decompress(data)
+    except (zlib.error, lzma.LZMAError):
+        return b""
+
+def read_segment(path, start=None, end=None):
+    """Yield the (time, sentence) records of a segment between start and end (epoch seconds).
+
+    Only the header and the chunks from the last one that starts at or before start on are read, each on its
+    own from its index offset to the next one (the end of the file for the last chunk), so memory use is one
+    chunk rather than the segment.
+    """
+    index = read_index(path)
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size or HEADER.unpack(header)[0] != MAGIC:
+            raise ValueError(f"{path} is not an NMEA recording")
+        size = os.fstat(f.fileno()).st_size
+        first = 0
+        if start is not None and index:
+            first = max(0, bisect.bisect_right([ms for ms, _ in index], int(start * 1000)) - 1)
+        for i in range(first, len(index)):
+            chunk_ms, offset = index[i]
+            if end is not None and chunk_ms > end * 1000:
+                return
+            next_offset = index[i + 1][1] if i + 1 < len(index) else size
+            f.seek(offset)
+            raw = _decompress_chunk(path, f.read(next_offset - offset))
+            # the first delta of a chunk is relative to the last record before it, start from the chunk's own time
+            last_ms = chunk_ms - _first_delta(raw)
+            for t, line in decode_records(raw, last_ms):
+                if start is not None and t < start:
+                    continue
+                if end is not None and t > end:
+                    return
+                yield t, line
+
+def _first_delta(raw):
+    if not raw:
+        return 0
+    zigzag, _ = _read_varint(raw, 0)
+    return (zigzag >> 1) ^ -(zigzag & 1)
+
+def read_recordings(directory, start=None, end=None):
+    """Yield the (time, sentence) records of every segment in directory between start and end"""
+    segments = list_segments(directory)
+    for i, path in enumerate(segments):
+        index = read_index(path)
+        if start is not None and i + 1 < len(segments):
+            next_index = read_index(segments[i + 1])
+            if next_index and next_index[0][0] <= start * 1000:
+                continue
+        if end is not None and index and index[0][0] > end * 1000:
+            return
+        yield from read_segment(path, start, end)
@@ -0,0 +1,136 @@
+import socket
+import struct
+import time
+
+from stream_framer import MixedFramer
+
+# a producer whose process can't be found out (no SO_PEERCRED, or it is gone already)
+DEFAULT_NAME = "producer"
+RATE_WINDOW = 1.0
+
+def peer_process(sock):
+    """(pid, process name) at the other end of a unix socket, None for what the OS doesn't say"""
+    try:
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        pid, _, _ = struct.unpack("3i", creds)
+    except (AttributeError, OSError, struct.error):
+        return None, None
+    try:
+        with open(f"/proc/{pid}/comm") as f:
+            return pid, f.read().strip() or None
+    except OSError:
+        return pid, None
+
+class NmeaSource:
+    """One connected NMEA producer, with its own framer so producers never split each other's sentences or frames"""
+    def __init__(self, name, pid, totals, logger=None):
+        self.name = name
+        self.pid = pid
+        self.framer = MixedFramer(logger=logger)
+        self.connected_at = time.time()
+        self._connected = time.monotonic()
+        # sentences, bytes and broken binary frames by name, kept across reconnects
+        self.totals = totals
+        self.sentences = 0
+        self._crc_errors = 0
+        self.last_seen = None
+        self.rate = 0.0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def received(self, nbytes, sentences, now):
+        """Count what one read brought in"""
+        totals = self.totals
+        totals[0] += sentences
+        totals[1] += nbytes
+        self.sentences += sentences
+        crc_errors = self.framer.crc_errors
+        if crc_errors != self._crc_errors:
+            totals[2] += crc_errors - self._crc_errors
+            self._crc_errors = crc_errors
+        if sentences:
+            self.last_seen = now
+        self._window_count += sentences
+        if now - self._window_start >= RATE_WINDOW:
+            self.rate = self._window_count / (now - self._window_start)
+            self._window_start = now
+            self._window_count = 0
+
+    def lag(self, now=None):
+        """Seconds since the last sentence, since connecting if there wasn't one yet"""
+        now = now or time.monotonic()
+        return now - (self.last_seen if self.last_seen is not None else self._connected)
+
+    def current_rate(self, now=None):
+        """Sentences per second over the last window, 0 once the producer has gone quiet"""
+        now = now or time.monotonic()
+        return self.rate if now - self._window_start < 2 * RATE_WINDOW else 0.0
+
+    def stats(self, now=None):
+        return {
+            "name": self.name,
+            "pid": self.pid,
+            "connected_for": time.time() - self.connected_at,
+            "sentences": self.sentences,
+            "rate": self.current_rate(now),
+            "lag": self.lag(now),
+            "framer": self.framer.stats(),
+        }
+
+class NmeaSources:
+    """The producers connected to the NMEA socket.
+
+    Each is named after its process (from SO_PEERCRED), with #2, #3... for a
+    second connected producer of the same name, so a producer that reconnects
+    keeps its name and its metrics. The servers read all of them from one
+    thread or event loop and hand sentences on in the order their data
+    arrived, tagged with the name.
+    """
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.connected = {}
+        self.totals = {}
+        self.connects = 0
+
+    def connect(self, sock):
+        pid, process = peer_process(sock)
+        base = process or DEFAULT_NAME
+        name = base
+        n = 1
+        while name in self.connected:
+            n += 1
+            name = f"{base}#{n}"
+        source = NmeaSource(name, pid, self.totals.setdefault(name, [0, 0, 0]), logger=self.logger)
+        self.connected[name] = source
+        self.connects += 1
+        if self.logger:
+            others = f", {len(self.connected) - 1} other producer(s) connected" if len(self.connected) > 1 else ""
+            self.logger.info(f"nmea producer {name} (pid {pid}) connected{others}")
+        return source
+
+    def disconnect(self, source):
+        if self.connected.get(source.name) is source:
+            del self.connected[source.name]
+        if self.logger:
+            self.logger.info(f"nmea producer {source.name} disconnected: {source.stats()}")
+
+    def sentences(self):
+        return {name: totals[0] for name, totals in list(self.totals.items())}
+
+    def bytes(self):
+        return {name: totals[1] for name, totals in list(self.totals.items())}
+
+    def crc_errors(self):
+        return {name: totals[2] for name, totals in list(self.totals.items())}
+
+    def rates(self):
+        now = time.monotonic()
+        return {name: source.current_rate(now) for name, source in list(self.connected.items())}
+
+    def lags(self):
+        now = time.monotonic()
+        return {name: source.lag(now) for name, source in list(self.connected.items())}
+
+    def stats(self):
+        now = time.monotonic()
+        return [source.stats(now) for source in list(self.connected.values())]
@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import deque
+
+NMEA_WINDOW_SECONDS = 30
+
+class NmeaWindow:
+    """Time-windowed ring buffer of NMEA sentences.
+
+    Sentences are appended at the tail and expired from the head, so both
+    operations are amortized O(1) regardless of the window size. snapshot()
+    returns a plain list for the config store; it is built once and reused
+    until the window changes. It is safe to push from the reader thread while
+    a publisher thread takes snapshots.
+    """
+    def __init__(self, seconds=NMEA_WINDOW_SECONDS):
+        self.seconds = seconds
+        self._times = deque()
+        self._sentences = deque()
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sentences)
+
+    def push(self, sentence, t=None):
+        if t is None:
+            t = time.time()
+        with self._lock:
+            self._times.append(t)
+            self._sentences.append(sentence)
+            self._snapshot = None
+            self._evict(t)
+
+    def evict(self, now=None):
+        """Drop sentences that are older than the window"""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._evict(now)
+
+    def _evict(self, now):
+        cutoff = now - self.seconds
+        times = self._times
+        sentences = self._sentences
+        while times and times[0] <= cutoff:
+            times.popleft()
+            sentences.popleft()
+            self._snapshot = None
+
+    def snapshot(self):
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = list(self._sentences)
+            return self._snapshot
@@ -0,0 +1,59 @@
+import collections
+import sys
+import threading
+import time
+
+SAMPLE_INTERVAL = 0.01
+MAX_SECONDS = 60
+TOP = 40
+
+def _frame_name(code):
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})"
+
+class Profile:
+    """Stacks of every thread sampled at a fixed interval, counted per distinct stack"""
+    def __init__(self):
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.seconds = 0.0
+
+    def report(self, top=TOP):
+        """Functions by samples spent in them (self) and below them (total)"""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+        lines = [f"{self.samples} samples of every thread over {self.seconds:.1f}s", "",
+                 f"{'self':>8} {'total':>8}  function"]
+        for name, count in own.most_common(top):
+            lines.append(f"{count:>8} {total[name]:>8}  {name}")
+        return "\n".join(lines) + "\n"
+
+    def collapsed(self):
+        """One "thread;outer;...;inner count" line per stack, for flame graph tools"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+def sample(seconds, interval=SAMPLE_INTERVAL):
+    """Sample the stacks of all other threads for seconds, blocking the calling thread"""
+    seconds = max(0.0, min(seconds, MAX_SECONDS))
+    profile = Profile()
+    me = threading.get_ident()
+    start = time.monotonic()
+    end = start + seconds
+    while time.monotonic() < end:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            profile.stacks[tuple(reversed(stack))] += 1
+        profile.samples += 1
+        time.sleep(interval)
+    profile.seconds = time.monotonic() - start
+    return profile
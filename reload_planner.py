@@ -0,0 +1,80 @@
+# What it takes to apply a params change, from cheapest to most disruptive
+NOTHING = "nothing"
+LIVE = "live"
+CONTROL = "control"
+RESPAWN = "respawn"
+RESTART = "restart"
+
+ACTIONS = (NOTHING, LIVE, CONTROL, RESPAWN, RESTART)
+
+# applied in place by the python side (NMEA pipeline, TCP server, config store client)
+LIVE_PARAMS = {
+    "cs_path",
+    "fix_path",
+    "log_nmea",
+    "cs_publish_hz",
+    "cs_pool_size",
+    "cs_sentences",
+    "tcp_sentences",
+    "tcp_queue_size",
+    "tcp_slow_client",
+    "tcp_max_clients",
+    "tcp_stall_timeout",
+    "nmea_checksum",
+    "watchdog_age",
+    "watchdog_respawn_after",
+    "watchdog_path",
+    "record_path",
+    "record_segment_mb",
+    "record_segment_minutes",
+    "record_budget_mb",
+    "record_compression",
+}
+
+# only the child's initial cell, a running child is kept up to date with /CID over its control input
+CONTROL_PARAMS = {
+    "starting_mcc",
+    "starting_mnc",
+    "starting_tac",
+    "starting_cell_id",
+}
+
+# decide which unix socket / TCP servers exist at all and how they run, simplest to start over from scratch
+RESTART_PARAMS = {
+    "output",
+    "runtime",
+}
+
+# anything else ends up on the child's command line and needs a respawn
+
+def param_action(key):
+    if key in LIVE_PARAMS:
+        return LIVE
+    if key in CONTROL_PARAMS:
+        return CONTROL
+    if key in RESTART_PARAMS:
+        return RESTART
+    return RESPAWN
+
+class ReloadPlan:
+    """The difference between two sets of params and the cheapest way to apply it"""
+    def __init__(self, old, new):
+        keys = set(old) | set(new)
+        self.changes = {key: (old.get(key), new.get(key)) for key in sorted(keys) if old.get(key) != new.get(key)}
+        self.actions = {key: param_action(key) for key in self.changes}
+        self.action = max(self.actions.values(), key=ACTIONS.index, default=NOTHING)
+
+    @property
+    def live(self):
+        """Changed params the python side has to apply, whatever happens to the child"""
+        return [key for key, action in self.actions.items() if action == LIVE]
+
+    def __bool__(self):
+        return bool(self.changes)
+
+    def __str__(self):
+        changes = ", ".join(f"{key}: {old!r} -> {new!r} ({self.actions[key]})" for key, (old, new) in self.changes.items())
+        return f"{self.action}: {changes}" if changes else NOTHING
+
+def plan_reload(old, new):
+    return ReloadPlan(old, new)
@@ -0,0 +1,221 @@
+import array
+import itertools
+import re
+import struct
+
+from nmea_framer import NmeaFramer, DEFAULT_BUFFER_SIZE
+
+UBX = "UBX"
+RTCM = "RTCM"
+
+RTCM_PREAMBLE = 0xD3
+# where a binary frame may start: a UBX sync pair or an RTCM3 preamble
+SYNC = re.compile(rb"\xb5\x62|\xd3")
+# where to pick up again after a broken frame: the next sentence or frame
+RESYNC = re.compile(rb"\xb5\x62|\xd3|\$")
+
+CRC24Q_POLY = 0x1864CFB
+_crc24q_table8 = None
+_crc24q_table16 = None
+
+def _crc24q_tables():
+    global _crc24q_table8, _crc24q_table16
+    if _crc24q_table16 is None:
+        table8 = array.array("I", bytes(4 * 256))
+        for i in range(256):
+            crc = i << 16
+            for _ in range(8):
+                crc <<= 1
+                if crc & 0x1000000:
+                    crc ^= CRC24Q_POLY
+            table8[i] = crc
+        # two bytes at a time: the first byte's remainder shifted past the second byte, folded in again
+        table16 = array.array("I", bytes(4 * 65536))
+        for hi in range(256):
+            high = table8[hi]
+            shifted = (high << 8) & 0xFFFFFF
+            top = high >> 16
+            for lo in range(256):
+                table16[hi << 8 | lo] = shifted ^ table8[top ^ lo]
+        _crc24q_table8, _crc24q_table16 = table8, table16
+    return _crc24q_table8, _crc24q_table16
+
+def crc24q(data):
+    """CRC-24Q of an RTCM3 frame (preamble to end of payload).
+
+    Still an interpreted loop, but of one 64K table lookup per two bytes rather than eight shifts per byte:
+    about 6us for a 25 byte frame, 40us for 200 bytes and 125us for 700 bytes (5-6 MB/s) on one core.
+    """
+    table8, table16 = _crc24q_tables()
+    crc = 0
+    n = len(data) & ~1
+    for (word,) in struct.iter_unpack(">H", data[:n]):
+        crc = ((crc << 16) & 0xFFFFFF) ^ table16[(crc >> 8) ^ word]
+    if n < len(data):
+        crc = ((crc << 8) & 0xFFFFFF) ^ table8[(crc >> 16) ^ data[n]]
+    return crc
+
+def ubx_checksum(data):
+    """8-bit Fletcher checksum of a UBX frame's class, id, length and payload, as the two bytes that follow them"""
+    ck_a = sum(data) & 0xFF
+    ck_b = sum(itertools.accumulate(data)) & 0xFF
+    return bytes((ck_a, ck_b))
+
+class MixedFramer(NmeaFramer):
+    """NmeaFramer for a stream that mixes NMEA sentences with UBX and RTCM3 frames.
+
+    As long as no UBX sync pair or RTCM3 preamble is buffered, which is always
+    the case for plain NMEA, it frames exactly like NmeaFramer. Otherwise the
+    buffer is walked frame by frame: a binary frame is only taken once its
+    checksum (UBX) or CRC-24Q (RTCM3) matches, on a mismatch framing picks up
+    again at the next '$' or sync after the false sync byte. Text that runs
+    into a sync byte before its CRLF is dropped. UBX checksums are summed in
+    C by sum() and accumulate(), the RTCM3 CRC is a Python loop of one table
+    lookup per two bytes, which caps mixed streams at a few MB/s, see crc24q().
+
+    frames() still returns the NMEA sentences, binary frames are collected as
+    (message ID, bytes) for take_binary(): UBX frames as UBX<class><id> in hex
+    (UBX0107 for NAV-PVT), RTCM3 frames as RTCM<message number> (RTCM1077).
+    The order within each kind is kept, the order between NMEA and binary
+    frames of the same read is not.
+    """
+    def __init__(self, size=DEFAULT_BUFFER_SIZE, logger=None):
+        super().__init__(size, logger)
+        self._binary = []
+        # skipping what's left of a broken frame, maybe into the next read
+        self._resyncing = False
+        # the walk ended on a frame boundary, rather than in the remains of a broken frame
+        self._clean = True
+        self.ubx_frames = 0
+        self.rtcm_frames = 0
+        self.crc_errors = 0
+        self.skipped = 0
+
+    def take_binary(self):
+        """The binary frames framed since the last call, as (message ID, bytes)"""
+        binary = self._binary
+        if binary:
+            self._binary = []
+        return binary
+
+    def frames(self):
+        buf = self._buf
+        start = self._start
+        end = self._end
+        if self._clean and buf.find(b"\xb5", start, end) < 0 and buf.find(b"\xd3", start, end) < 0:
+            return super().frames()
+        out = []
+        pos = self._walk(start, end, out)
+        self.sentences += len(out)
+        if pos == end:
+            pos = end = 0
+        self._start = pos
+        self._end = end
+        self._scan = pos
+        return out
+
+    def _walk(self, pos, end, out):
+        """Frame everything complete in [pos, end), returns where the first incomplete frame starts"""
+        buf = self._buf
+        view = self._view
+        size = len(buf)
+        binary = self._binary
+        clean = self._clean
+        if self._resyncing:
+            pos = self._resync(pos, end)
+        while pos < end:
+            b = buf[pos]
+            if b == 0xB5:
+                if end - pos < 6:
+                    # can't tell yet whether that's a UBX header
+                    if end - pos < 2 or buf[pos + 1] == 0x62:
+                        break
+                elif buf[pos + 1] == 0x62:
+                    total = (buf[pos + 4] | buf[pos + 5] << 8) + 8
+                    if total <= size:
+                        if end - pos < total:
+                            break
+                        if ubx_checksum(view[pos + 2:pos + total - 2]) == view[pos + total - 2:pos + total]:
+                            binary.append((f"{UBX}{buf[pos + 2]:02X}{buf[pos + 3]:02X}", bytes(view[pos:pos + total])))
+                            self.ubx_frames += 1
+                            pos += total
+                            clean = True
+                            continue
+                        self.crc_errors += 1
+                    # not a UBX frame after all
+                    self.skipped += 1
+                    pos = self._resync(pos + 1, end)
+                    clean = False
+                    continue
+            elif b == RTCM_PREAMBLE:
+                if end - pos < 3:
+                    break
+                if not buf[pos + 1] & 0xFC:
+                    length = (buf[pos + 1] & 0x03) << 8 | buf[pos + 2]
+                    total = length + 6
+                    if end - pos < total:
+                        break
+                    if crc24q(view[pos:pos + total - 3]) == int.from_bytes(view[pos + total - 3:pos + total], "big"):
+                        number = buf[pos + 3] << 4 | buf[pos + 4] >> 4 if length >= 2 else 0
+                        binary.append((f"{RTCM}{number}", bytes(view[pos:pos + total])))
+                        self.rtcm_frames += 1
+                        pos += total
+                        clean = True
+                        continue
+                    self.crc_errors += 1
+                self.skipped += 1
+                pos = self._resync(pos + 1, end)
+                clean = False
+                continue
+            # text, up to its CRLF unless the next frame starts first
+            sync = SYNC.search(buf, pos + 1, end)
+            stop = sync.start() if sync else end
+            i = buf.find(b"\r\n", pos, stop)
+            if i < 0:
+                if sync is None:
+                    # a partial sentence, or a lone 0xB5 at the end that may turn out to be a UBX sync
+                    break
+                self.skipped += stop - pos
+                pos = stop
+                clean = False
+                continue
+            # a $ in the remains of a broken frame isn't a sentence start, the last one before the CRLF is
+            dollar = buf.rfind(b"$", pos + 1, i)
+            if dollar > pos:
+                self.skipped += dollar - pos
+                pos = dollar
+            if i > pos:
+                try:
+                    out.append(str(view[pos:i], "ascii"))
+                except UnicodeDecodeError:
+                    self.decode_errors += 1
+                    if self.logger:
+                        self.logger.error(f"dropping non-ascii sentence {bytes(view[pos:i])}")
+            pos = i + 2
+            clean = True
+        self._clean = clean
+        return pos
+
+    def _resync(self, pos, end):
+        """Skip to the next '$' or sync after a broken frame, rather than taking its bytes for a sentence"""
+        found = RESYNC.search(self._buf, pos, end)
+        if found:
+            resume = found.start()
+        elif pos < end and self._buf[end - 1] == 0xB5:
+            # may be the start of a UBX sync, look at it again with the next read
+            resume = end - 1
+        else:
+            resume = end
+        self._resyncing = found is None
+        self.skipped += resume - pos
+        return resume
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({
+            "ubx_frames": self.ubx_frames,
+            "rtcm_frames": self.rtcm_frames,
+            "crc_errors": self.crc_errors,
+            "skipped": self.skipped,
+        })
+        return stats
@@ -0,0 +1,450 @@
+import collections
+import os
+import selectors
+import socket
+import threading
+import time
+
+from nmea_filter import Subscription
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_MAX_CLIENTS = 64
+DEFAULT_STALL_TIMEOUT = 60
+MAX_SEND_SIZE = 64 * 1024
+LISTEN_BACKLOG = 128
+MAX_COMMAND_SIZE = 1024
+SWEEP_INTERVAL = 1.0
+STATS_INTERVAL = 60
+
+# TCP keepalive so peers that vanish without a FIN (power loss, roaming) are reaped
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+DROP_OLDEST = "drop-oldest"
+DISCONNECT = "disconnect"
+SLOW_CLIENT_POLICIES = (DROP_OLDEST, DISCONNECT)
+
+class TcpClient:
+    """A TCP consumer of the NMEA stream and its bounded outbound queue"""
+    def __init__(self, sock, addr, subscription):
+        self.sock = sock
+        self.addr = addr
+        self.subscription = subscription
+        self.commands = b""
+        self.queue = collections.deque()
+        self.pending = b""
+        self.events = selectors.EVENT_READ
+        self.overflowed = False
+        self.closed = False
+        self.connected_at = time.time()
+        self.last_progress = time.monotonic()
+        self.bytes_sent = 0
+        self.messages_sent = 0
+        self.dropped = 0
+
+    def lag(self, now=None):
+        """Seconds the oldest queued message has been waiting"""
+        try:
+            queued_at = self.queue[0][0]
+        except IndexError:
+            return 0.0
+        return (now or time.monotonic()) - queued_at
+
+    def stats(self, now=None):
+        return {
+            "addr": f"{self.addr[0]}:{self.addr[1]}" if isinstance(self.addr, tuple) else str(self.addr),
+            "sentences": self.subscription.spec,
+            "connected_for": time.time() - self.connected_at,
+            "bytes_sent": self.bytes_sent,
+            "messages_sent": self.messages_sent,
+            "dropped": self.dropped,
+            "queued": len(self.queue),
+            "lag": self.lag(now),
+        }
+
+def set_keepalive(sock):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE),
+                          ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+                          ("TCP_KEEPCNT", KEEPALIVE_COUNT)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+class BroadcasterBase:
+    """Clients, subscriptions and the slow client policy, shared by the threaded and asyncio broadcasters.
+
+    Subclasses own the sockets. They keep the client list up to date with
+    _set_clients(), pass whatever a client sends to _commands(), call _sweep()
+    about once a second and implement _wake(), which is called when there is
+    something to send or a new default subscription, and _close().
+    """
+    def __init__(self, queue_size, policy, logger, max_clients, stall_timeout, subscription):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"unknown slow client policy: {policy}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.logger = logger
+        self.max_clients = max_clients
+        self.stall_timeout = stall_timeout
+        self._new_default = None
+        self.subscription = subscription or Subscription()
+        self._subscriptions = {self.subscription.spec: self.subscription}
+        self._clients = ()
+        self._groups = ()
+        self.accepted = 0
+        self.refused = 0
+        self.disconnected = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+
+    @property
+    def clients(self):
+        return self._clients
+
+    def configure(self, queue_size=None, policy=None, max_clients=None, stall_timeout=None, subscription=None):
+        """Change settings on the fly, clients that never subscribed follow a new default subscription"""
+        if policy is not None:
+            if policy not in SLOW_CLIENT_POLICIES:
+                raise ValueError(f"unknown slow client policy: {policy}")
+            self.policy = policy
+        if queue_size is not None:
+            self.queue_size = queue_size
+        if max_clients is not None:
+            self.max_clients = max_clients
+        if stall_timeout is not None:
+            self.stall_timeout = stall_timeout
+        if subscription is not None and subscription.spec != self.subscription.spec:
+            self._new_default = subscription
+            self._wake()
+
+    def broadcast(self, data, sid=None):
+        """Queue data for every client subscribed to sentence ID sid (all clients if sid is None)"""
+        now = time.monotonic()
+        for subscription, clients in self._groups:
+            if sid is not None and not subscription.everything and not subscription.accepts(sid):
+                continue
+            for client in clients:
+                self._enqueue(client, now, data)
+        if self._groups:
+            self._wake()
+
+    def broadcast_binary(self, data, sid):
+        """Queue a UBX or RTCM frame for the clients that subscribed to it, * doesn't cover binary frames"""
+        now = time.monotonic()
+        queued = False
+        for subscription, clients in self._groups:
+            if not subscription.binary or not subscription.accepts(sid):
+                continue
+            for client in clients:
+                self._enqueue(client, now, data)
+            queued = True
+        if queued:
+            self._wake()
+
+    def _enqueue(self, client, now, data):
+        queue = client.queue
+        if len(queue) >= self.queue_size:
+            if self.policy == DISCONNECT:
+                client.overflowed = True
+                return
+            try:
+                queue.popleft()
+            except IndexError:
+                pass
+            else:
+                client.dropped += 1
+                self.dropped += 1
+        elif not queue and not client.pending:
+            # the stall timer starts when the client has something to send again
+            client.last_progress = now
+        queue.append((now, data))
+
+    def stats(self):
+        now = time.monotonic()
+        return [client.stats(now) for client in self._clients]
+
+    def _wake(self):
+        raise NotImplementedError
+
+    def _close(self, client, reason):
+        raise NotImplementedError
+
+    def _apply_default(self):
+        """Move the clients that follow the default subscription over to a new one from configure()"""
+        if self._new_default is not None:
+            old, self.subscription = self.subscription, self._new_default
+            self._new_default = None
+            self.subscription = self._subscriptions.setdefault(self.subscription.spec, self.subscription)
+            for client in self._clients:
+                if client.subscription is old:
+                    client.subscription = self.subscription
+            self._set_clients(self._clients)
+
+    def _sweep(self, now):
+        for client in self._clients:
+            if client.overflowed:
+                self._close(client, "too slow, queue overflowed")
+            elif self.stall_timeout and (client.pending or client.queue) and now - client.last_progress > self.stall_timeout:
+                self._close(client, f"stalled for {now - client.last_progress:.0f}s")
+
+    def _set_clients(self, clients):
+        groups = {}
+        for client in clients:
+            groups.setdefault(client.subscription, []).append(client)
+        self._clients = clients
+        self._groups = tuple((subscription, tuple(members)) for subscription, members in groups.items())
+
+    def subscribe(self, client, spec):
+        subscription = Subscription(spec)
+        # clients with the same spec share a Subscription so they are filtered together
+        subscription = self._subscriptions.setdefault(subscription.spec, subscription)
+        client.subscription = subscription
+        self._set_clients(self._clients)
+        if self.logger:
+            self.logger.info(f"TCP client {client.addr} subscribed to {subscription.spec}")
+
+    def _commands(self, client, data):
+        """Act on the command lines a client sent"""
+        lines = (client.commands + data).split(b"\n")
+        client.commands = lines.pop()[:MAX_COMMAND_SIZE]
+        for line in lines:
+            command, _, argument = line.strip().decode("ascii", "replace").partition(" ")
+            if command.upper() == "SUBSCRIBE":
+                try:
+                    self.subscribe(client, argument)
+                except ValueError as e:
+                    if self.logger:
+                        self.logger.warning(f"TCP client {client.addr} bad subscription: {e}")
+
+class NmeaBroadcaster(BroadcasterBase):
+    """Serves the NMEA stream to TCP clients without ever blocking the caller.
+
+    A single thread owns the listening socket(s) and every client socket and
+    multiplexes them with a selector. broadcast() only appends to each
+    client's bounded queue and wakes that thread, which writes with
+    non-blocking sends and only asks for write readiness while a client has
+    something queued. When a client's queue is full it either loses its
+    oldest message (drop-oldest) or is disconnected (disconnect). Clients that
+    make no progress for stall_timeout seconds are dropped, dead peers are
+    reaped by TCP keepalive, and connections beyond max_clients are refused.
+
+    Clients start out with the default subscription and can pick the sentence
+    types they want by sending a line such as "SUBSCRIBE GGA,RMC/5". Clients
+    are grouped by subscription, so each sentence is filtered once per group.
+    """
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, policy=DROP_OLDEST, logger=None,
+                 max_clients=DEFAULT_MAX_CLIENTS, stall_timeout=DEFAULT_STALL_TIMEOUT, subscription=None):
+        super().__init__(queue_size, policy, logger, max_clients, stall_timeout, subscription)
+        self.selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._wake_pending = False
+        self._new = collections.deque()
+        self._new_listeners = collections.deque()
+        self._listeners = []
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self.selector.register(self._wake_r, selectors.EVENT_READ)
+            self._thread = threading.Thread(target=self._run, name="nmea-broadcaster")
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def listen(self, port, host="0.0.0.0"):
+        """Accept TCP clients on host:port, the socket is bound before this returns"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, port))
+            sock.listen(LISTEN_BACKLOG)
+            sock.setblocking(False)
+        except Exception:
+            sock.close()
+            raise
+        self._new_listeners.append(sock)
+        self._wake()
+        if self.logger:
+            self.logger.info(f"TCP server listening on port {sock.getsockname()[1]}")
+        return sock.getsockname()[1]
+
+    def listen_unix(self, path):
+        """Accept local clients on a unix socket at path, replacing a stale socket file"""
+        if os.path.exists(path):
+            os.unlink(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(path)
+            sock.listen(LISTEN_BACKLOG)
+            sock.setblocking(False)
+        except Exception:
+            sock.close()
+            raise
+        self._new_listeners.append(sock)
+        self._wake()
+        if self.logger:
+            self.logger.info(f"NMEA server listening on {path}")
+        return path
+
+    def add_client(self, sock, addr):
+        """Hand a connected socket over to the broadcaster thread"""
+        sock.setblocking(False)
+        self._new.append(TcpClient(sock, addr, self.subscription))
+        self._wake()
+
+    def _wake(self):
+        if not self._wake_pending:
+            self._wake_pending = True
+            try:
+                self._wake_w.send(b"\0")
+            except BlockingIOError:
+                pass
+
+    def _run(self):
+        last_stats = last_sweep = time.monotonic()
+        while True:
+            events = self.selector.select(SWEEP_INTERVAL)
+            now = time.monotonic()
+            if now - last_sweep >= SWEEP_INTERVAL:
+                last_sweep = now
+                self._sweep(now)
+            if self.logger and self._clients and now - last_stats >= STATS_INTERVAL:
+                last_stats = now
+                self.logger.info(f"TCP client stats: {self.stats()}")
+            for key, mask in events:
+                try:
+                    self._handle(key, mask)
+                except Exception as e:
+                    if self.logger:
+                        self.logger.exception(f"TCP server error: {e}")
+
+    def _handle(self, key, mask):
+        if key.data is self._listeners:
+            self._accept(key.fileobj)
+            return
+        if key.fileobj is self._wake_r:
+            # clear the flag before looking at the queues so no wakeup is lost
+            self._wake_pending = False
+            try:
+                while self._wake_r.recv(4096):
+                    pass
+            except BlockingIOError:
+                pass
+            self._register_new()
+            for client in self._clients:
+                self._flush(client)
+            return
+        client = key.data
+        if mask & selectors.EVENT_READ:
+            self._read(client)
+        if mask & selectors.EVENT_WRITE and not client.closed:
+            self._flush(client)
+
+    def _register_new(self):
+        self._apply_default()
+        while self._new_listeners:
+            sock = self._new_listeners.popleft()
+            self._listeners.append(sock)
+            self.selector.register(sock, selectors.EVENT_READ, self._listeners)
+        while self._new:
+            client = self._new.popleft()
+            self.selector.register(client.sock, client.events, client)
+            self._set_clients(self._clients + (client,))
+
+    def _accept(self, listener):
+        while True:
+            try:
+                sock, addr = listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if self.logger:
+                    self.logger.error(f"TCP accept failed: {e}")
+                return
+            if len(self._clients) >= self.max_clients:
+                self.refused += 1
+                sock.close()
+                if self.logger:
+                    self.logger.warning(f"TCP client {addr} refused, already serving {len(self._clients)} clients")
+                continue
+            self.accepted += 1
+            if sock.family != socket.AF_UNIX:
+                try:
+                    set_keepalive(sock)
+                except OSError:
+                    pass
+            if self.logger:
+                self.logger.info(f"TCP client connected from {addr}")
+            sock.setblocking(False)
+            client = TcpClient(sock, addr, self.subscription)
+            self.selector.register(sock, client.events, client)
+            self._set_clients(self._clients + (client,))
+
+    def _read(self, client):
+        # the only thing clients send are commands, mainly notice when they go away
+        try:
+            data = client.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._close(client, "disconnected")
+            return
+        self._commands(client, data)
+
+    def _flush(self, client):
+        if client.overflowed:
+            self._close(client, "too slow, queue overflowed")
+            return
+        queue = client.queue
+        while client.pending or queue:
+            if not client.pending:
+                # coalesce queued messages into one send
+                parts = []
+                size = 0
+                while queue and size < MAX_SEND_SIZE:
+                    try:
+                        _, data = queue.popleft()
+                    except IndexError:
+                        break
+                    parts.append(data)
+                    size += len(data)
+                client.messages_sent += len(parts)
+                client.pending = memoryview(b"".join(parts))
+            try:
+                n = client.sock.send(client.pending)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                self._close(client, f"send failed: {e}")
+                return
+            client.bytes_sent += n
+            self.bytes_sent += n
+            client.pending = client.pending[n:]
+            client.last_progress = time.monotonic()
+        events = selectors.EVENT_READ
+        if client.pending or queue:
+            events |= selectors.EVENT_WRITE
+        else:
+            client.last_progress = time.monotonic()
+        if events != client.events:
+            client.events = events
+            self.selector.modify(client.sock, events, client)
+
+    def _close(self, client, reason):
+        if client.closed:
+            return
+        client.closed = True
+        self._set_clients(tuple(c for c in self._clients if c is not client))
+        self.disconnected += 1
+        try:
+            self.selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+        if self.logger:
+            self.logger.info(f"TCP client {client.addr} {reason}: {client.stats()}")
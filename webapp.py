@@ -1,16 +1,38 @@
 import os
 import json
+import socket
+import asyncio
 import tornado.web
 import tornado.template
+import tornado.queues
+import tornado.iostream
+import tornado.util
+import tornado.gen
 from tornado.ioloop import IOLoop
 
 from csclient import CSClient
 from logger_config import logger, LOG_PATH
+from log_tailer import LogTailer
+from nmea_framer import NmeaFramer
+from nmea_filter import Subscription, sentence_id, ALL
+from nmea_ipc import NMEA_IPC_PATH, parse_fix_message
+from metrics import Registry
+from debug_server import DEBUG_SOCKET_PATH
+import profiler
 
 LPP_VERSION = os.environ.get('LPP_VERSION', 'v0.0.0')
 LPP_CLIENT_CONTAINER_VERSION = os.environ.get('LPP_CLIENT_CONTAINER_VERSION', 'v0.0.0')
 
+HEARTBEAT_INTERVAL = 15
+# batches of log lines a slow browser can fall behind by before it misses some
+LOG_CLIENT_QUEUE_SIZE = 100
+# NMEA messages a slow browser can fall behind by before it misses some
+NMEA_CLIENT_QUEUE_SIZE = 500
+NMEA_RECONNECT_MAX = 10
+DEBUG_REQUEST_TIMEOUT = 5
+
 cs = CSClient("lpp-client", logger=logger)
+metrics = Registry("lpp_webapp_")
 
 def get_appdata(key):
     env_key = key.upper().replace('.', '_').replace('-', '_')
@@ -66,40 +88,251 @@ class MainHandler(tornado.web.RequestHandler):
         return self.render('config_form.tpl', config=config, lpp_version=LPP_VERSION, lpp_client_container_version=LPP_CLIENT_CONTAINER_VERSION)
 
 class LogsHandler(tornado.web.RequestHandler):
+    def initialize(self, tailer):
+        self.tailer = tailer
+
     def set_default_headers(self):
         self.set_header("Content-Type", "text/event-stream")
         self.set_header("Cache-Control", "no-cache")
         self.set_header("Connection", "keep-alive")
-    
+
+    def write_lines(self, lines):
+        self.write("".join(f"id: {line_id}\ndata: {line}\n\n" for line_id, line in lines))
+
     async def get(self):
         # Send an initial heartbeat
         self.write("event: heartbeat\ndata: ping\n\n")
         await self.flush()
-        
-        last_pos = 0
-        heartbeat_counter = 0
-        
+
+        last_id = self.request.headers.get("Last-Event-ID")
+        last_id = int(last_id) if last_id and last_id.isdigit() else None
+        batches = tornado.queues.Queue(maxsize=LOG_CLIENT_QUEUE_SIZE)
+        loop = IOLoop.current()
+
+        def put(lines):
+            try:
+                batches.put_nowait(lines)
+            except tornado.queues.QueueFull:
+                pass
+
+        def on_lines(lines):
+            # called from the tailer thread
+            loop.add_callback(put, lines)
+
+        backlog = self.tailer.subscribe(on_lines, last_id)
         try:
-            with open(LOG_PATH, "r") as log_file:
+            self.write_lines(backlog)
+            await self.flush()
+            while True:
+                try:
+                    lines = await batches.get(timeout=loop.time() + HEARTBEAT_INTERVAL)
+                    self.write_lines(lines)
+                except tornado.util.TimeoutError:
+                    self.write("event: heartbeat\ndata: ping\n\n")
+                await self.flush()
+        except tornado.iostream.StreamClosedError:
+            pass
+        finally:
+            self.tailer.unsubscribe(on_lines)
+
+class NmeaFeed:
+    """One connection to main.py's NMEA IPC socket, shared by every browser watching the stream.
+
+    Browsers subscribe with a sentence spec like "GGA,RMC/5". Browsers with the
+    same spec share a Subscription, so each sentence is filtered once per spec
+    here and the ingestion side only ever serves this one connection.
+    """
+    def __init__(self, path=NMEA_IPC_PATH):
+        self.path = path
+        self.fix = None
+        self.connected = False
+        self._groups = {}
+
+    def start(self):
+        IOLoop.current().spawn_callback(self._run)
+        return self
+
+    def subscribe(self, spec, callback, fix=False):
+        """Call callback(event, data) with "nmea" sentences matching spec, and "fix" records if fix is set"""
+        subscription = Subscription(spec)
+        subscription, callbacks = self._groups.setdefault(subscription.spec, (subscription, {}))
+        callbacks[callback] = fix
+        return subscription
+
+    def subscribers(self):
+        return sum(len(callbacks) for _, callbacks in self._groups.values())
+
+    def unsubscribe(self, spec, callback):
+        group = self._groups.get(Subscription(spec).spec)
+        if group:
+            group[1].pop(callback, None)
+            if not group[1]:
+                self._groups.pop(group[0].spec, None)
+
+    def _dispatch(self, line):
+        fix = parse_fix_message(line)
+        if fix is not None:
+            self.fix = fix
+            for _, callbacks in self._groups.values():
+                for callback, wants_fix in callbacks.items():
+                    if wants_fix:
+                        callback("fix", fix)
+            return
+        sid = sentence_id(line)
+        for subscription, callbacks in self._groups.values():
+            if subscription.everything or subscription.accepts(sid):
+                for callback in callbacks:
+                    callback("nmea", line)
+
+    async def _run(self):
+        delay = 1
+        while True:
+            stream = tornado.iostream.IOStream(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM))
+            try:
+                await stream.connect(self.path)
+                self.connected = True
+                delay = 1
+                logger.info(f"connected to NMEA feed {self.path}")
+                framer = NmeaFramer()
                 while True:
-                    log_file.seek(last_pos)
-                    new_content = log_file.read()
-                    if new_content:
-                        for line in new_content.splitlines():
-                            if line.strip():
-                                self.write(f"data: {line}\n\n")
-                        last_pos = log_file.tell()
-                    
-                    heartbeat_counter += 1
-                    if heartbeat_counter >= 30:
-                        self.write("event: heartbeat\ndata: ping\n\n")
-                        heartbeat_counter = 0
-                    
-                    await self.flush()
-                    await tornado.gen.sleep(0.5)
-        except Exception as e:
-            self.write(f"data: Error: {str(e)}\n\n")
+                    data = await stream.read_bytes(65536, partial=True)
+                    for line in framer.feed(data):
+                        self._dispatch(line)
+            except (tornado.iostream.StreamClosedError, OSError):
+                pass
+            finally:
+                stream.close()
+                if self.connected:
+                    logger.info(f"lost NMEA feed {self.path}")
+                self.connected = False
+            await tornado.gen.sleep(delay)
+            delay = min(delay * 2, NMEA_RECONNECT_MAX)
+
+class NmeaHandler(tornado.web.RequestHandler):
+    """Server-sent events with the live NMEA stream, /nmea?sentences=GGA,RMC/5&fix=1"""
+    def initialize(self, feed):
+        self.feed = feed
+
+    def set_default_headers(self):
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("Connection", "keep-alive")
+
+    async def get(self):
+        spec = self.get_query_argument("sentences", ALL)
+        fix = self.get_query_argument("fix", "").lower() in ("1", "true", "yes")
+        try:
+            Subscription(spec)
+        except ValueError as e:
+            self.set_status(400)
+            self.set_header("Content-Type", "text/plain")
+            self.write(str(e))
+            return
+
+        messages = tornado.queues.Queue(maxsize=NMEA_CLIENT_QUEUE_SIZE)
+
+        def on_message(event, data):
+            try:
+                messages.put_nowait((event, data))
+            except tornado.queues.QueueFull:
+                pass
+
+        self.feed.subscribe(spec, on_message, fix)
+        try:
+            self.write("event: heartbeat\ndata: ping\n\n")
+            if fix and self.feed.fix is not None:
+                self.write(f"event: fix\ndata: {json.dumps(self.feed.fix)}\n\n")
             await self.flush()
+            while True:
+                try:
+                    event, data = await messages.get(timeout=IOLoop.current().time() + HEARTBEAT_INTERVAL)
+                except tornado.util.TimeoutError:
+                    self.write("event: heartbeat\ndata: ping\n\n")
+                else:
+                    # send everything that queued up meanwhile in one go
+                    while True:
+                        self.write(f"data: {data}\n\n" if event == "nmea" else f"event: fix\ndata: {json.dumps(data)}\n\n")
+                        try:
+                            event, data = messages.get_nowait()
+                        except tornado.queues.QueueEmpty:
+                            break
+                await self.flush()
+        except tornado.iostream.StreamClosedError:
+            pass
+        finally:
+            self.feed.unsubscribe(spec, on_message)
+
+class FixHandler(tornado.web.RequestHandler):
+    """The latest fix record as JSON"""
+    def initialize(self, feed):
+        self.feed = feed
+
+    def get(self):
+        self.set_header("Cache-Control", "no-cache")
+        if self.feed.fix is None:
+            self.set_status(503)
+            self.write({"error": "no fix yet" if self.feed.connected else "NMEA feed not connected"})
+            return
+        self.write(self.feed.fix)
+
+async def debug_request(request, timeout=DEBUG_REQUEST_TIMEOUT):
+    """Send a request to main.py's debug socket and return its answer.
+
+    The timeout covers the connect and the write too, so a wedged main.py raises asyncio.TimeoutError
+    instead of holding the request handler.
+    """
+    stream = tornado.iostream.IOStream(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM))
+
+    async def exchange():
+        await stream.connect(DEBUG_SOCKET_PATH)
+        await stream.write(f"{request}\n".encode())
+        return await stream.read_until_close()
+
+    try:
+        data = await asyncio.wait_for(exchange(), timeout)
+        return data.decode()
+    finally:
+        stream.close()
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Prometheus text metrics of the webapp and of main.py"""
+    async def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        try:
+            client = await debug_request("metrics")
+            up = 1
+        except (tornado.iostream.StreamClosedError, OSError, asyncio.TimeoutError):
+            client = ""
+            up = 0
+        self.write(metrics.render())
+        self.write(f"# HELP lpp_webapp_client_up Whether main.py answered the metrics request\n"
+                   f"# TYPE lpp_webapp_client_up gauge\nlpp_webapp_client_up {up}\n")
+        self.write(client)
+
+class ProfileHandler(tornado.web.RequestHandler):
+    """Sample the stacks of main.py (or target=webapp) for a while, /debug/profile?seconds=10&format=collapsed"""
+    async def get(self):
+        self.set_header("Content-Type", "text/plain; charset=utf-8")
+        try:
+            seconds = min(float(self.get_query_argument("seconds", "10")), profiler.MAX_SECONDS)
+        except ValueError:
+            self.set_status(400)
+            self.write("seconds must be a number")
+            return
+        collapsed = self.get_query_argument("format", "") == "collapsed"
+        if self.get_query_argument("target", "client") == "webapp":
+            profile = await IOLoop.current().run_in_executor(None, profiler.sample, seconds)
+            self.write(profile.collapsed() if collapsed else profile.report())
+            return
+        try:
+            self.write(await debug_request(f"profile {seconds}" + (" collapsed" if collapsed else ""),
+                                           seconds + DEBUG_REQUEST_TIMEOUT))
+        except asyncio.TimeoutError:
+            self.set_status(504)
+            self.write("main.py did not answer in time")
+        except (tornado.iostream.StreamClosedError, OSError) as e:
+            self.set_status(503)
+            self.write(f"main.py did not answer: {e!r}")
 
 class SendLogHandler(tornado.web.RequestHandler):
     async def post(self):
@@ -126,10 +359,21 @@ class UpdateConfigHandler(tornado.web.RequestHandler):
         self.set_header('Location', '/')
         self.write("Redirecting...")
 
-def make_app():
+def make_app(tailer=None, feed=None):
+    tailer = tailer or LogTailer(LOG_PATH, logger=logger).start()
+    feed = feed or NmeaFeed().start()
+    metrics.gauge("log_subscribers", "Browsers following the logs", func=lambda: tailer.stats()["subscribers"])
+    metrics.counter("log_lines_total", "Log lines read by the log tailer", func=lambda: tailer.next_id - 1)
+    metrics.counter("log_rotations_total", "Log rotations followed", func=lambda: tailer.rotations)
+    metrics.gauge("nmea_subscribers", "Browsers watching the NMEA stream", func=feed.subscribers)
+    metrics.gauge("nmea_feed_connected", "Whether the NMEA feed from main.py is connected", func=lambda: int(feed.connected))
     return tornado.web.Application([
         (r"/", MainHandler),
-        (r"/logs", LogsHandler),
+        (r"/logs", LogsHandler, dict(tailer=tailer)),
+        (r"/nmea", NmeaHandler, dict(feed=feed)),
+        (r"/fix", FixHandler, dict(feed=feed)),
+        (r"/metrics", MetricsHandler),
+        (r"/debug/profile", ProfileHandler),
         (r"/send_log", SendLogHandler),
         (r"/update", UpdateConfigHandler)
     ], template_path=os.path.join(os.path.dirname(__file__), "views"))